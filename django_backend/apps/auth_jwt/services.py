@@ -0,0 +1,127 @@
+import time
+from typing import (
+	Any,
+	Dict,
+	Optional,
+)
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpRequest
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import (
+	AuthenticationFailed,
+	ValidationError,
+)
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (
+	InvalidToken,
+	TokenError,
+)
+from rest_framework_simplejwt.serializers import (
+	TokenObtainPairSerializer,
+	TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import (
+	AccessToken,
+	RefreshToken,
+)
+from apps.users.models import User
+from apps.users.serializers import UserSerializer
+
+# Same serializers as RegisterView and TokenObtainPairView, called in-process by the HTML views
+
+# Raises ValidationError
+def register_user(data: Dict[str, Any]) -> User:
+	serializer = UserSerializer(data=data)
+	serializer.is_valid(raise_exception=True)
+	return serializer.save()
+
+# Returns {'access': ..., 'refresh': ...}, raises AuthenticationFailed or ValidationError
+def obtain_token_pair(request: HttpRequest, data: Dict[str, Any]) -> Dict[str, str]:
+	serializer = TokenObtainPairSerializer(data=data, context={'request': request})
+	serializer.is_valid(raise_exception=True)
+	return serializer.validated_data
+
+# HTML SESSION AUTH
+# The access token is verified locally (signature, expiry) on every page, which
+# costs microseconds. The database part (blacklist, active user) is cached per
+# access token jti in the short lived 'auth_tokens' cache, shared by every
+# worker (Redis): logout deletes the entry for all of them. Deactivating or
+# soft deleting a user doesn't, their pages keep working until the entry
+# expires (AUTH_TOKEN_CACHE_TIMEOUT, 30s by default).
+TOKEN_CACHE_ALIAS = 'auth_tokens'
+REJECTED = 0
+
+def get_token_cache_key(access: AccessToken) -> str:
+	return f'access:{access[api_settings.JTI_CLAIM]}'
+
+# User behind the access token stored in the session, None if missing, invalid
+# or revoked. An expired access token is refreshed with the session refresh token
+def get_session_user(request: HttpRequest) -> Optional[User]:
+	raw_token = request.session.get('access_token')
+	if not raw_token:
+		return None
+	try:
+		access = AccessToken(raw_token)
+	except TokenError:
+		access = refresh_session_tokens(request)
+		if access is None:
+			return None
+	user_id = get_validated_user_id(access, request.session.get('refresh_token'))
+	if user_id is None:
+		return None
+	return SimpleLazyObject(lambda: User.objects.get(pk=user_id))
+
+def get_validated_user_id(access: AccessToken, raw_refresh: Optional[str]) -> Optional[int]:
+	cache = caches[TOKEN_CACHE_ALIAS]
+	key = get_token_cache_key(access)
+	user_id = cache.get(key)
+	if user_id is None:
+		user_id = load_user_id(access, raw_refresh)
+		# Never cache past the token expiry
+		timeout = min(cache.default_timeout, max(1, int(access['exp'] - time.time())))
+		cache.set(key, user_id or REJECTED, timeout)
+	return user_id or None
+
+def load_user_id(access: AccessToken, raw_refresh: Optional[str]) -> Optional[int]:
+	# Logout blacklists the refresh token of the session, see revoke_session_tokens
+	if raw_refresh:
+		try:
+			RefreshToken(raw_refresh, verify=False).check_blacklist()
+		except TokenError:
+			return None
+	try:
+		return JWTAuthentication().get_user(access).pk
+	except (InvalidToken, AuthenticationFailed):
+		return None
+
+def refresh_session_tokens(request: HttpRequest) -> Optional[AccessToken]:
+	raw_refresh = request.session.get('refresh_token')
+	if not raw_refresh:
+		return None
+	# Same rules as POST /api/auth/refresh/ (blacklist, rotation, active user)
+	serializer = TokenRefreshSerializer(data={'refresh': raw_refresh})
+	try:
+		serializer.is_valid(raise_exception=True)
+	except (TokenError, AuthenticationFailed, ValidationError, ObjectDoesNotExist):
+		return None
+	tokens = serializer.validated_data
+	request.session['access_token'] = tokens['access']
+	if 'refresh' in tokens:
+		request.session['refresh_token'] = tokens['refresh']
+	return AccessToken(tokens['access'])
+
+def revoke_session_tokens(request: HttpRequest) -> None:
+	raw_refresh = request.session.get('refresh_token')
+	if raw_refresh:
+		try:
+			RefreshToken(raw_refresh).blacklist()
+		except TokenError:
+			pass
+	raw_token = request.session.get('access_token')
+	if raw_token:
+		try:
+			caches[TOKEN_CACHE_ALIAS].delete(get_token_cache_key(AccessToken(raw_token)))
+		except TokenError:
+			pass
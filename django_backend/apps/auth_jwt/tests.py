@@ -1,3 +1,84 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.test import (
+	Client,
+	RequestFactory,
+	TestCase,
+)
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import (
+	AccessToken,
+	RefreshToken,
+)
+from apps.users.models import User
+from apps.auth_jwt.services import (
+	TOKEN_CACHE_ALIAS,
+	get_session_user,
+	get_token_cache_key,
+	revoke_session_tokens,
+)
 
-# Create your tests here.
+class SessionUserTests(TestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='alice', password='password', nickname='alice')
+		self.refresh = RefreshToken.for_user(self.user)
+		self.access = self.refresh.access_token
+
+	def make_request(self, access: str, refresh: str):
+		request = RequestFactory().get('/tasks/view/')
+		request.session = SessionStore()
+		request.session['access_token'] = access
+		request.session['refresh_token'] = refresh
+		return request
+
+	def test_valid_token_checked_once(self):
+		request = self.make_request(str(self.access), str(self.refresh))
+		self.assertEqual(get_session_user(request).pk, self.user.pk)
+		self.assertEqual(caches[TOKEN_CACHE_ALIAS].get(get_token_cache_key(self.access)), self.user.pk)
+		# Blacklist and active user come from the cache now, the user is lazy
+		with self.assertNumQueries(0):
+			user = get_session_user(request)
+		self.assertEqual(user.pk, self.user.pk)
+
+	def test_expired_token_refreshed_from_session(self):
+		expired = AccessToken.for_user(self.user)
+		expired.set_exp(from_time=timezone.now() - timedelta(days=1))
+		request = self.make_request(str(expired), str(self.refresh))
+		self.assertEqual(get_session_user(request).pk, self.user.pk)
+		self.assertNotEqual(request.session['access_token'], str(expired))
+		self.assertEqual(AccessToken(request.session['access_token'])['user_id'], str(self.user.pk))
+
+		# Nothing to refresh with
+		request = self.make_request(str(expired), '')
+		self.assertIsNone(get_session_user(request))
+
+	def test_blacklisted_refresh_token_gives_no_user(self):
+		self.refresh.blacklist()
+		request = self.make_request(str(self.access), str(self.refresh))
+		self.assertIsNone(get_session_user(request))
+
+		# Can't be refreshed either
+		expired = AccessToken.for_user(self.user)
+		expired.set_exp(from_time=timezone.now() - timedelta(days=1))
+		self.assertIsNone(get_session_user(self.make_request(str(expired), str(self.refresh))))
+
+	def test_logout_drops_the_cached_user(self):
+		request = self.make_request(str(self.access), str(self.refresh))
+		self.assertIsNotNone(get_session_user(request))
+		revoke_session_tokens(request)
+		self.assertIsNone(caches[TOKEN_CACHE_ALIAS].get(get_token_cache_key(self.access)))
+		# Another session with the same (still unexpired) pair, as a copied cookie would be
+		self.assertIsNone(get_session_user(self.make_request(str(self.access), str(self.refresh))))
+
+	def test_logout_view_ends_the_session(self):
+		client = Client()
+		session = client.session
+		session['access_token'] = str(self.access)
+		session['refresh_token'] = str(self.refresh)
+		session.save()
+		self.assertEqual(client.get('/tasks/view/').status_code, 200)
+
+		self.assertRedirects(client.get('/auth/logout/'), '/', fetch_redirect_response=False)
+		self.assertNotIn('access_token', client.session)
+		self.assertRedirects(client.get('/tasks/view/'), '/auth/login/', fetch_redirect_response=False)
@@ -1,13 +1,21 @@
-import requests
-from django.conf import settings
 from django.shortcuts import (
 	render,
 	redirect,
 )
 from django.http import HttpRequest, HttpResponse
 from rest_framework import generics
+from rest_framework.exceptions import (
+	AuthenticationFailed,
+	ValidationError,
+)
 from rest_framework.permissions import AllowAny
 from apps.users.serializers import UserSerializer
+from apps.common.utils import api_error_data
+from .services import (
+	register_user,
+	obtain_token_pair,
+	revoke_session_tokens,
+)
 
 class RegisterView(generics.CreateAPIView):
 	serializer_class = UserSerializer
@@ -32,16 +40,11 @@ def register_view(request: HttpRequest) -> HttpResponse:
 			"password": password,
 			"nickname": nickname,
 		}
-		# 'web' is service name inside docker-compose.yml with django
-		api_url = f"{settings.API_BASE_URL}/api/auth/register/"
 		try:
-			response = requests.post(api_url, json=data)
-			if response.status_code == 201:
-				return redirect("auth_jwt_html:login")
-			else:
-				error = response.json()
-		except Exception as e:
-			error = {"error": str(e)}
+			register_user(data)
+			return redirect("auth_jwt_html:login")
+		except ValidationError as e:
+			error = api_error_data(e)
 		return render(request, "register.html", {"error": error, "form_data": data})
 	return render(request, "register.html")
 
@@ -53,22 +56,18 @@ def login_view(request: HttpRequest) -> HttpResponse:
 			"username": username,
 			"password": password,
 		}
-		api_url = f"{settings.API_BASE_URL}/api/auth/login/"
 		try:
-			response = requests.post(api_url, json=data)
-			if response.status_code == 200:
-				tokens = response.json()
-				request.session['access_token'] = tokens['access']
-				request.session['refresh_token'] = tokens['refresh']
-				return redirect("home")
-			else:
-				error = "Invalid username or password"
-		except Exception as e:
-			error = f"Connection error: {str(e)}"
+			tokens = obtain_token_pair(request, data)
+			request.session['access_token'] = tokens['access']
+			request.session['refresh_token'] = tokens['refresh']
+			return redirect("home")
+		except (AuthenticationFailed, ValidationError):
+			error = "Invalid username or password"
 		return render(request, "login.html", {"error": error, "form_data": data})
 	return render(request, "login.html")
 
 def logout_view(request: HttpRequest) -> HttpResponse:
+	revoke_session_tokens(request)
 	if 'access_token' in request.session:
 		del request.session['access_token']
 	if 'refresh_token' in request.session:
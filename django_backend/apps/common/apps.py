@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CommonConfig(AppConfig):
 	default_auto_field = 'django.db.models.BigAutoField'
 	name = 'apps.common'
+
+	def ready(self):
+		from django.db.backends.signals import connection_created
+		from .metrics import install_query_wrapper
+		connection_created.connect(install_query_wrapper)
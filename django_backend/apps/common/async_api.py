@@ -0,0 +1,71 @@
+from typing import (
+	Any,
+	Callable,
+)
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import (
+	Model,
+	QuerySet,
+)
+from django.http import (
+	Http404,
+	HttpRequest,
+	HttpResponseBase,
+)
+
+# Async handlers for DRF views: a view with aget() / apost() serves GET (and
+# HEAD) / POST from the event loop under ASGI, awaiting the async ORM instead
+# of holding a thread for the whole request. Authentication, permissions and
+# the rest of APIView.initial() still run sync, in one thread hop. Methods
+# without an async handler go through the usual DRF dispatch in a thread.
+# ASYNC_API_VIEWS = False serves everything the sync way
+class AsyncAPIMixin:
+	@classmethod
+	def get_async_handler_name(cls, method: str) -> str:
+		method = method.lower()
+		return 'aget' if method == 'head' else f'a{method}'
+
+	@classmethod
+	def as_view(cls, **initkwargs) -> Callable:
+		sync_view = super().as_view(**initkwargs)
+		if not settings.ASYNC_API_VIEWS:
+			return sync_view
+		sync_handler = sync_to_async(sync_view)
+
+		async def view(request: HttpRequest, *args, **kwargs) -> HttpResponseBase:
+			if not hasattr(cls, cls.get_async_handler_name(request.method)):
+				return await sync_handler(request, *args, **kwargs)
+			self = cls(**initkwargs)
+			self.setup(request, *args, **kwargs)
+			return await self.adispatch(request, *args, **kwargs)
+
+		view.cls = cls
+		view.initkwargs = initkwargs
+		# Like APIView.as_view, SessionAuthentication checks CSRF itself.
+		# csrf_exempt() would wrap the coroutine in a sync function
+		view.csrf_exempt = True
+		return view
+
+	async def adispatch(self, request: HttpRequest, *args, **kwargs) -> Any:
+		# APIView.dispatch with the handler awaited
+		self.args = args
+		self.kwargs = kwargs
+		request = self.initialize_request(request, *args, **kwargs)
+		self.request = request
+		self.headers = self.default_response_headers
+		try:
+			await sync_to_async(self.initial)(request, *args, **kwargs)
+			handler = getattr(self, self.get_async_handler_name(request.method))
+			response = await handler(request, *args, **kwargs)
+		except Exception as exc:
+			response = self.handle_exception(exc)
+		self.response = self.finalize_response(request, response, *args, **kwargs)
+		return self.response
+
+# get_object_or_404 on the async ORM (Django 4.2 has no aget_object_or_404)
+async def aget_object_or_404(queryset: QuerySet, **kwargs) -> Model:
+	try:
+		return await queryset.aget(**kwargs)
+	except queryset.model.DoesNotExist:
+		raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
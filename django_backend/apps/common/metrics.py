@@ -0,0 +1,255 @@
+import re
+import time
+import bisect
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+	Any,
+	Callable,
+	Dict,
+	Iterator,
+	List,
+	Optional,
+	Set,
+	Tuple,
+)
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import (
+	HttpRequest,
+	HttpResponseBase,
+)
+from django.template.backends.django import DjangoTemplates
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+# Per request instrumentation. metrics_middleware times the request, every
+# query goes through record_query (an execute_wrapper installed on each new
+# connection, threads of async views included) and timed() adds the
+# serialize / render phases. The totals go out as a Server-Timing header, into
+# the histograms served by /metrics and, past METRICS_SLOW_REQUEST_MS, into a
+# log line with the statements repeated in the request (N+1 candidates).
+# Per process, like the cache stats: with several workers each one is scraped
+# on its own
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+PHASES = ('db', 'serialize', 'render')
+# IN (%s, %s, %s) only differs by the number of ids
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+class RequestMetrics:
+	def __init__(self):
+		self.started = time.perf_counter()
+		self.queries = 0
+		self.phases = dict.fromkeys(PHASES, 0.0)
+		# SQL -> times run, the statements come with %s placeholders
+		self.statements: Counter = Counter()
+		# Phases being timed, templates render templates
+		self.running: Set[str] = set()
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar('request_metrics', default=None)
+
+# name -> (type, help, buckets)
+METRICS = {
+	'http_requests_total': ('counter', 'Requests by view, method and status', None),
+	'http_request_duration_seconds': ('histogram', 'Time in Django, middleware included', DURATION_BUCKETS),
+	'http_request_queries': ('histogram', 'SQL statements per request', QUERY_BUCKETS),
+	'http_request_phase_seconds': ('histogram', 'Time per request in SQL, serialization and rendering', DURATION_BUCKETS),
+	'http_slow_requests_total': ('counter', 'Requests over METRICS_SLOW_REQUEST_MS', None),
+}
+# (name, labels) -> count for counters, [bucket counts..., sum, count] for histograms
+_series: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Any] = {}
+_series_lock = threading.Lock()
+
+
+# COLLECTING
+
+# Only the outermost timing of a phase counts. Phases can overlap, queries
+# run while serializing count for db and serialize
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+	metrics = _current.get()
+	if metrics is None or phase in metrics.running:
+		yield
+		return
+	metrics.running.add(phase)
+	started = time.perf_counter()
+	try:
+		yield
+	finally:
+		metrics.phases[phase] += time.perf_counter() - started
+		metrics.running.discard(phase)
+
+def record_query(execute: Callable, sql: str, params: Any, many: bool, context: Dict[str, Any]) -> Any:
+	metrics = _current.get()
+	if metrics is None:
+		return execute(sql, params, many, context)
+	started = time.perf_counter()
+	try:
+		return execute(sql, params, many, context)
+	finally:
+		metrics.phases['db'] += time.perf_counter() - started
+		metrics.queries += 1
+		metrics.statements[sql] += 1
+
+def install_query_wrapper(sender: Any, connection: Any, **kwargs) -> None:
+	# connection_created receiver. Fired again on every reconnect of the same
+	# wrapper, so only added once
+	if record_query not in connection.execute_wrappers:
+		connection.execute_wrappers.append(record_query)
+
+# DRF and template rendering for the render phase, see REST_FRAMEWORK and
+# TEMPLATES in settings
+class TimedJSONRenderer(JSONRenderer):
+	def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+		with timed('render'):
+			return super().render(data, accepted_media_type, renderer_context)
+
+class TimedTemplate:
+	def __init__(self, template: Any):
+		self.template = template
+		self.origin = template.origin
+
+	def render(self, context: Optional[Dict[str, Any]] = None, request: Optional[HttpRequest] = None) -> str:
+		with timed('render'):
+			return self.template.render(context, request)
+
+class TimedDjangoTemplates(DjangoTemplates):
+	def from_string(self, template_code: str) -> TimedTemplate:
+		return TimedTemplate(super().from_string(template_code))
+
+	def get_template(self, template_name: str) -> TimedTemplate:
+		return TimedTemplate(super().get_template(template_name))
+
+
+# REPORTING
+
+def get_labels(**labels: str) -> Tuple[Tuple[str, str], ...]:
+	return tuple(labels.items())
+
+def increment(name: str, labels: Tuple[Tuple[str, str], ...]) -> None:
+	with _series_lock:
+		_series[name, labels] = _series.get((name, labels), 0) + 1
+
+def observe(name: str, labels: Tuple[Tuple[str, str], ...], value: float) -> None:
+	buckets = METRICS[name][2]
+	with _series_lock:
+		series = _series.get((name, labels))
+		if series is None:
+			series = _series[name, labels] = [0] * (len(buckets) + 3)
+		# Counted in the first bucket it fits, made cumulative on export
+		series[bisect.bisect_left(buckets, value)] += 1
+		series[-2] += value
+		series[-1] += 1
+
+def get_fingerprints(metrics: RequestMetrics) -> List[Tuple[str, int]]:
+	# Statements run METRICS_DUPLICATE_QUERIES times or more, most first
+	fingerprints: Counter = Counter()
+	for sql, count in metrics.statements.items():
+		fingerprints[IN_LIST.sub('IN (...)', sql)] += count
+	return [
+		(sql, count) for sql, count in fingerprints.most_common()
+		if count >= settings.METRICS_DUPLICATE_QUERIES
+	]
+
+def get_server_timing(metrics: RequestMetrics, total: float) -> str:
+	parts = [f'db;dur={metrics.phases["db"] * 1000:.1f};desc="{metrics.queries} queries"']
+	parts += [
+		f'{phase};dur={metrics.phases[phase] * 1000:.1f}'
+		for phase in PHASES[1:] if metrics.phases[phase]
+	]
+	parts.append(f'total;dur={total * 1000:.1f}')
+	return ', '.join(parts)
+
+def finish_request(request: HttpRequest, response: HttpResponseBase, metrics: RequestMetrics) -> None:
+	total = time.perf_counter() - metrics.started
+	match = request.resolver_match
+	view = match.view_name if match else 'unmatched'
+	labels = get_labels(view=view, method=request.method)
+	increment('http_requests_total', labels + get_labels(status=str(response.status_code)))
+	observe('http_request_duration_seconds', labels, total)
+	observe('http_request_queries', labels, metrics.queries)
+	for phase in PHASES:
+		observe('http_request_phase_seconds', labels + get_labels(phase=phase), metrics.phases[phase])
+	if settings.METRICS_SERVER_TIMING:
+		response['Server-Timing'] = get_server_timing(metrics, total)
+
+	if total * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+		increment('http_slow_requests_total', labels)
+		repeated = ''.join(f'\n  {count}x {sql[:300]}' for sql, count in get_fingerprints(metrics))
+		logger.warning(
+			'Slow request %s %s (%s) %.0fms: %s queries in %.0fms, serialize %.0fms, render %.0fms%s',
+			request.method, request.path, view, total * 1000, metrics.queries, metrics.phases['db'] * 1000,
+			metrics.phases['serialize'] * 1000, metrics.phases['render'] * 1000,
+			f', repeated:{repeated}' if repeated else '',
+		)
+
+@sync_and_async_middleware
+def metrics_middleware(get_response: Callable[[HttpRequest], Any]) -> Callable[[HttpRequest], Any]:
+	# First in MIDDLEWARE, so the total covers the other middleware too.
+	# Streaming responses are measured up to their headers
+	if iscoroutinefunction(get_response):
+		async def async_middleware(request: HttpRequest) -> HttpResponseBase:
+			if not settings.METRICS_ENABLED:
+				return await get_response(request)
+			metrics = RequestMetrics()
+			token = _current.set(metrics)
+			try:
+				response = await get_response(request)
+			finally:
+				_current.reset(token)
+			finish_request(request, response, metrics)
+			return response
+		return async_middleware
+
+	def middleware(request: HttpRequest) -> HttpResponseBase:
+		if not settings.METRICS_ENABLED:
+			return get_response(request)
+		metrics = RequestMetrics()
+		token = _current.set(metrics)
+		try:
+			response = get_response(request)
+		finally:
+			_current.reset(token)
+		finish_request(request, response, metrics)
+		return response
+	return middleware
+
+
+# EXPORT
+
+def format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+	if not labels:
+		return ''
+	escaped = (
+		(key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+		for key, value in labels
+	)
+	return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+def render_metrics() -> str:
+	# Prometheus text exposition format 0.0.4
+	with _series_lock:
+		series = {key: list(value) if isinstance(value, list) else value for key, value in _series.items()}
+	lines = []
+	for name, (kind, description, buckets) in METRICS.items():
+		lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+		for (series_name, labels), value in sorted(series.items()):
+			if series_name != name:
+				continue
+			if kind == 'counter':
+				lines.append(f'{name}{format_labels(labels)} {value}')
+				continue
+			cumulative = 0
+			for bound, count in zip(buckets + ('+Inf',), value):
+				cumulative += count
+				lines.append(f'{name}_bucket{format_labels(labels + get_labels(le=str(bound)))} {cumulative}')
+			lines.append(f'{name}_sum{format_labels(labels)} {value[-2]}')
+			lines.append(f'{name}_count{format_labels(labels)} {value[-1]}')
+	return '\n'.join(lines) + '\n'
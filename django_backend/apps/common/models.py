@@ -1,11 +1,28 @@
 from django.db import models
+from .signals import soft_deleted
+
+class SoftDeleteQuerySet(models.QuerySet):
+	# One UPDATE for every row instead of a save() per instance
+	def soft_delete(self) -> int:
+		deleted = self.update(is_deleted=True)
+		if deleted:
+			soft_deleted.send(sender=self.model)
+		return deleted
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+	# Live rows only, all_objects has the soft-deleted ones too
+	def get_queryset(self) -> SoftDeleteQuerySet:
+		return super().get_queryset().filter(is_deleted=False)
 
 class SoftDeleteModel(models.Model):
 	is_deleted = models.BooleanField(default=False)
 
+	objects = SoftDeleteManager()
+	all_objects = models.Manager.from_queryset(SoftDeleteQuerySet)()
+
 	def soft_delete(self):
+		type(self).all_objects.filter(pk=self.pk).soft_delete()
 		self.is_deleted = True
-		self.save()
 
 	class Meta:
-		abstract = True
\ No newline at end of file
+		abstract = True
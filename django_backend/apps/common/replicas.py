@@ -0,0 +1,166 @@
+import time
+import random
+import logging
+from contextvars import ContextVar
+from typing import (
+	Any,
+	Callable,
+	Dict,
+	Optional,
+	Tuple,
+)
+from asgiref.sync import (
+	iscoroutinefunction,
+	sync_to_async,
+)
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (
+	DatabaseError,
+	connections,
+)
+from django.http import (
+	HttpRequest,
+	HttpResponse,
+)
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+# Read replicas. GET and HEAD of the views with ReplicaReadMixin read from
+# one of settings.DATABASE_REPLICAS, everything else (writes, other views,
+# Celery, the shell) stays on the primary. Users who wrote in the last
+# DATABASE_STICKY_SECONDS read from the primary so they see their own writes.
+# A replica that can't be reached or is more than DATABASE_REPLICA_MAX_LAG
+# seconds behind is left out until the next check
+
+PRIMARY = 'default'
+STICKY_KEY = 'db:wrote:{}'
+
+# Seconds behind the primary. 0 once everything received is replayed (an idle
+# primary would make pg_last_xact_replay_timestamp() look old) and for a
+# database that isn't a standby, like a copy standing in for one locally
+LAG_SQL = """
+	SELECT CASE
+		WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+		ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+	END
+"""
+
+_read_alias: ContextVar[Optional[str]] = ContextVar('db_read_alias', default=None)
+# alias -> (checked at, usable), per process
+_health: Dict[str, Tuple[float, bool]] = {}
+
+def get_read_alias() -> Optional[str]:
+	# The replica the current request reads from, None on the primary
+	return _read_alias.get()
+
+def is_replica_usable(alias: str) -> bool:
+	# Lag is checked every DATABASE_REPLICA_CHECK_SECONDS, the connection on
+	# every request (it's opened for the request's queries anyway)
+	checked_at, usable = _health.get(alias, (0.0, False))
+	try:
+		if time.monotonic() - checked_at < settings.DATABASE_REPLICA_CHECK_SECONDS:
+			if usable:
+				connections[alias].ensure_connection()
+			return usable
+		with connections[alias].cursor() as cursor:
+			cursor.execute(LAG_SQL)
+			lag = float(cursor.fetchone()[0] or 0)
+		usable = lag <= settings.DATABASE_REPLICA_MAX_LAG
+		if not usable:
+			logger.warning('Replica %s is %.1fs behind, reading from the primary', alias, lag)
+	except DatabaseError:
+		logger.warning('Replica %s unavailable, reading from the primary', alias, exc_info=True)
+		connections[alias].close()
+		usable = False
+	_health[alias] = (time.monotonic(), usable)
+	return usable
+
+def wrote_recently(user: Any) -> bool:
+	if user is None or not user.is_authenticated:
+		return False
+	try:
+		return cache.get(STICKY_KEY.format(user.pk)) is not None
+	except Exception:
+		# Can't tell, the primary is always right
+		logger.exception('Replica stickiness unavailable')
+		return True
+
+def mark_write(user: Any) -> None:
+	if user is None or not user.is_authenticated:
+		return
+	try:
+		cache.set(STICKY_KEY.format(user.pk), 1, settings.DATABASE_STICKY_SECONDS)
+	except Exception:
+		logger.exception('Replica stickiness unavailable')
+
+def choose_replica(user: Any) -> Optional[str]:
+	# A random usable replica, None for the primary
+	if not settings.DATABASE_REPLICAS or wrote_recently(user):
+		return None
+	replicas = list(settings.DATABASE_REPLICAS)
+	random.shuffle(replicas)
+	for alias in replicas:
+		if is_replica_usable(alias):
+			return alias
+	return None
+
+
+# ROUTING
+
+class ReplicaRouter:
+	def db_for_read(self, model, **hints) -> str:
+		return _read_alias.get() or PRIMARY
+
+	def db_for_write(self, model, **hints) -> str:
+		return PRIMARY
+
+	def allow_relation(self, obj1, obj2, **hints) -> bool:
+		# Replicas hold the same rows
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints) -> bool:
+		# Replicas get the schema from the primary
+		return db == PRIMARY
+
+def is_write(request: HttpRequest, response: HttpResponse) -> bool:
+	return bool(settings.DATABASE_REPLICAS) and request.method not in SAFE_METHODS and response.status_code < 400
+
+@sync_and_async_middleware
+def replica_middleware(get_response: Callable[[HttpRequest], Any]) -> Callable[[HttpRequest], Any]:
+	# Starts the stickiness after a successful write. DRF sets request.user on
+	# this HttpRequest when it authenticates
+	if iscoroutinefunction(get_response):
+		async def async_middleware(request: HttpRequest) -> HttpResponse:
+			response = await get_response(request)
+			if is_write(request, response):
+				# The session user is lazy, loaded in the thread
+				await sync_to_async(mark_write)(getattr(request, 'user', None))
+			return response
+		return async_middleware
+
+	def middleware(request: HttpRequest) -> HttpResponse:
+		response = get_response(request)
+		if is_write(request, response):
+			mark_write(getattr(request, 'user', None))
+		return response
+	return middleware
+
+# For DRF views: GET and HEAD read from a replica, chosen once the user is
+# authenticated. Querysets evaluated after the view returns (streaming) need
+# .using(queryset.db) while it's still set. Cleared by setting it rather than
+# with a token, async views choose it in a thread (see async_api.py) and
+# asgiref copies it back into their context
+class ReplicaReadMixin:
+	def initial(self, request: Request, *args, **kwargs) -> None:
+		super().initial(request, *args, **kwargs)
+		if request.method in SAFE_METHODS:
+			_read_alias.set(choose_replica(request.user))
+
+	def finalize_response(self, request: Request, response: Response, *args, **kwargs) -> Response:
+		_read_alias.set(None)
+		return super().finalize_response(request, response, *args, **kwargs)
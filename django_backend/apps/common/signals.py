@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent by the soft_delete() querysets with sender=the model, once per call
+# that deleted rows. They write with a plain UPDATE, so post_save / post_delete
+# never come
+soft_deleted = Signal()
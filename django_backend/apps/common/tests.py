@@ -1,3 +1,184 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import (
+	DatabaseError,
+	connections,
+	transaction,
+)
+from django.test import (
+	TestCase,
+	TransactionTestCase,
+	override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.users.models import User
+from apps.tasks.models import (
+	Tag,
+	Task,
+)
+from apps.common import replicas
+from apps.common.utils import on_commit_once
 
-# Create your tests here.
+class MetricsAccessTests(TestCase):
+	def setUp(self):
+		self.client = APIClient()
+		self.user = User.objects.create_user(username='alice', password='password', nickname='alice')
+		self.admin = User.objects.create_user(username='root', password='password', nickname='root', is_staff=True)
+
+	def get(self, credentials=None):
+		headers = {'HTTP_AUTHORIZATION': f'Bearer {credentials}'} if credentials else {}
+		return self.client.get('/metrics', **headers)
+
+	def test_not_public_without_token(self):
+		self.assertEqual(self.get().status_code, 401)
+		self.assertEqual(self.get(AccessToken.for_user(self.user)).status_code, 403)
+		response = self.get(AccessToken.for_user(self.admin))
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('# TYPE http_requests_total counter', response.content.decode())
+
+	@override_settings(METRICS_TOKEN='scrape-me')
+	def test_token_for_the_scraper(self):
+		self.assertEqual(self.get('scrape-me').status_code, 200)
+		self.assertEqual(self.get('wrong').status_code, 401)
+		self.assertEqual(self.get().status_code, 401)
+		self.assertEqual(self.get(AccessToken.for_user(self.user)).status_code, 403)
+		self.assertEqual(self.get(AccessToken.for_user(self.admin)).status_code, 200)
+
+
+class OnCommitOnceTests(TestCase):
+	def test_one_callback_per_transaction(self):
+		flushed = []
+		with self.captureOnCommitCallbacks(execute=True) as callbacks:
+			with transaction.atomic():
+				on_commit_once('test', flushed.append, [1])
+				on_commit_once('test', flushed.append, [2, 3])
+				on_commit_once('other', flushed.append)
+		self.assertEqual(len(callbacks), 2)
+		self.assertEqual(flushed, [[1, 2, 3], []])
+
+		# Reset by the callback, the next transaction gets its own
+		with self.captureOnCommitCallbacks(execute=True) as callbacks:
+			with transaction.atomic():
+				on_commit_once('test', flushed.append, [4])
+		self.assertEqual(len(callbacks), 1)
+		self.assertEqual(flushed[-1], [4])
+
+	def test_rolled_back_savepoint_drops_its_items(self):
+		flushed = []
+		connection = transaction.get_connection()
+		with self.captureOnCommitCallbacks(execute=True) as callbacks:
+			with transaction.atomic():
+				on_commit_once('test', flushed.append, [1])
+				try:
+					with transaction.atomic():
+						on_commit_once('test', flushed.append, [2])
+						raise DatabaseError()
+				except DatabaseError:
+					pass
+				# Its callback is gone, so is the flag
+				self.assertEqual(sum(ref() is not None for ref in connection.pending_on_commit.values()), 1)
+				on_commit_once('test', flushed.append, [3])
+		self.assertEqual(len(callbacks), 1)
+		self.assertEqual(flushed, [[1, 3]])
+
+
+# A replica is a second connection to the test database, set up like the
+# POSTGRES_REPLICA_HOSTS ones (TEST MIRROR of default). Added when the module
+# is loaded, before the runner sets the test databases up. It only sees
+# committed rows, so these tests commit. replica_down points at a socket
+# that isn't there
+def add_test_replica(alias: str, **changes) -> None:
+	settings_dict = dict(connections.settings['default'], **changes)
+	settings_dict['TEST'] = dict(settings_dict['TEST'], MIRROR='default')
+	connections.settings[alias] = settings_dict
+
+add_test_replica('replica')
+add_test_replica('replica_down', HOST='/nonexistent', OPTIONS={'connect_timeout': 1})
+
+@override_settings(TASK_CACHE_TIMEOUT=0, DATABASE_REPLICA_CHECK_SECONDS=60)
+class ReplicaRoutingTests(TransactionTestCase):
+	databases = {'default', 'replica', 'replica_down'}
+	# The flush takes the default tags with it, they're put back for the next
+	# test and, with --keepdb, the next run
+	serialized_rollback = True
+
+	@classmethod
+	def tearDownClass(cls):
+		super().tearDownClass()
+		connection = connections['default']
+		connection.creation.deserialize_db_from_string(connection._test_serialized_contents)
+
+	def setUp(self):
+		replicas._health.clear()
+		self.user = User.objects.create_user(username='alice', password='password', nickname='alice')
+		self.other = User.objects.create_user(username='bob', password='password', nickname='bob')
+		cache.delete_many([replicas.STICKY_KEY.format(user.pk) for user in (self.user, self.other)])
+		self.task = Task.objects.create(
+			title='Replicated', description='Committed', status='pending', priority='low',
+			due_date=timezone.now() + timedelta(days=1), estimated_hours=1, created_by=self.user,
+		)
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+
+	def get_tasks(self, client=None):
+		# Queries on each connection, and the ids the response shows
+		with CaptureQueriesContext(connections['default']) as primary:
+			with CaptureQueriesContext(connections['replica']) as replica:
+				response = (client or self.client).get('/api/tasks/?pagination=cursor&ordering=id')
+		self.assertEqual(response.status_code, 200)
+		self.assertIsNone(replicas.get_read_alias())
+		return primary, replica, [task['id'] for task in response.data['results']]
+
+	def assertReadFrom(self, alias, client=None):
+		primary, replica, ids = self.get_tasks(client)
+		reads = {'default': primary, 'replica': replica}[alias]
+		self.assertTrue(any('"tasks_task"' in query['sql'] for query in reads.captured_queries))
+		other = replica if alias == 'default' else primary
+		self.assertFalse(any('"tasks_task"' in query['sql'] for query in other.captured_queries))
+		return ids
+
+	@override_settings(DATABASE_REPLICAS=['replica'])
+	def test_get_reads_from_the_replica(self):
+		self.assertEqual(self.assertReadFrom('replica'), [self.task.pk])
+
+		# Cleared after an error response too, the next query is on the primary
+		response = self.client.get(f'/api/tasks/{self.task.pk + 1000}/')
+		self.assertEqual(response.status_code, 404)
+		self.assertIsNone(replicas.get_read_alias())
+		self.assertEqual(Task.objects.all().db, 'default')
+
+	@override_settings(DATABASE_REPLICAS=['replica'])
+	def test_write_sticks_the_user_to_the_primary(self):
+		response = self.client.post('/api/tasks/', {
+			'title': 'New', 'description': 'Written', 'status': 'pending', 'priority': 'low',
+			'due_date': (timezone.now() + timedelta(days=2)).isoformat(), 'estimated_hours': '1',
+			'tags': [Tag.objects.create(name='replicas').pk],
+		}, format='json')
+		self.assertEqual(response.status_code, 201)
+		self.assertIsNotNone(cache.get(replicas.STICKY_KEY.format(self.user.pk)))
+		self.assertIn(response.data['id'], self.assertReadFrom('default'))
+
+		# Only the writer
+		client = APIClient()
+		client.force_authenticate(self.other)
+		self.assertReadFrom('replica', client)
+
+	@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_REPLICA_MAX_LAG=-1)
+	def test_lagging_replica_falls_back_to_the_primary(self):
+		with self.assertLogs('apps.common.replicas', 'WARNING'):
+			self.assertReadFrom('default')
+		self.assertEqual(replicas._health['replica'][1], False)
+
+	@override_settings(DATABASE_REPLICAS=['replica_down'])
+	def test_unreachable_replica_falls_back_to_the_primary(self):
+		with self.assertLogs('apps.common.replicas', 'WARNING'):
+			self.assertReadFrom('default')
+		self.assertEqual(replicas._health['replica_down'][1], False)
+
+		# Skipped until the next check, the usable one is picked
+		with override_settings(DATABASE_REPLICAS=['replica_down', 'replica']):
+			for _ in range(5):
+				self.assertEqual(replicas.choose_replica(self.user), 'replica')
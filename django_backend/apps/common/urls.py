@@ -2,9 +2,11 @@ from django.urls import path
 from .views import (
 	health_check,
 	home,
+	MetricsView,
 )
 
 urlpatterns = [
 	path('health/', health_check, name='health_check'),
+	path('metrics', MetricsView.as_view(), name='metrics'),
 	path('', home, name='home'),
 ]
\ No newline at end of file
@@ -0,0 +1,99 @@
+import json
+import weakref
+import hashlib
+from datetime import datetime
+from typing import (
+	Any,
+	Callable,
+	Iterable,
+	List,
+	Optional,
+)
+from django.db import transaction
+from django.http import (
+	HttpRequest,
+	HttpResponseBase,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+# HTML views call the service layer in-process instead of going through the API
+# over HTTP, this wraps their request so services see the same user a DRF view would
+def as_api_request(request: HttpRequest) -> Request:
+	api_request = Request(request)
+	api_request.user = request.user
+	return api_request
+
+# Same shape the API returns as JSON body, so templates render errors like before
+def api_error_data(exc: APIException) -> Any:
+	return json.loads(JSONRenderer().render(exc.detail))
+
+
+# CONDITIONAL REQUESTS
+class PreconditionFailed(APIException):
+	status_code = status.HTTP_412_PRECONDITION_FAILED
+	default_detail = 'The resource has changed since it was read.'
+	default_code = 'precondition_failed'
+
+def make_etag(*parts: Any, weak: bool = False) -> str:
+	digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+	return f'{"W/" if weak else ""}"{digest}"'
+
+def set_validators(response: HttpResponseBase, etag: Optional[str], last_modified: Optional[datetime] = None) -> HttpResponseBase:
+	if etag:
+		response['ETag'] = etag
+	if last_modified:
+		response['Last-Modified'] = http_date(last_modified.timestamp())
+	return response
+
+# Django's If-None-Match / If-Modified-Since / If-Match / If-Unmodified-Since
+# evaluation. Returns the 304 to send or None to go on, a failed precondition
+# raises PreconditionFailed so the 412 has the usual error body
+def check_conditions(request: Any, etag: Optional[str], last_modified: Optional[datetime] = None) -> Optional[HttpResponseBase]:
+	timestamp = int(last_modified.timestamp()) if last_modified else None
+	response = get_conditional_response(getattr(request, '_request', request), etag=etag, last_modified=timestamp)
+	if response is None:
+		return None
+	if response.status_code == status.HTTP_412_PRECONDITION_FAILED:
+		raise PreconditionFailed()
+	return set_validators(response, etag, last_modified)
+
+
+# AFTER COMMIT
+# Writes hand their events, activity entries or cache bump to one callback per
+# transaction (per savepoint, so a savepoint rollback drops only its own part).
+# The connection keeps a weak reference to the pending callback: set when it's
+# registered, reset when it runs, and gone with it when a rollback discards it
+def on_commit_once(name: str, flush: Callable[[List[Any]], None], items: Iterable[Any] = ()) -> None:
+	connection = transaction.get_connection()
+	if not connection.in_atomic_block:
+		# Autocommit, on_commit would run it right away
+		flush(list(items))
+		return
+	pending = connection.__dict__.setdefault('pending_on_commit', {})
+	key = (name, tuple(connection.savepoint_ids))
+	ref = pending.get(key)
+	callback = ref() if ref is not None else None
+	if callback is not None:
+		callback.items.extend(items)
+		return
+
+	items = list(items)
+
+	def callback() -> None:
+		forget(ref)
+		flush(items)
+
+	def forget(dead: weakref.ref) -> None:
+		if pending.get(key) is dead:
+			del pending[key]
+
+	# No reference back to itself, so a discarded callback is freed right away
+	callback.items = items
+	ref = weakref.ref(callback, forget)
+	pending[key] = ref
+	transaction.on_commit(callback)
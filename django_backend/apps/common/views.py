@@ -1,13 +1,56 @@
+import hmac
+from typing import (
+	Optional,
+	Tuple,
+)
 from django.http import (
 	JsonResponse,
 	HttpRequest,
 	HttpResponse,
 )
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.shortcuts import render
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.permissions import BasePermission
+from rest_framework.request import Request
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .metrics import render_metrics
 
 def health_check(request: HttpRequest) -> JsonResponse:
 	return JsonResponse({"status": "ok"})
 
 def home(request: HttpRequest) -> HttpResponse:
 	is_authenticated = 'access_token' in request.session
-	return render(request, "home.html", {"is_authenticated": is_authenticated})
\ No newline at end of file
+	return render(request, "home.html", {"is_authenticated": is_authenticated})
+
+# The scraper's bearer METRICS_TOKEN, checked before JWTAuthentication would
+# reject it as an invalid JWT
+class MetricsTokenAuthentication(BaseAuthentication):
+	def authenticate(self, request: Request) -> Optional[Tuple[AnonymousUser, str]]:
+		token = settings.METRICS_TOKEN
+		header = request.headers.get('Authorization', '')
+		if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+			return AnonymousUser(), token
+		return None
+
+	def authenticate_header(self, request: Request) -> str:
+		return 'Bearer realm="metrics"'
+
+class IsStaffOrMetricsScraper(BasePermission):
+	def has_permission(self, request: Request, view: APIView) -> bool:
+		if isinstance(request.successful_authenticator, MetricsTokenAuthentication):
+			return True
+		return bool(request.user and request.user.is_staff)
+
+# GET /metrics for Prometheus, see metrics.py. Never public: staff users with
+# their JWT, or the scraper with METRICS_TOKEN as a bearer token
+# (authorization.credentials in scrape_config). 401 without credentials,
+# 403 for other users
+class MetricsView(APIView):
+	authentication_classes = [MetricsTokenAuthentication, JWTAuthentication]
+	permission_classes = [IsStaffOrMetricsScraper]
+
+	def get(self, request: Request) -> HttpResponse:
+		return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,185 @@
+import json
+import logging
+from contextvars import ContextVar
+from datetime import (
+	datetime,
+	timezone as dt_timezone,
+)
+from typing import (
+	Any,
+	Callable,
+	Dict,
+	Iterable,
+	List,
+	Optional,
+	Set,
+)
+import redis
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.http import (
+	HttpRequest,
+	HttpResponse,
+)
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import sync_and_async_middleware
+from apps.common.utils import on_commit_once
+from .models import (
+	Task,
+	TaskActivity,
+)
+
+logger = logging.getLogger(__name__)
+
+# History of task changes for auditing. Writes only collect entries: they are
+# pushed to a Redis list once per transaction after commit, and the
+# flush_task_activity Celery task moves them into the partitioned
+# tasks_task_activity table in batches (jobs.flush_task_activity). So a
+# request pays one RPUSH whatever it changed, bounded by
+# TASK_ACTIVITY_PUSH_TIMEOUT. If Redis doesn't answer in time the entries are
+# inserted directly instead, slower but nothing is lost
+
+ACTIVITY_BUFFER = 'tasks:activity'
+FLUSH_LOCK = 'tasks:activity:flush'
+ACTIVITY_BATCH_SIZE = 5000
+# Not diffed: keys, timestamps and the trigger maintained search_vector
+UNTRACKED_FIELDS = {'id', 'created_by', 'created_at', 'updated_at', 'search_vector'}
+PARTITION_PREFIX = 'tasks_task_activity_p'
+
+_current_request: ContextVar[Optional[HttpRequest]] = ContextVar('activity_request', default=None)
+_clients: Dict[Optional[float], redis.Redis] = {}
+# Partitions this process already made sure of
+_partitions: Set[str] = set()
+
+def get_client(timeout: Optional[float] = None) -> redis.Redis:
+	if timeout not in _clients:
+		_clients[timeout] = redis.Redis.from_url(
+			settings.TASK_ACTIVITY_URL, socket_timeout=timeout, socket_connect_timeout=timeout,
+		)
+	return _clients[timeout]
+
+
+# WHO
+
+@sync_and_async_middleware
+def activity_middleware(get_response: Callable[[HttpRequest], Any]) -> Callable[[HttpRequest], Any]:
+	# Keeps the request around for get_actor_id(). DRF authenticates in the
+	# view and sets request.user on this same HttpRequest. Sync code of an
+	# async request gets a copy of the context, with the request in it
+	if iscoroutinefunction(get_response):
+		async def async_middleware(request: HttpRequest) -> HttpResponse:
+			token = _current_request.set(request)
+			try:
+				return await get_response(request)
+			finally:
+				_current_request.reset(token)
+		return async_middleware
+
+	def middleware(request: HttpRequest) -> HttpResponse:
+		token = _current_request.set(request)
+		try:
+			return get_response(request)
+		finally:
+			_current_request.reset(token)
+	return middleware
+
+def get_actor_id() -> Optional[int]:
+	# The user of the current request, None in Celery tasks and the shell
+	user = getattr(_current_request.get(), 'user', None)
+	if user is None or not user.is_authenticated:
+		return None
+	return user.pk
+
+
+# WHAT
+
+def pop_task_changes(task: Task) -> Optional[Dict[str, List[Any]]]:
+	# {field: [old, new]} since the task was read (Task.from_db) or last
+	# diffed, None if it never came from the database. Deferred fields are
+	# left out rather than loaded
+	loaded = getattr(task, '_loaded_values', None)
+	current = {
+		field.attname: getattr(task, field.attname)
+		for field in Task._meta.concrete_fields
+		if field.name not in UNTRACKED_FIELDS and field.attname in task.__dict__
+	}
+	task._loaded_values = current
+	if loaded is None:
+		return None
+	return {
+		field.name: [loaded[field.attname], current[field.attname]]
+		for field in Task._meta.concrete_fields
+		if field.attname in current and field.attname in loaded and loaded[field.attname] != current[field.attname]
+	}
+
+def record_activity(
+	action: str,
+	task_ids: Iterable[int],
+	changes: Optional[Dict[str, Any]] = None,
+	user_id: Optional[int] = None,
+) -> None:
+	# Collected for the whole transaction and pushed once after commit,
+	# nothing is kept for a rollback
+	if not settings.TASK_ACTIVITY_ENABLED:
+		return
+	at = timezone.now().isoformat()
+	user_id = user_id if user_id is not None else get_actor_id()
+	entries = [
+		{'task': task_id, 'user': user_id, 'action': action, 'changes': changes or {}, 'at': at}
+		for task_id in task_ids
+	]
+	if not entries:
+		return
+	on_commit_once('task_activity', push_activity, entries)
+
+def push_activity(entries: List[Dict[str, Any]]) -> None:
+	try:
+		client = get_client(settings.TASK_ACTIVITY_PUSH_TIMEOUT)
+		client.rpush(ACTIVITY_BUFFER, *(json.dumps(entry, cls=DjangoJSONEncoder) for entry in entries))
+		return
+	except redis.RedisError:
+		logger.warning('Activity buffer unavailable, writing %s entries directly', len(entries), exc_info=True)
+	try:
+		write_activity(entries)
+	except Exception:
+		logger.exception('Could not write task activity: %s', json.dumps(entries, cls=DjangoJSONEncoder))
+
+
+# WHERE
+
+def get_partition(at: datetime) -> str:
+	at = at.astimezone(dt_timezone.utc)
+	return f'{PARTITION_PREFIX}{at.year}_{at.month:02d}'
+
+def ensure_activity_partitions(times: Iterable[datetime]) -> None:
+	# One partition per UTC month. IF NOT EXISTS since another process may
+	# have made it already
+	for at in times:
+		name = get_partition(at)
+		if name in _partitions:
+			continue
+		at = at.astimezone(dt_timezone.utc)
+		start = datetime(at.year, at.month, 1, tzinfo=dt_timezone.utc)
+		end = datetime(at.year + at.month // 12, at.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+		with connection.cursor() as cursor:
+			cursor.execute(
+				f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TaskActivity._meta.db_table}'
+				f" FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+			)
+		_partitions.add(name)
+
+def write_activity(entries: List[Dict[str, Any]]) -> int:
+	# COPY like the importer, several times the rows per second of INSERTs
+	ensure_activity_partitions(parse_datetime(at) for at in {entry['at'] for entry in entries})
+	with connection.cursor() as cursor, cursor.copy(
+		f'COPY {TaskActivity._meta.db_table} (task_id, user_id, action, changes, created_at) FROM STDIN'
+	) as copy:
+		for entry in entries:
+			copy.write_row((
+				entry['task'], entry['user'], entry['action'],
+				json.dumps(entry['changes'], cls=DjangoJSONEncoder), entry['at'],
+			))
+	return len(entries)
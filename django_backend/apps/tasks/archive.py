@@ -0,0 +1,87 @@
+from typing import (
+	Any,
+	Dict,
+)
+from django.db import (
+	connection,
+	transaction,
+)
+from django.utils import timezone
+from rest_framework.exceptions import (
+	NotFound,
+	PermissionDenied,
+)
+from rest_framework.request import Request
+from .models import (
+	Task,
+	TaskAssignment,
+	get_column_list,
+)
+from .cache import invalidate_task_cache
+from .events import queue_task_events
+from .activity import record_activity
+
+# ARCHIVE
+# Tasks moved to the archive tables by jobs.archive_tasks are read with
+# ?include_archived=true and moved back by POST /api/tasks/<pk>/restore
+
+# The task and its archived subtasks, and its archived ancestors so its
+# parent_task exists again (ancestors keep their other subtasks archived).
+# Assignments and tags come back only for users and tags that still exist,
+# the others are dropped and counted
+RESTORE_SQL = """
+	WITH RECURSIVE ancestors(id, parent_task_id) AS (
+		SELECT id, parent_task_id FROM tasks_task_archive WHERE id = %(pk)s
+		UNION
+		SELECT parent.id, parent.parent_task_id FROM tasks_task_archive parent
+		JOIN ancestors ON parent.id = ancestors.parent_task_id
+	), subtree(id) AS (
+		SELECT %(pk)s::bigint
+		UNION
+		SELECT child.id FROM tasks_task_archive child JOIN subtree ON child.parent_task_id = subtree.id
+	), tasks AS (
+		DELETE FROM tasks_task_archive
+		WHERE id IN (SELECT id FROM ancestors UNION SELECT id FROM subtree) RETURNING {task_columns}
+	), assignments AS (
+		DELETE FROM tasks_taskassignment_archive WHERE task_id IN (SELECT id FROM tasks) RETURNING {assignment_columns}
+	), tags AS (
+		DELETE FROM tasks_task_tags_archive WHERE task_id IN (SELECT id FROM tasks) RETURNING {tag_columns}
+	), restored_tasks AS (
+		INSERT INTO tasks_task ({task_columns}) SELECT {task_columns} FROM tasks RETURNING id
+	), restored_assignments AS (
+		INSERT INTO tasks_taskassignment ({assignment_columns}) SELECT {assignment_columns} FROM assignments
+		WHERE user_id IN (SELECT id FROM users_user) AND assigned_by_id IN (SELECT id FROM users_user)
+		RETURNING 1
+	), restored_tags AS (
+		INSERT INTO tasks_task_tags ({tag_columns}) SELECT {tag_columns} FROM tags
+		WHERE tag_id IN (SELECT id FROM tasks_tag)
+		RETURNING 1
+	)
+	SELECT
+		array(SELECT id FROM restored_tasks ORDER BY id),
+		(SELECT count(*) FROM assignments) - (SELECT count(*) FROM restored_assignments),
+		(SELECT count(*) FROM tags) - (SELECT count(*) FROM restored_tags)
+""".format(
+	task_columns=get_column_list(Task),
+	assignment_columns=get_column_list(TaskAssignment),
+	tag_columns=get_column_list(Task.tags.through),
+)
+
+def restore_task(request: Request, pk: int) -> Dict[str, Any]:
+	# Creator or staff, like assigning. updated_at is set to now so the
+	# archive job leaves the tasks alone for another TASK_ARCHIVE_AFTER_DAYS
+	with transaction.atomic():
+		with connection.cursor() as cursor:
+			cursor.execute('SELECT created_by_id FROM tasks_task_archive WHERE id = %s FOR UPDATE', [pk])
+			row = cursor.fetchone()
+			if row is None:
+				raise NotFound()
+			if not (request.user.pk == row[0] or request.user.is_staff):
+				raise PermissionDenied()
+			cursor.execute(RESTORE_SQL, {'pk': pk})
+			restored, dropped_assignments, dropped_tags = cursor.fetchone()
+		Task.all_objects.filter(pk__in=restored).update(updated_at=timezone.now())
+		invalidate_task_cache()
+		queue_task_events('restored', restored)
+		record_activity('restored', restored)
+	return {'ids': restored, 'dropped_assignments': dropped_assignments, 'dropped_tags': dropped_tags}
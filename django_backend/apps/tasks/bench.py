@@ -0,0 +1,108 @@
+# Shared helpers for the bench_* management commands
+import time
+import random
+from datetime import timedelta
+from decimal import Decimal
+from typing import (
+	Callable,
+	Dict,
+	List,
+)
+from asgiref.sync import (
+	async_to_sync,
+	iscoroutinefunction,
+)
+from django.utils import timezone
+from rest_framework.test import (
+	APIRequestFactory,
+	force_authenticate,
+)
+from apps.users.models import User
+from apps.tasks.models import (
+	STATUS_CHOICES,
+	PRIORITY_CHOICES,
+	Tag,
+	Task,
+)
+
+BENCH_USERNAME = 'bench_user'
+BENCH_SOURCES = ['jira', 'github', 'zendesk', 'salesforce']
+# Must be one of ALLOWED_HOSTS, paginators build absolute links with it
+BENCH_HOST = 'localhost'
+
+def get_bench_user() -> User:
+	user, _ = User.objects.get_or_create(
+		username=BENCH_USERNAME,
+		defaults={'nickname': 'bench', 'is_staff': True},
+	)
+	return user
+
+def seed_tasks(count: int, user: User, batch_size: int = 5000) -> int:
+	statuses = [value for value, _ in STATUS_CHOICES]
+	priorities = [value for value, _ in PRIORITY_CHOICES]
+	tag_ids = list(Tag.objects.values_list('id', flat=True))
+	now = timezone.now()
+	created = 0
+	while created < count:
+		size = min(batch_size, count - created)
+		tasks = Task.objects.bulk_create([
+			Task(
+				title=f'Bench task {created + i}',
+				description='Generated by the benchmark commands',
+				status=random.choice(statuses),
+				priority=random.choice(priorities),
+				due_date=now + timedelta(minutes=random.randint(-60 * 24 * 90, 60 * 24 * 90)),
+				estimated_hours=Decimal(random.randint(1, 400)) / 4,
+				created_by=user,
+				# What the integrations store, see bench_task_metadata
+				metadata={
+					'external_id': f'EXT-{random.getrandbits(48):012x}',
+					'sprint': f'S{random.randint(1, 50)}',
+					'customer_id': random.randint(1, 5000),
+					'source': random.choice(BENCH_SOURCES),
+				},
+			)
+			for i in range(size)
+		], batch_size=batch_size)
+		if tag_ids:
+			Task.tags.through.objects.bulk_create([
+				Task.tags.through(task_id=task.id, tag_id=random.choice(tag_ids))
+				for task in tasks
+			], batch_size=batch_size)
+		created += size
+	return created
+
+def api_get(view: Callable, user: User, path: str, params: Dict[str, str], **kwargs):
+	request = APIRequestFactory().get(path, params, HTTP_HOST=BENCH_HOST)
+	force_authenticate(request, user=user)
+	return call_view(view, request, **kwargs)
+
+def api_patch(view: Callable, user: User, path: str, data: Dict[str, object], **kwargs):
+	request = APIRequestFactory().patch(path, data, format='json', HTTP_HOST=BENCH_HOST)
+	force_authenticate(request, user=user)
+	return call_view(view, request, **kwargs)
+
+def call_view(view: Callable, request, **kwargs):
+	# Async views (ASYNC_API_VIEWS) run to completion in a loop of their own
+	if iscoroutinefunction(view):
+		view = async_to_sync(view)
+	response = view(request, **kwargs)
+	response.render()
+	return response
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+	index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+	return sorted_values[index]
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+	timings = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		fn()
+		timings.append((time.perf_counter() - start) * 1000)
+	timings.sort()
+	return {
+		'p50': percentile(timings, 50),
+		'p99': percentile(timings, 99),
+		'mean': sum(timings) / len(timings),
+	}
@@ -0,0 +1,309 @@
+from typing import (
+	Any,
+	Dict,
+	List,
+	Optional,
+	Set,
+	Tuple,
+)
+from django.db import (
+	connection,
+	transaction,
+)
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import (
+	PermissionDenied,
+	ValidationError,
+)
+from rest_framework.request import Request
+from apps.users.models import User
+from .models import (
+	Tag,
+	Task,
+)
+from .cache import invalidate_task_cache
+from .events import queue_task_events
+from .activity import (
+	pop_task_changes,
+	record_activity,
+)
+from .serializer import TaskBulkSerializer
+from .services import (
+	soft_delete_tasks,
+	touch_tasks,
+)
+
+BULK_MAX_ITEMS = 5000
+BULK_MAX_ASSIGNMENTS = 10000
+BULK_BATCH_SIZE = 1000
+
+# BULK WRITES
+# Items are validated with TaskSerializer rules against relations loaded once
+# for the whole batch. Nothing is written unless every item is valid, and then
+# everything is written in one transaction with bulk_create/bulk_update.
+# Errors are reported per item, in input order ({} for valid items).
+
+def to_pk(value: Any) -> Optional[int]:
+	if isinstance(value, bool):
+		return None
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		return None
+
+def check_bulk_items(items: Any) -> List[Any]:
+	if not isinstance(items, list):
+		raise ValidationError({'detail': 'Expected a list of items.'})
+	if not items:
+		raise ValidationError({'detail': 'This list may not be empty.'})
+	if len(items) > BULK_MAX_ITEMS:
+		raise ValidationError({'detail': f'Ensure this list has no more than {BULK_MAX_ITEMS} items.'})
+	return items
+
+def get_preloaded_relations(items: List[Any]) -> Dict[Any, Dict[int, Any]]:
+	tag_ids: Set[int] = set()
+	parent_ids: Set[int] = set()
+	for item in items:
+		if not isinstance(item, dict):
+			continue
+		if isinstance(item.get('tags'), list):
+			tag_ids.update(pk for pk in map(to_pk, item['tags']) if pk is not None)
+		parent_id = to_pk(item.get('parent_task'))
+		if parent_id is not None:
+			parent_ids.add(parent_id)
+	return {
+		Tag: Tag.objects.in_bulk(tag_ids),
+		Task: Task.objects.only('id').in_bulk(parent_ids),
+	}
+
+def validate_bulk_items(
+	request: Request,
+	items: List[Any],
+	partial: bool = False,
+	instances: Optional[List[Task]] = None,
+) -> List[Dict[str, Any]]:
+	# One serializer for the whole batch, fields are only built once. For
+	# updates instances has the task of each item, the rules comparing with
+	# the saved values (validate_status) see it as serializer.instance
+	serializer = TaskBulkSerializer(partial=partial, context={
+		'request': request,
+		'preloaded': get_preloaded_relations(items),
+	})
+	validated = []
+	errors = []
+	for index, item in enumerate(items):
+		serializer.instance = instances[index] if instances else None
+		try:
+			validated.append(serializer.run_validation(item))
+			errors.append({})
+		except ValidationError as exc:
+			validated.append(None)
+			errors.append(serializers.as_serializer_error(exc))
+	if any(errors):
+		raise ValidationError(errors)
+	return validated
+
+def insert_task_tags(tags_by_task: Dict[int, List[Tag]]) -> None:
+	Through = Task.tags.through
+	Through.objects.bulk_create([
+		Through(task_id=task_id, tag_id=tag.id)
+		for task_id, tags in tags_by_task.items()
+		for tag in tags
+	], batch_size=BULK_BATCH_SIZE)
+
+# Batch writes to existing tasks: only their creator or staff, like TaskAssignView.
+# creators is task id -> created_by_id
+def check_task_creators(request: Request, creators: Dict[int, int]) -> None:
+	if request.user.is_staff:
+		return
+	forbidden = sorted(pk for pk, creator_id in creators.items() if creator_id != request.user.pk)
+	if forbidden:
+		raise PermissionDenied(f'Forbidden for tasks: {forbidden}')
+
+def bulk_create_tasks(request: Request, items: Any) -> List[Task]:
+	tasks = []
+	tags_by_task = []
+	for data in validate_bulk_items(request, check_bulk_items(items)):
+		tags_by_task.append(data.pop('tags', []))
+		tasks.append(Task(created_by=request.user, **data))
+	with transaction.atomic():
+		Task.objects.bulk_create(tasks, batch_size=BULK_BATCH_SIZE)
+		insert_task_tags({task.id: tags for task, tags in zip(tasks, tags_by_task)})
+		invalidate_task_cache()
+		queue_task_events('created', [task.id for task in tasks])
+		record_activity('created', [task.id for task in tasks])
+	return tasks
+
+def bulk_update_tasks(request: Request, items: Any) -> List[Task]:
+	items = check_bulk_items(items)
+	ids = [to_pk(item.get('id')) if isinstance(item, dict) else None for item in items]
+	with transaction.atomic():
+		instances = Task.objects.select_for_update().in_bulk([pk for pk in ids if pk is not None])
+		errors = [{} if pk in instances else {'id': ['Task not found.']} for pk in ids]
+		if any(errors):
+			raise ValidationError(errors)
+		check_task_creators(request, {pk: task.created_by_id for pk, task in instances.items()})
+		fields = {'updated_at'}
+		tags_by_task = {}
+		now = timezone.now()
+		tasks = []
+		validated = validate_bulk_items(request, items, partial=True, instances=[instances[pk] for pk in ids])
+		for pk, data in zip(ids, validated):
+			task = instances[pk]
+			if 'tags' in data:
+				tags_by_task[pk] = data.pop('tags')
+			for name, value in data.items():
+				setattr(task, name, value)
+			fields.update(data)
+			# bulk_update() skips auto_now
+			task.updated_at = now
+			tasks.append(task)
+		Task.objects.bulk_update(tasks, sorted(fields), batch_size=BULK_BATCH_SIZE)
+		for task in tasks:
+			changes = pop_task_changes(task)
+			if changes:
+				record_activity('updated', [task.id], changes)
+		if tags_by_task:
+			replace_task_tags(tags_by_task)
+		invalidate_task_cache()
+		queue_task_events('updated', [task.id for task in tasks])
+	return tasks
+
+def replace_task_tags(tags_by_task: Dict[int, List[Tag]]) -> None:
+	Through = Task.tags.through
+	old_tags: Dict[int, Set[int]] = {task_id: set() for task_id in tags_by_task}
+	for task_id, tag_id in Through.objects.filter(task_id__in=tags_by_task.keys()).values_list('task_id', 'tag_id'):
+		old_tags[task_id].add(tag_id)
+	Through.objects.filter(task_id__in=tags_by_task.keys()).delete()
+	insert_task_tags(tags_by_task)
+	for task_id, tags in tags_by_task.items():
+		new_tags = {tag.id for tag in tags}
+		for change, tag_ids in (('added', new_tags - old_tags[task_id]), ('removed', old_tags[task_id] - new_tags)):
+			if tag_ids:
+				record_activity('tags', [task_id], {change: sorted(tag_ids)})
+
+def bulk_delete_tasks(request: Request, ids: Any) -> int:
+	ids = check_bulk_items(ids)
+	pks = [to_pk(pk) for pk in ids]
+	with transaction.atomic():
+		creators = dict(Task.objects.select_for_update().filter(pk__in=[pk for pk in pks if pk is not None]).values_list('pk', 'created_by_id'))
+		errors = [{} if pk in creators else {'id': ['Task not found.']} for pk in pks]
+		if any(errors):
+			raise ValidationError(errors)
+		check_task_creators(request, creators)
+		soft_delete_tasks(Task.objects.filter(pk__in=creators.keys()))
+	return len(creators)
+
+
+# BULK ASSIGNMENTS
+# {"task_ids": [...], "user_ids": [...]} assigns every user to every task,
+# {"assignments": [{"task_id": 1, "user_ids": [...]}, ...]} a user list per task
+
+def get_assignment_pairs(data: Any) -> List[Tuple[int, int]]:
+	if not isinstance(data, dict):
+		raise ValidationError({'detail': 'Expected an object.'})
+	if 'assignments' in data:
+		groups = data['assignments']
+		if not isinstance(groups, list):
+			raise ValidationError({'assignments': ['Expected a list of items.']})
+		groups = [
+			([group.get('task_id')], group.get('user_ids')) if isinstance(group, dict) else (None, None)
+			for group in groups
+		]
+	else:
+		groups = [(data.get('task_ids'), data.get('user_ids'))]
+	pairs = []
+	for task_ids, user_ids in groups:
+		if not isinstance(task_ids, list) or not isinstance(user_ids, list):
+			raise ValidationError({'detail': 'task_ids/task_id and user_ids are required.'})
+		task_pks = [to_pk(pk) for pk in task_ids]
+		user_pks = [to_pk(pk) for pk in user_ids]
+		if None in task_pks or None in user_pks:
+			raise ValidationError({'detail': 'Ids must be integers.'})
+		pairs.extend((task_pk, user_pk) for task_pk in task_pks for user_pk in user_pks)
+	pairs = list(dict.fromkeys(pairs))
+	if not pairs:
+		raise ValidationError({'detail': 'No assignments given.'})
+	if len(pairs) > BULK_MAX_ASSIGNMENTS:
+		raise ValidationError({'detail': f'Ensure there are no more than {BULK_MAX_ASSIGNMENTS} assignments.'})
+	return pairs
+
+def check_assignment_targets(request: Request, pairs: List[Tuple[int, int]]) -> None:
+	task_ids = {task_id for task_id, _ in pairs}
+	user_ids = {user_id for _, user_id in pairs}
+	# One query for every task, same rule as TaskAssignView: creator or staff
+	creators = dict(Task.objects.filter(pk__in=task_ids).values_list('pk', 'created_by_id'))
+	missing_tasks = sorted(task_ids - creators.keys())
+	missing_users = sorted(user_ids - set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True)))
+	if missing_tasks or missing_users:
+		raise ValidationError({
+			'task_ids': [f'Tasks not found: {missing_tasks}'] if missing_tasks else [],
+			'user_ids': [f'Users not found: {missing_users}'] if missing_users else [],
+		})
+	check_task_creators(request, creators)
+
+# Both report the pairs they actually wrote: with a concurrent request on the
+# same pairs, only one of them inserts (unique_combination) or deletes a row
+ASSIGN_SQL = """
+	INSERT INTO tasks_taskassignment (task_id, user_id, assigned_by_id, assigned_at)
+	SELECT pair.task_id, pair.user_id, %(assigned_by)s, %(now)s
+	FROM unnest(%(task_ids)s::bigint[], %(user_ids)s::bigint[]) AS pair (task_id, user_id)
+	ON CONFLICT (user_id, task_id) DO NOTHING
+	RETURNING task_id, user_id
+"""
+
+UNASSIGN_SQL = """
+	DELETE FROM tasks_taskassignment assignment
+	USING unnest(%(task_ids)s::bigint[], %(user_ids)s::bigint[]) AS pair (task_id, user_id)
+	WHERE assignment.task_id = pair.task_id AND assignment.user_id = pair.user_id
+	RETURNING assignment.task_id, assignment.user_id
+"""
+
+def write_assignments(sql: str, pairs: List[Tuple[int, int]], **params: Any) -> Set[Tuple[int, int]]:
+	with connection.cursor() as cursor:
+		cursor.execute(sql, {
+			'task_ids': [task_id for task_id, _ in pairs],
+			'user_ids': [user_id for _, user_id in pairs],
+			**params,
+		})
+		return set(cursor.fetchall())
+
+def format_pairs(pairs: List[Tuple[int, int]]) -> List[Dict[str, int]]:
+	return [{'task_id': task_id, 'user_id': user_id} for task_id, user_id in pairs]
+
+# No signals for either, the events and activity of every written pair are
+# sent here, like for a single assignment
+def bulk_assign_users(request: Request, data: Any) -> Dict[str, List[Dict[str, int]]]:
+	pairs = get_assignment_pairs(data)
+	check_assignment_targets(request, pairs)
+	with transaction.atomic():
+		created = write_assignments(ASSIGN_SQL, pairs, assigned_by=request.user.pk, now=timezone.now())
+		if created:
+			touch_tasks({task_id for task_id, _ in created})
+			invalidate_task_cache()
+		for task_id, user_id in pairs:
+			if (task_id, user_id) in created:
+				queue_task_events('assigned', [task_id], user=user_id)
+				record_activity('assigned', [task_id], {'user': user_id})
+	return {
+		'created': format_pairs([pair for pair in pairs if pair in created]),
+		'existing': format_pairs([pair for pair in pairs if pair not in created]),
+	}
+
+def bulk_unassign_users(request: Request, data: Any) -> Dict[str, List[Dict[str, int]]]:
+	pairs = get_assignment_pairs(data)
+	check_assignment_targets(request, pairs)
+	with transaction.atomic():
+		removed = write_assignments(UNASSIGN_SQL, pairs)
+		if removed:
+			touch_tasks({task_id for task_id, _ in removed})
+			invalidate_task_cache()
+		for task_id, user_id in pairs:
+			if (task_id, user_id) in removed:
+				queue_task_events('unassigned', [task_id], user=user_id)
+				record_activity('unassigned', [task_id], {'user': user_id})
+	return {
+		'removed': format_pairs([pair for pair in pairs if pair in removed]),
+		'missing': format_pairs([pair for pair in pairs if pair not in removed]),
+	}
@@ -0,0 +1,166 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import (
+	Any,
+	Awaitable,
+	Callable,
+	Dict,
+	Optional,
+	Tuple,
+)
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.request import Request
+from rest_framework.response import Response
+from apps.common.replicas import get_read_alias
+from apps.common.utils import on_commit_once
+
+logger = logging.getLogger(__name__)
+
+# Cached task responses are keyed on a generation counter that every Task,
+# TaskAssignment, Tag and User write (soft deletes included) bumps, see
+# signals.py. Old entries are never deleted, they just stop being read and expire
+GENERATION_KEY = 'tasks:generation'
+# When it last moved
+GENERATION_AT_KEY = 'tasks:generation:at'
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.05
+
+# Per process, like the rest of the metrics
+_stats = {'hits': 0, 'misses': 0, 'errors': 0}
+_stats_lock = threading.Lock()
+
+def record(event: str) -> None:
+	with _stats_lock:
+		_stats[event] += 1
+
+def get_cache_stats() -> Dict[str, Any]:
+	with _stats_lock:
+		stats = dict(_stats)
+	lookups = stats['hits'] + stats['misses']
+	stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+	# Only the worker that served the request, not the whole deployment
+	stats['scope'] = 'process'
+	stats['pid'] = os.getpid()
+	return stats
+
+def get_generation() -> int:
+	generation = cache.get(GENERATION_KEY)
+	if generation is None:
+		# Starts from the clock, so a flushed Redis never reuses an old generation
+		cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+		generation = cache.get(GENERATION_KEY)
+	return generation
+
+def bump_generation() -> None:
+	try:
+		cache.incr(GENERATION_KEY)
+		cache.set(GENERATION_AT_KEY, time.time(), timeout=None)
+	except ValueError:
+		get_generation()
+	except Exception:
+		logger.exception('Could not bump the task cache generation')
+
+def is_cacheable_read() -> bool:
+	# A replica may not have the write that moved the generation yet, and
+	# its rows would be cached as the new ones. Once the replica lag limit has
+	# passed since then it has them
+	if get_read_alias() is None:
+		return True
+	bumped_at = cache.get(GENERATION_AT_KEY)
+	return bumped_at is None or time.time() - bumped_at > settings.DATABASE_REPLICA_MAX_LAG
+
+# After commit, so a concurrent read can't cache the old rows under the new
+# generation. Once per transaction, however many rows it touched
+def invalidate_task_cache() -> None:
+	on_commit_once('task_cache', lambda items: bump_generation())
+
+def get_cache_key(request: Request, view_name: str, kwargs: Dict[str, Any]) -> str:
+	params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+	raw = repr((params, sorted(kwargs.items())))
+	digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+	return f'tasks:{get_generation()}:{view_name}:{request.user.pk}:{digest}'
+
+def wait_for_entry(key: str) -> Optional[Any]:
+	deadline = time.monotonic() + LOCK_WAIT
+	while time.monotonic() < deadline:
+		time.sleep(LOCK_POLL_INTERVAL)
+		data = cache.get(key)
+		if data is not None:
+			return data
+	return None
+
+def get_entry(request: Request, view_name: str, kwargs: Dict[str, Any]) -> Tuple[str, Optional[Any]]:
+	key = get_cache_key(request, view_name, kwargs)
+	data = cache.get(key)
+	# Only one worker fills an entry, the others wait for it (stampede protection)
+	if data is None and not cache.add(f'{key}:lock', 1, LOCK_TIMEOUT):
+		data = wait_for_entry(key)
+	return key, data
+
+def fill_entry(key: str, response: Optional[Response], timeout: int) -> None:
+	# response is None when the handler raised, the lock goes anyway
+	try:
+		if response is not None and response.status_code == 200 and is_cacheable_read():
+			cache.set(key, response.data, timeout)
+	finally:
+		cache.delete(f'{key}:lock')
+
+def get_hit_response(data: Any) -> Response:
+	record('hits')
+	response = Response(data)
+	response['X-Cache'] = 'HIT'
+	return response
+
+# Per user response cache for GET on task views, TASK_CACHE_TIMEOUT = 0 turns it off
+class CachedResponseMixin:
+	def cached_response(self, request: Request, handler: Callable[..., Response], *args, **kwargs) -> Response:
+		timeout = getattr(settings, 'TASK_CACHE_TIMEOUT', 0)
+		if not timeout:
+			return handler(request, *args, **kwargs)
+		try:
+			key, data = get_entry(request, type(self).__name__, kwargs)
+		except Exception:
+			logger.exception('Task cache unavailable')
+			record('errors')
+			return handler(request, *args, **kwargs)
+		if data is not None:
+			return get_hit_response(data)
+
+		record('misses')
+		response = None
+		try:
+			response = handler(request, *args, **kwargs)
+		finally:
+			fill_entry(key, response, timeout)
+		response['X-Cache'] = 'MISS'
+		return response
+
+	# Same for async handlers. The cache calls run in a thread, like
+	# Django's own async cache methods do
+	async def acached_response(self, request: Request, handler: Callable[..., Awaitable[Response]], *args, **kwargs) -> Response:
+		timeout = getattr(settings, 'TASK_CACHE_TIMEOUT', 0)
+		if not timeout:
+			return await handler(request, *args, **kwargs)
+		try:
+			key, data = await sync_to_async(get_entry)(request, type(self).__name__, kwargs)
+		except Exception:
+			logger.exception('Task cache unavailable')
+			record('errors')
+			return await handler(request, *args, **kwargs)
+		if data is not None:
+			return get_hit_response(data)
+
+		record('misses')
+		response = None
+		try:
+			response = await handler(request, *args, **kwargs)
+		finally:
+			await sync_to_async(fill_entry)(key, response, timeout)
+		response['X-Cache'] = 'MISS'
+		return response
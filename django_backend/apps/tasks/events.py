@@ -0,0 +1,329 @@
+import json
+import time
+import asyncio
+import logging
+from http.cookies import SimpleCookie
+from importlib import import_module
+from typing import (
+	Any,
+	Dict,
+	Iterable,
+	List,
+	Optional,
+	Set,
+	Tuple,
+)
+from urllib.parse import parse_qs
+import redis
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import HttpRequest
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from apps.auth_jwt.services import get_session_user
+from apps.users.models import User
+from apps.common.utils import on_commit_once
+from .models import (
+	STATUS_CHOICES,
+	PRIORITY_CHOICES,
+	TaskAssignmentWithArchive,
+	TaskTagWithArchive,
+	TaskWithArchive,
+)
+
+logger = logging.getLogger(__name__)
+
+# Push channel for task changes: writes publish small events through Redis
+# pub/sub after commit, every ASGI process keeps ONE subscription and fans the
+# events out in memory to its open Server-Sent Events streams. Events say what
+# changed, clients fetch the data (detail with ETag, or /api/tasks/changes)
+
+EVENTS_CHANNEL = 'tasks:events'
+TASK_EVENTS_PATH = '/api/tasks/events'
+# A burst of writes is sent as one message per stream
+COALESCE_SECONDS = 0.25
+# Keeps proxies from closing idle streams
+HEARTBEAT_SECONDS = 15
+# A stream that can't keep up gets a single resync event instead
+MAX_PENDING_EVENTS = 1000
+RECONNECT_SECONDS = 1
+
+_client = None
+
+def get_client() -> redis.Redis:
+	global _client
+	if _client is None:
+		_client = redis.Redis.from_url(settings.TASK_EVENTS_URL)
+	return _client
+
+
+# PUBLISHING
+
+def queue_task_events(kind: str, task_ids: Iterable[int], **fields: Any) -> None:
+	# Collected for the whole transaction and published once after commit,
+	# nothing is sent for a rollback
+	events = [dict(fields, event=kind, task=task_id) for task_id in task_ids]
+	if not events:
+		return
+	on_commit_once('task_events', publish_task_events, events)
+
+def publish_task_events(events: List[Dict[str, Any]]) -> None:
+	try:
+		client = get_client()
+		# Nobody listening, skip the query that fills the events in
+		if not client.pubsub_numsub(EVENTS_CHANNEL)[0][1]:
+			return
+		message = json.dumps({'events': describe_events(events)}, cls=DjangoJSONEncoder)
+		client.publish(EVENTS_CHANNEL, message)
+	except Exception:
+		logger.exception('Could not publish task events')
+
+def describe_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+	# Adds what streams filter on (status, priority, creator, assignees, tags),
+	# three queries for the whole batch. Deleted rows keep what the event had.
+	# Both tiers, archived and restored tasks are described too
+	task_ids = {event['task'] for event in events}
+	tasks = {
+		row['id']: row
+		for row in TaskWithArchive.all_objects.filter(pk__in=task_ids).values('id', 'status', 'priority', 'created_by_id', 'is_deleted')
+	}
+	assignees: Dict[int, List[int]] = {}
+	for task_id, user_id in TaskAssignmentWithArchive.objects.filter(task_id__in=task_ids).order_by('user_id').values_list('task_id', 'user_id'):
+		assignees.setdefault(task_id, []).append(user_id)
+	tags: Dict[int, List[int]] = {}
+	for task_id, tag_id in TaskTagWithArchive.objects.filter(task_id__in=task_ids).order_by('tag_id').values_list('task_id', 'tag_id'):
+		tags.setdefault(task_id, []).append(tag_id)
+
+	described = {}
+	for event in events:
+		row = tasks.get(event['task'])
+		if row:
+			if row['is_deleted']:
+				event['event'] = 'deleted'
+			event.update(
+				status=row['status'],
+				priority=row['priority'],
+				created_by=row['created_by_id'],
+				assigned_to=assignees.get(row['id'], []),
+				tags=tags.get(row['id'], []),
+			)
+		# Same event twice in a batch (signal + service) is sent once
+		described[(event['event'], event['task'], event.get('user'))] = event
+	return list(described.values())
+
+
+# SUBSCRIBING
+
+class EventFilter:
+	# ?scope=mine (created by or assigned to me), ?task=1,2, ?status=, ?priority=,
+	# ?tags=1,2 (any of them). Events that aren't described can't be filtered
+	# on a field, they go to everybody
+	def __init__(self, user_id: int, params: Dict[str, List[str]]):
+		self.user_id = user_id
+		self.mine = get_param(params, 'scope', 'all') == 'mine'
+		self.tasks = get_ids(params, 'task')
+		self.tags = get_ids(params, 'tags')
+		self.status = get_choices(params, 'status', STATUS_CHOICES)
+		self.priority = get_choices(params, 'priority', PRIORITY_CHOICES)
+		if get_param(params, 'scope', 'all') not in ('all', 'mine'):
+			raise ValueError('scope must be all or mine')
+
+	def matches(self, event: Dict[str, Any]) -> bool:
+		if event['event'] == 'resync':
+			return True
+		if self.tasks and event['task'] not in self.tasks:
+			return False
+		if 'status' not in event:
+			return not self.mine
+		if self.mine and self.user_id != event['created_by'] and self.user_id not in event['assigned_to'] and self.user_id != event.get('user'):
+			return False
+		if self.status and event['status'] not in self.status:
+			return False
+		if self.priority and event['priority'] not in self.priority:
+			return False
+		return not self.tags or bool(self.tags.intersection(event['tags']))
+
+def get_param(params: Dict[str, List[str]], name: str, default: str) -> str:
+	return params.get(name, [default])[-1]
+
+def get_ids(params: Dict[str, List[str]], name: str) -> Set[int]:
+	values = [value for raw in params.get(name, []) for value in raw.split(',') if value]
+	try:
+		return {int(value) for value in values}
+	except ValueError:
+		raise ValueError(f'{name} must be a list of ids')
+
+def get_choices(params: Dict[str, List[str]], name: str, choices: List[Tuple[str, str]]) -> Set[str]:
+	values = {value for raw in params.get(name, []) for value in raw.split(',') if value}
+	unknown = values - {key for key, _ in choices}
+	if unknown:
+		raise ValueError(f'Unknown {name}: {", ".join(sorted(unknown))}')
+	return values
+
+class Subscriber:
+	def __init__(self, event_filter: EventFilter):
+		self.filter = event_filter
+		# Coalesced by task (and user for assignments), the last event wins
+		self.pending: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+		self.overflow = False
+		self.ready = asyncio.Event()
+
+	def push(self, events: List[Dict[str, Any]]) -> None:
+		for event in events:
+			if self.overflow or not self.filter.matches(event):
+				continue
+			key = (event['task'], event.get('user')) if event['event'] in ('assigned', 'unassigned') else (event.get('task'),)
+			previous = self.pending.get(key)
+			if previous and previous['event'] == 'created' and event['event'] == 'updated':
+				event = dict(event, event='created')
+			self.pending[key] = event
+			self.ready.set()
+		if len(self.pending) > MAX_PENDING_EVENTS:
+			self.overflow, self.pending = True, {}
+
+	def drain(self) -> List[Dict[str, Any]]:
+		events = [{'event': 'resync'}] if self.overflow else list(self.pending.values())
+		self.pending, self.overflow = {}, False
+		self.ready.clear()
+		return events
+
+class TaskEventHub:
+	def __init__(self):
+		self.subscribers: Set[Subscriber] = set()
+		self.listener: Optional[asyncio.Task] = None
+
+	def subscribe(self, subscriber: Subscriber) -> None:
+		self.subscribers.add(subscriber)
+		if self.listener is None or self.listener.done():
+			self.listener = asyncio.ensure_future(self.listen())
+
+	def unsubscribe(self, subscriber: Subscriber) -> None:
+		self.subscribers.discard(subscriber)
+
+	def broadcast(self, events: List[Dict[str, Any]]) -> None:
+		for subscriber in list(self.subscribers):
+			subscriber.push(events)
+
+	async def listen(self) -> None:
+		reconnecting = False
+		while True:
+			client = aioredis.Redis.from_url(settings.TASK_EVENTS_URL)
+			try:
+				async with client.pubsub() as pubsub:
+					await pubsub.subscribe(EVENTS_CHANNEL)
+					if reconnecting:
+						# Whatever was published meanwhile is lost
+						self.broadcast([{'event': 'resync'}])
+						reconnecting = False
+					async for message in pubsub.listen():
+						if message['type'] == 'message':
+							self.broadcast(json.loads(message['data'])['events'])
+			except asyncio.CancelledError:
+				raise
+			except Exception:
+				logger.exception('Task events subscription lost, reconnecting')
+				reconnecting = True
+				await asyncio.sleep(RECONNECT_SECONDS)
+			finally:
+				await client.aclose()
+
+hub = TaskEventHub()
+
+
+# SERVER-SENT EVENTS
+# Plain ASGI instead of a Django view: Django 4.2 doesn't notice a client going
+# away during a streaming response, so every closed tab would keep its
+# subscriber. See config/asgi.py for the routing
+
+def get_stream_user_id(headers: Dict[str, str]) -> Optional[int]:
+	# Bearer token like the API, or the session of the HTML pages
+	close_old_connections()
+	try:
+		if headers.get('authorization'):
+			auth = JWTAuthentication()
+			raw_token = auth.get_raw_token(headers['authorization'].encode('latin-1'))
+			if raw_token is None:
+				return None
+			return auth.get_user(auth.get_validated_token(raw_token)).pk
+		cookie = SimpleCookie(headers.get('cookie', '')).get(settings.SESSION_COOKIE_NAME)
+		if cookie is None:
+			return None
+		request = HttpRequest()
+		request.session = import_module(settings.SESSION_ENGINE).SessionStore(cookie.value)
+		user = get_session_user(request)
+		if user is None:
+			return None
+		user_id = user.pk
+		# Tokens may have been refreshed
+		if request.session.modified:
+			request.session.save()
+		return user_id
+	except (InvalidToken, AuthenticationFailed, User.DoesNotExist):
+		return None
+	finally:
+		close_old_connections()
+
+async def send_json(send, status: int, data: Dict[str, Any]) -> None:
+	await send({
+		'type': 'http.response.start',
+		'status': status,
+		'headers': [(b'content-type', b'application/json')],
+	})
+	await send({'type': 'http.response.body', 'body': json.dumps(data).encode('utf-8')})
+
+async def wait_for_disconnect(receive) -> None:
+	while (await receive())['type'] != 'http.disconnect':
+		pass
+
+def format_event(events: List[Dict[str, Any]]) -> bytes:
+	data = json.dumps({'events': events, 'sent_at': time.time()}, cls=DjangoJSONEncoder)
+	return f'event: tasks\ndata: {data}\n\n'.encode('utf-8')
+
+async def task_events_app(scope, receive, send) -> None:
+	if scope['method'] != 'GET':
+		await send_json(send, 405, {'detail': f'Method "{scope["method"]}" not allowed.'})
+		return
+	headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+	user_id = await sync_to_async(get_stream_user_id, thread_sensitive=False)(headers)
+	if user_id is None:
+		await send_json(send, 401, {'detail': 'Authentication credentials were not provided or are invalid.'})
+		return
+	try:
+		event_filter = EventFilter(user_id, parse_qs(scope['query_string'].decode('latin-1')))
+	except ValueError as exc:
+		await send_json(send, 400, {'detail': str(exc)})
+		return
+
+	await send({
+		'type': 'http.response.start',
+		'status': 200,
+		'headers': [
+			(b'content-type', b'text/event-stream'),
+			(b'cache-control', b'no-cache'),
+			(b'x-accel-buffering', b'no'),
+		],
+	})
+	subscriber = Subscriber(event_filter)
+	hub.subscribe(subscriber)
+	disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+	try:
+		await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+		while not disconnected.done():
+			ready = asyncio.ensure_future(subscriber.ready.wait())
+			await asyncio.wait([ready, disconnected], timeout=HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+			ready.cancel()
+			if disconnected.done():
+				break
+			if not subscriber.ready.is_set():
+				await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+				continue
+			# Let the rest of a burst arrive, then send it as one event
+			await asyncio.sleep(COALESCE_SECONDS)
+			await send({'type': 'http.response.body', 'body': format_event(subscriber.drain()), 'more_body': True})
+	finally:
+		hub.unsubscribe(subscriber)
+		disconnected.cancel()
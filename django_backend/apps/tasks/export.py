@@ -0,0 +1,104 @@
+import csv
+import json
+from typing import (
+	Any,
+	AsyncIterator,
+	Dict,
+	Iterator,
+)
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from .serializer import TaskRowSerializer
+from .services import (
+	filter_tasks,
+	get_task_model,
+	get_task_rows,
+)
+
+# EXPORT
+# Rows stream from a server-side cursor (iterator) as plain values, tags and
+# assignees aggregated into arrays by the same query, so memory stays flat
+# and the first row goes out before the last one is read
+
+EXPORT_FORMATS = {
+	'csv': 'text/csv',
+	'ndjson': 'application/x-ndjson',
+}
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FIELDS = [
+	'id', 'title', 'description', 'status', 'priority', 'due_date',
+	'estimated_hours', 'actual_hours', 'created_by', 'parent_task',
+	'metadata', 'created_at', 'updated_at', 'is_archived', 'is_deleted',
+	'assigned_to', 'tags',
+]
+
+# csv.writer writes into this and hands the line back
+class Echo:
+	def write(self, value: str) -> str:
+		return value
+
+def get_export_queryset(request: Request) -> QuerySet:
+	# Same filters and search as GET /api/tasks/, raises ValidationError
+	queryset = filter_tasks(request, get_task_model(request).objects.all())
+	if not queryset.query.order_by:
+		queryset = queryset.order_by('id')
+	# Rows are read after the view returned, pinned to the database it chose
+	return get_task_rows(queryset.using(queryset.db))
+
+def get_export_row(row: Dict[str, Any]) -> Dict[str, Any]:
+	return {field: row[TaskRowSerializer.row_keys.get(field, field)] for field in EXPORT_FIELDS}
+
+def iterate_export_rows(queryset: QuerySet) -> Iterator[Dict[str, Any]]:
+	# Inside a transaction the server-side cursor streams. Outside of one
+	# Django declares it WITH HOLD and Postgres builds the whole result first
+	with transaction.atomic(using=queryset.db):
+		for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+			yield get_export_row(row)
+
+def export_csv(queryset: QuerySet) -> Iterator[str]:
+	writer = csv.writer(Echo())
+	yield writer.writerow(EXPORT_FIELDS)
+	for row in iterate_export_rows(queryset):
+		row['metadata'] = json.dumps(row['metadata'], cls=DjangoJSONEncoder)
+		row['assigned_to'] = ';'.join(map(str, row['assigned_to']))
+		row['tags'] = ';'.join(map(str, row['tags']))
+		for field in ('due_date', 'created_at', 'updated_at'):
+			row[field] = row[field].isoformat()
+		yield writer.writerow(row.values())
+
+def export_ndjson(queryset: QuerySet) -> Iterator[str]:
+	for row in iterate_export_rows(queryset):
+		yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+def read_export_chunk(lines: Iterator[str]) -> str:
+	return ''.join(islice(lines, EXPORT_CHUNK_SIZE))
+
+async def aiterate_export(lines: Iterator[str]) -> AsyncIterator[str]:
+	# Under ASGI, StreamingHttpResponse reads a sync iterator to the end in a
+	# thread before sending anything (Django 4.2). Here each chunk of lines is
+	# read in its own hop to the request's thread (thread_sensitive), the one
+	# holding the transaction and the server-side cursor
+	read = sync_to_async(read_export_chunk)
+	try:
+		while True:
+			chunk = await read(lines)
+			if not chunk:
+				break
+			yield chunk
+	finally:
+		# Ends the transaction on that thread too, also when the client left
+		await sync_to_async(lines.close)()
+
+def export_tasks(request: Request, export_format: str) -> Iterator[str]:
+	if export_format not in EXPORT_FORMATS:
+		raise ValidationError({'format': f'Must be one of: {", ".join(EXPORT_FORMATS)}.'})
+	# Built now so filter errors are raised before the response starts
+	queryset = get_export_queryset(request)
+	if export_format == 'csv':
+		return export_csv(queryset)
+	return export_ndjson(queryset)
@@ -0,0 +1,109 @@
+import re
+import json
+from typing import (
+	Any,
+	List,
+	Mapping,
+)
+from django.contrib.postgres.search import (
+	SearchQuery,
+	SearchRank,
+	TrigramWordSimilarity,
+)
+from django.db.models import (
+	F,
+	Q,
+	QuerySet,
+)
+from django.db.models.fields.json import KeyTransform
+from django.db.models.lookups import IsNull
+from django_filters import rest_framework as django_filters
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from .models import (
+	METADATA_INDEXED_KEYS,
+	Task,
+)
+from .pagination import TaskKeysetPagination
+
+# Must match the text search configuration used by the triggers in migration 0005
+SEARCH_CONFIG = 'english'
+
+METADATA_PREFIX = 'metadata__'
+METADATA_HAS_KEY = 'has_key'
+
+def parse_metadata_value(value: str) -> List[Any]:
+	# Query strings have no types: ?metadata__sprint=12 matches 12 and "12".
+	# JSON arrays and objects match by containment, ?metadata__labels=["infra"]
+	try:
+		parsed = json.loads(value)
+	except ValueError:
+		return [value]
+	return [value] if parsed == value else [value, parsed]
+
+def filter_metadata(queryset: QuerySet, params: Mapping[str, str]) -> QuerySet:
+	# ?metadata__<key>=<value> and ?metadata__<key>__<subkey>=<value> become
+	# metadata @> '{"key": value}', served by the jsonb_path_ops GIN index.
+	# Keys in METADATA_INDEXED_KEYS compare metadata -> 'key' instead, served by
+	# their btree index. ?metadata__has_key=<key>,<key> needs all the keys,
+	# only the indexed ones can use an index for it
+	for param, value in params.items():
+		if not param.startswith(METADATA_PREFIX):
+			continue
+		path = param[len(METADATA_PREFIX):].split('__')
+		if not all(path):
+			raise ValidationError({param: ['Invalid metadata key.']})
+
+		if path == [METADATA_HAS_KEY]:
+			for key in filter(None, value.split(',')):
+				if key in METADATA_INDEXED_KEYS:
+					queryset = queryset.filter(IsNull(KeyTransform(key, 'metadata'), False))
+				else:
+					queryset = queryset.filter(metadata__has_key=key)
+			continue
+
+		values = parse_metadata_value(value)
+		if len(path) == 1 and path[0] in METADATA_INDEXED_KEYS and all(isinstance(v, (str, int, float)) for v in values):
+			queryset = queryset.filter(**{f'metadata__{path[0]}__in': values})
+			continue
+		condition = Q()
+		for document in values:
+			for key in reversed(path):
+				document = {key: document}
+			condition |= Q(metadata__contains=document)
+		queryset = queryset.filter(condition)
+	return queryset
+
+# ?status= ?priority= ?assigned_to= ?created_by= ?tags= and ?metadata__<key>=
+class TaskFilter(django_filters.FilterSet):
+	class Meta:
+		model = Task
+		fields = ['status', 'priority', 'assigned_to', 'created_by', 'tags']
+
+	def filter_queryset(self, queryset: QuerySet) -> QuerySet:
+		return filter_metadata(super().filter_queryset(queryset), self.data)
+
+def build_prefix_tsquery(terms: List[str]) -> str:
+	# Every word must match as a prefix: "dep fail" -> dep:* & fail:*
+	words = [word for term in terms for word in re.findall(r'\w+', term)]
+	return ' & '.join(f'{word}:*' for word in words)
+
+# ?search= over the GIN indexed search_vector (title, tag names, description),
+# falling back to trigram similarity on the title for typos and partial words.
+# Ranked by relevance, except with ?pagination=cursor: keyset pages are in
+# (?ordering=, id) order, so the rank isn't computed there
+class TaskSearchFilter(filters.SearchFilter):
+	def filter_queryset(self, request: Request, queryset: QuerySet, view: Any) -> QuerySet:
+		terms = self.get_search_terms(request)
+		tsquery = build_prefix_tsquery(terms)
+		if not tsquery:
+			return queryset
+		text = ' '.join(terms)
+		query = SearchQuery(tsquery, search_type='raw', config=SEARCH_CONFIG)
+		queryset = queryset.filter(Q(search_vector=query) | Q(title__trigram_word_similar=text))
+		if TaskKeysetPagination.is_requested(request):
+			return queryset
+		return queryset.annotate(
+			search_rank=SearchRank(F('search_vector'), query) + TrigramWordSimilarity(text, 'title'),
+		).order_by('-search_rank', '-id')
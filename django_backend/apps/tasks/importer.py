@@ -0,0 +1,418 @@
+import csv
+import time
+from typing import (
+	Any,
+	Dict,
+	IO,
+	List,
+	Optional,
+	Tuple,
+)
+from django.db import (
+	connection,
+	transaction,
+)
+from .models import (
+	STATUS_CHOICES,
+	PRIORITY_CHOICES,
+)
+from .cache import invalidate_task_cache
+
+# Bulk import for manage.py import_tasks
+# Files are COPYed as text into temporary staging tables, checked with one
+# set-based query per rule, then upserted with INSERT ... SELECT. Python
+# never looks at individual rows, so the cost is a few statements per file.
+# Nothing is written if any row is invalid, same as the bulk endpoints
+
+COPY_BLOCK_SIZE = 1 << 20
+MAX_REPORTED_ERRORS = 20
+
+# Same columns as the export (export.EXPORT_FIELDS), but created_by,
+# assigned_to and tags are usernames and tag names, lists separated by ';'
+# in CSV or arrays in NDJSON. Rows with an id update that task
+TASK_COLUMNS = [
+	'id', 'title', 'description', 'status', 'priority', 'due_date',
+	'estimated_hours', 'actual_hours', 'created_by', 'parent_task',
+	'metadata', 'created_at', 'updated_at', 'is_archived', 'is_deleted',
+	'assigned_to', 'tags',
+]
+TASK_REQUIRED = ['title', 'description', 'status', 'priority', 'due_date', 'estimated_hours', 'created_by']
+# File column: (tasks_task column, value from the staging row). Only columns
+# present in the file are written, so an update keeps the others
+TASK_FIELDS = {
+	'title': ('title', 'title'),
+	'description': ('description', 'description'),
+	'status': ('status', 'status'),
+	'priority': ('priority', 'priority'),
+	'due_date': ('due_date', 'due_date::timestamptz'),
+	'estimated_hours': ('estimated_hours', 'estimated_hours::numeric'),
+	'actual_hours': ('actual_hours', 'actual_hours::numeric'),
+	'created_by': ('created_by_id', 'created_by_id'),
+	'parent_task': ('parent_task_id', 'parent_task::bigint'),
+	'metadata': ('metadata', "coalesce(metadata::jsonb, '{}')"),
+	'is_archived': ('is_archived', 'coalesce(is_archived::boolean, false)'),
+	'is_deleted': ('is_deleted', 'coalesce(is_deleted::boolean, false)'),
+}
+# New rows still need the NOT NULL columns missing from the file
+TASK_DEFAULTS = {
+	'metadata': "'{}'::jsonb",
+	'is_archived': 'false',
+	'is_deleted': 'false',
+}
+ASSIGNMENT_COLUMNS = ['task', 'user', 'assigned_by']
+ASSIGNMENT_REQUIRED = ['task', 'user']
+TAG_COLUMNS = ['name']
+TAG_REQUIRED = ['name']
+
+SOURCES = {
+	'tasks': (TASK_COLUMNS, TASK_REQUIRED),
+	'assignments': (ASSIGNMENT_COLUMNS, ASSIGNMENT_REQUIRED),
+	'tags': (TAG_COLUMNS, TAG_REQUIRED),
+}
+
+# Casts that can't be checked with a regex, one subtransaction per value
+SETUP_SQL = """
+CREATE FUNCTION pg_temp.is_timestamptz(value text) RETURNS boolean AS $$
+BEGIN
+	PERFORM value::timestamptz;
+	RETURN true;
+EXCEPTION WHEN others THEN
+	RETURN false;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION pg_temp.is_jsonb(value text) RETURNS boolean AS $$
+BEGIN
+	PERFORM value::jsonb;
+	RETURN true;
+EXCEPTION WHEN others THEN
+	RETURN false;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TEMP TABLE import_errors (
+	source text, row_num bigint, field text, value text, message text
+) ON COMMIT DROP;
+"""
+
+BOOLEAN_VALUES = "('true', 'false', 't', 'f', '1', '0', 'yes', 'no')"
+
+# Ids of tasks moved to the archive (jobs.archive_tasks), checked on their own
+# so the message says to restore them
+def is_archived_task(column: str) -> str:
+	return rf"""CASE WHEN {column} ~ '^\d{{1,18}}$'
+		THEN EXISTS (SELECT 1 FROM tasks_task_archive WHERE id = staged.{column}::bigint)
+		ELSE false END"""
+
+ARCHIVED_MESSAGE = 'Task is archived, restore it first.'
+
+# (source, field, condition on the staging row, message). Soft deleted users
+# count as missing, like everywhere else in the API
+VALIDATION_RULES = [
+	('tasks', 'id', r"id !~ '^\d{1,18}$'", 'A valid integer is required.'),
+	('tasks', 'title', "btrim(title) = ''", 'This field may not be blank.'),
+	('tasks', 'title', 'length(title) > 200', 'Ensure this field has no more than 200 characters.'),
+	('tasks', 'description', "btrim(description) = ''", 'This field may not be blank.'),
+	('tasks', 'status', 'status <> ALL(%(statuses)s)', 'Not a valid choice.'),
+	('tasks', 'priority', 'priority <> ALL(%(priorities)s)', 'Not a valid choice.'),
+	('tasks', 'due_date', 'NOT pg_temp.is_timestamptz(due_date)', 'Datetime has wrong format.'),
+	('tasks', 'created_at', 'NOT pg_temp.is_timestamptz(created_at)', 'Datetime has wrong format.'),
+	('tasks', 'estimated_hours', r"estimated_hours !~ '^-?\d{1,3}(\.\d{1,2})?$'", 'A valid number with at most 5 digits and 2 decimal places is required.'),
+	('tasks', 'actual_hours', r"actual_hours !~ '^-?\d{1,3}(\.\d{1,2})?$'", 'A valid number with at most 5 digits and 2 decimal places is required.'),
+	('tasks', 'metadata', 'NOT pg_temp.is_jsonb(metadata)', 'Value must be valid JSON.'),
+	('tasks', 'is_archived', f'lower(is_archived) NOT IN {BOOLEAN_VALUES}', 'Must be a valid boolean.'),
+	('tasks', 'is_deleted', f'lower(is_deleted) NOT IN {BOOLEAN_VALUES}', 'Must be a valid boolean.'),
+	('tasks', 'id', "id IN (SELECT id FROM import_tasks WHERE id IS NOT NULL GROUP BY id HAVING count(*) > 1)", 'Duplicated id in the file.'),
+	# Archived tasks keep their ids, a hot row with the same one would show twice
+	# with ?include_archived=true and block the restore
+	('tasks', 'id', is_archived_task('id'), ARCHIVED_MESSAGE),
+	('tasks', 'created_by', 'NOT EXISTS (SELECT 1 FROM users_user WHERE username = staged.created_by AND NOT is_deleted)', 'User does not exist.'),
+	('tasks', 'parent_task', r"""CASE WHEN parent_task !~ '^\d{1,18}$' THEN true ELSE NOT (
+		EXISTS (SELECT 1 FROM tasks_task WHERE id = staged.parent_task::bigint)
+		OR EXISTS (SELECT 1 FROM tasks_task_archive WHERE id = staged.parent_task::bigint)
+		OR EXISTS (SELECT 1 FROM import_tasks WHERE id = staged.parent_task)
+	) END""", 'Task does not exist.'),
+	('tasks', 'parent_task', is_archived_task('parent_task'), ARCHIVED_MESSAGE),
+	('tasks', 'assigned_to', """EXISTS (
+		SELECT 1 FROM unnest(string_to_array(assigned_to, ';')) item(value)
+		WHERE NOT EXISTS (SELECT 1 FROM users_user WHERE users_user.username = btrim(item.value) AND NOT users_user.is_deleted)
+	)""", 'User does not exist.'),
+	('tasks', 'tags', """EXISTS (
+		SELECT 1 FROM unnest(string_to_array(tags, ';')) item(value) WHERE length(btrim(item.value)) > 50
+	)""", 'Tag names have at most 50 characters.'),
+	('assignments', 'task', r"""CASE WHEN task !~ '^\d{1,18}$' THEN true ELSE NOT (
+		EXISTS (SELECT 1 FROM tasks_task WHERE id = staged.task::bigint)
+		OR EXISTS (SELECT 1 FROM tasks_task_archive WHERE id = staged.task::bigint)
+		OR EXISTS (SELECT 1 FROM import_tasks WHERE id = staged.task)
+	) END""", 'Task does not exist.'),
+	('assignments', 'task', is_archived_task('task'), ARCHIVED_MESSAGE),
+	('assignments', 'user', 'NOT EXISTS (SELECT 1 FROM users_user WHERE username = staged."user" AND NOT is_deleted)', 'User does not exist.'),
+	('assignments', 'assigned_by', 'NOT EXISTS (SELECT 1 FROM users_user WHERE username = staged.assigned_by AND NOT is_deleted)', 'User does not exist.'),
+	('tags', 'name', "btrim(name) = ''", 'This field may not be blank.'),
+	('tags', 'name', 'length(btrim(name)) > 50', 'Ensure this field has no more than 50 characters.'),
+]
+
+class TaskImportError(Exception):
+	pass
+
+def quote(name: str) -> str:
+	return connection.ops.quote_name(name)
+
+def get_file_format(path: str, file_format: Optional[str]) -> str:
+	if file_format:
+		return file_format
+	return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+def create_staging_table(cursor, source: str) -> None:
+	columns, _ = SOURCES[source]
+	definition = ', '.join(f'{quote(column)} text' for column in columns)
+	cursor.execute(f'CREATE TEMP TABLE import_{source} (row_num bigint GENERATED ALWAYS AS IDENTITY, {definition}) ON COMMIT DROP')
+
+def copy_stream(cursor, sql: str, stream: IO[bytes]) -> None:
+	with cursor.copy(sql) as copy:
+		while block := stream.read(COPY_BLOCK_SIZE):
+			copy.write(block)
+
+def load_csv(cursor, source: str, stream: IO[bytes]) -> List[str]:
+	columns, required = SOURCES[source]
+	header = next(csv.reader([stream.readline().decode('utf-8-sig')]), [])
+	unknown = [column for column in header if column not in columns]
+	if unknown:
+		raise TaskImportError(f'{source}: unknown columns {", ".join(unknown)}')
+	missing = [column for column in required if column not in header]
+	if missing:
+		raise TaskImportError(f'{source}: missing columns {", ".join(missing)}')
+	# Empty unquoted fields are NULL, the rest is kept as text for the checks
+	column_list = ', '.join(quote(column) for column in header)
+	copy_stream(cursor, f'COPY import_{source} ({column_list}) FROM STDIN WITH (FORMAT csv)', stream)
+	return header
+
+def load_ndjson(cursor, source: str, stream: IO[bytes]) -> List[str]:
+	columns, _ = SOURCES[source]
+	# Lines go in as they are: quote and delimiter are bytes JSON never contains
+	cursor.execute('CREATE TEMP TABLE import_raw (row_num bigint GENERATED ALWAYS AS IDENTITY, doc text) ON COMMIT DROP')
+	copy_stream(cursor, "COPY import_raw (doc) FROM STDIN WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')", stream)
+	cursor.execute("""
+		DELETE FROM import_raw WHERE doc IS NULL OR btrim(doc) = '';
+		INSERT INTO import_errors (source, row_num, field, value, message)
+		SELECT %s, row_num, NULL, left(doc, 200), 'Invalid JSON object.'
+		FROM import_raw
+		WHERE NOT (pg_temp.is_jsonb(doc) AND jsonb_typeof(doc::jsonb) = 'object');
+	""", [source])
+	# Arrays are joined like the CSV lists, objects kept as JSON text
+	values = ', '.join(
+		f"""CASE WHEN jsonb_typeof(doc -> '{column}') = 'array'
+			THEN (SELECT string_agg(item, ';') FROM jsonb_array_elements_text(doc -> '{column}') item)
+			ELSE doc ->> '{column}'
+		END"""
+		for column in columns
+	)
+	column_list = ', '.join(quote(column) for column in columns)
+	cursor.execute(f"""
+		INSERT INTO import_{source} (row_num, {column_list}) OVERRIDING SYSTEM VALUE
+		SELECT row_num, {values}
+		FROM (
+			SELECT row_num, doc::jsonb AS doc FROM import_raw
+			WHERE row_num NOT IN (SELECT row_num FROM import_errors WHERE source = %s)
+		) parsed;
+		DROP TABLE import_raw;
+	""", [source])
+	# Keys present in at least one row count as the file's columns
+	cursor.execute(
+		'SELECT ' + ', '.join(f'bool_or({quote(column)} IS NOT NULL)' for column in columns) + f' FROM import_{source}'
+	)
+	return [column for column, present in zip(columns, cursor.fetchone()) if present]
+
+def validate(cursor, sources: List[str]) -> None:
+	statuses = [value for value, _ in STATUS_CHOICES]
+	priorities = [value for value, _ in PRIORITY_CHOICES]
+	rules = [
+		(source, field, f'{quote(field)} IS NULL', 'This field is required.')
+		for source in sources for field in SOURCES[source][1]
+	]
+	rules += [
+		(source, field, f'{quote(field)} IS NOT NULL AND ({condition})', message)
+		for source, field, condition, message in VALIDATION_RULES
+		if source in sources
+	]
+	for source, field, condition, message in rules:
+		cursor.execute(f"""
+			INSERT INTO import_errors (source, row_num, field, value, message)
+			SELECT %(source)s, row_num, %(field)s, left({quote(field)}, 200), %(message)s
+			FROM import_{source} staged
+			WHERE {condition}
+		""", {
+			'source': source,
+			'field': field,
+			'message': message,
+			'statuses': statuses,
+			'priorities': priorities,
+		})
+
+def count_rows(cursor, sql: str, params: Optional[List[Any]] = None) -> int:
+	cursor.execute(sql, params or [])
+	return cursor.fetchone()[0]
+
+def write_tags(cursor, sources: List[str]) -> int:
+	names = []
+	if 'tags' in sources:
+		names.append('SELECT btrim(name) FROM import_tags')
+	if 'tasks' in sources:
+		names.append("SELECT btrim(item.value) FROM import_tasks, unnest(string_to_array(tags, ';')) item(value)")
+	return count_rows(cursor, f"""
+		WITH inserted AS (
+			INSERT INTO tasks_tag (name)
+			SELECT DISTINCT name FROM ({' UNION ALL '.join(names)}) names(name) WHERE name <> ''
+			ON CONFLICT (name) DO NOTHING
+			RETURNING 1
+		)
+		SELECT count(*) FROM inserted
+	""") if names else 0
+
+def assign_task_ids(cursor) -> None:
+	# Ids are taken from the file or the sequence before anything is written,
+	# so parent_task and tag rows can point at tasks of the same file
+	cursor.execute("""
+		ALTER TABLE import_tasks ADD COLUMN task_id bigint, ADD COLUMN created_by_id bigint;
+		UPDATE import_tasks staged SET
+			task_id = coalesce(staged.id::bigint, nextval(pg_get_serial_sequence('tasks_task', 'id'))),
+			created_by_id = users_user.id
+		FROM users_user
+		WHERE users_user.username = staged.created_by AND NOT users_user.is_deleted;
+	""")
+
+def write_tasks(cursor, header: List[str]) -> Tuple[int, int]:
+	present = [TASK_FIELDS[column] for column in header if column in TASK_FIELDS]
+	fields = present + [(column, value) for column, value in TASK_DEFAULTS.items() if column not in header]
+	columns = ', '.join(quote(column) for column, _ in fields)
+	values = ', '.join(value for _, value in fields)
+	updates = ', '.join(f'{quote(column)} = EXCLUDED.{quote(column)}' for column, _ in present)
+	created_at = 'coalesce(created_at::timestamptz, now())' if 'created_at' in header else 'now()'
+	cursor.execute(f"""
+		WITH upserted AS (
+			INSERT INTO tasks_task (id, {columns}, created_at, updated_at)
+			SELECT task_id, {values}, {created_at}, now()
+			FROM import_tasks
+			ON CONFLICT (id) DO UPDATE SET {updates}, updated_at = EXCLUDED.updated_at
+			RETURNING xmax = 0 AS inserted
+		)
+		SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+	""")
+	inserted, updated = cursor.fetchone()
+	# Explicit ids don't move the sequence, skip past them (burns one value)
+	cursor.execute("""
+		SELECT setval(seq, greatest((SELECT max(id) FROM tasks_task), nextval(seq)))
+		FROM pg_get_serial_sequence('tasks_task', 'id') seq
+	""")
+	return inserted, updated
+
+def write_task_tags(cursor) -> int:
+	return count_rows(cursor, """
+		WITH inserted AS (
+			INSERT INTO tasks_task_tags (task_id, tag_id)
+			SELECT DISTINCT staged.task_id, tasks_tag.id
+			FROM import_tasks staged
+			CROSS JOIN unnest(string_to_array(staged.tags, ';')) item(value)
+			JOIN tasks_tag ON tasks_tag.name = btrim(item.value)
+			ON CONFLICT (task_id, tag_id) DO NOTHING
+			RETURNING 1
+		)
+		SELECT count(*) FROM inserted
+	""")
+
+def write_assignments(cursor, sources: List[str], assigned_by_id: Optional[int]) -> int:
+	# assigned_by falls back to --assigned-by, then to the task's creator
+	pairs = []
+	if 'tasks' in sources:
+		pairs.append("""
+			SELECT staged.task_id, btrim(item.value), NULL
+			FROM import_tasks staged, unnest(string_to_array(staged.assigned_to, ';')) item(value)
+		""")
+	if 'assignments' in sources:
+		pairs.append('SELECT task::bigint, "user", assigned_by FROM import_assignments')
+	return count_rows(cursor, f"""
+		WITH inserted AS (
+			INSERT INTO tasks_taskassignment (task_id, user_id, assigned_by_id, assigned_at)
+			SELECT DISTINCT ON (pairs.task_id, assignee.id)
+				pairs.task_id, assignee.id, coalesce(assigner.id, %s::bigint, tasks_task.created_by_id), now()
+			FROM ({' UNION ALL '.join(pairs)}) pairs(task_id, username, assigned_by)
+			JOIN users_user assignee ON assignee.username = pairs.username AND NOT assignee.is_deleted
+			JOIN tasks_task ON tasks_task.id = pairs.task_id
+			LEFT JOIN users_user assigner ON assigner.username = pairs.assigned_by AND NOT assigner.is_deleted
+			ON CONFLICT ON CONSTRAINT unique_combination DO NOTHING
+			RETURNING 1
+		)
+		SELECT count(*) FROM inserted
+	""", [assigned_by_id]) if pairs else 0
+
+def get_errors(cursor, limit: int) -> List[Dict[str, Any]]:
+	cursor.execute("""
+		SELECT source, row_num AS row, field, value, message FROM import_errors
+		ORDER BY source, row_num, field LIMIT %s
+	""", [limit])
+	columns = [column.name for column in cursor.description]
+	return [dict(zip(columns, values)) for values in cursor.fetchall()]
+
+def write_error_report(cursor, stream: IO[bytes]) -> None:
+	with cursor.copy("""
+		COPY (
+			SELECT source, row_num AS row, field, value, message FROM import_errors
+			ORDER BY source, row_num, field
+		) TO STDOUT WITH (FORMAT csv, HEADER true)
+	""") as copy:
+		for block in copy:
+			stream.write(block)
+
+def import_files(
+	files: Dict[str, str],
+	file_format: Optional[str] = None,
+	dry_run: bool = False,
+	assigned_by_id: Optional[int] = None,
+	error_report: Optional[str] = None,
+	max_errors: int = MAX_REPORTED_ERRORS,
+) -> Dict[str, Any]:
+	# files is {'tasks': path, 'assignments': path, 'tags': path}, any of them.
+	# Rows are numbered from 1 in each file, not counting the CSV header
+	started = time.monotonic()
+	sources = [source for source in SOURCES if source in files]
+	report: Dict[str, Any] = {'dry_run': dry_run, 'rows': {}, 'errors': 0}
+	with transaction.atomic(), connection.cursor() as cursor:
+		cursor.execute(SETUP_SQL)
+		headers = {}
+		# All of them, the checks on one file look at the others
+		for source in SOURCES:
+			create_staging_table(cursor, source)
+		for source in sources:
+			path = files[source]
+			with open(path, 'rb') as stream:
+				if get_file_format(path, file_format) == 'ndjson':
+					headers[source] = load_ndjson(cursor, source, stream)
+				else:
+					headers[source] = load_csv(cursor, source, stream)
+			report['rows'][source] = count_rows(cursor, f'SELECT count(*) FROM import_{source}')
+
+		validate(cursor, sources)
+		report['errors'] = count_rows(cursor, 'SELECT count(*) FROM import_errors')
+		if report['errors']:
+			report['error_sample'] = get_errors(cursor, max_errors)
+			if error_report:
+				with open(error_report, 'wb') as stream:
+					write_error_report(cursor, stream)
+			transaction.set_rollback(True)
+		else:
+			report['tags_created'] = write_tags(cursor, sources)
+			if 'tasks' in sources:
+				# Tag rows first (FKs are deferred): the search_vector trigger on
+				# tasks_task then sees them, instead of every tagged task being
+				# rewritten again by the trigger on tasks_task_tags
+				assign_task_ids(cursor)
+				report['task_tags_added'] = write_task_tags(cursor)
+				report['tasks_inserted'], report['tasks_updated'] = write_tasks(cursor, headers['tasks'])
+			report['assignments_added'] = write_assignments(cursor, sources, assigned_by_id)
+			if dry_run:
+				transaction.set_rollback(True)
+			else:
+				invalidate_task_cache()
+
+	report['seconds'] = round(time.monotonic() - started, 3)
+	return report
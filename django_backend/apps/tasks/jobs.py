@@ -0,0 +1,383 @@
+import json
+import time
+import logging
+from datetime import (
+	datetime,
+	timedelta,
+)
+from typing import (
+	Any,
+	Callable,
+	Dict,
+	List,
+	Optional,
+)
+from django.db import (
+	connection,
+	transaction,
+)
+from django.db.models import (
+	Exists,
+	OuterRef,
+	Q,
+	QuerySet,
+)
+from django.utils import timezone
+from .models import (
+	CLOSED_STATUSES,
+	JobCheckpoint,
+	Task,
+	TaskActivity,
+	TaskAssignment,
+	TaskStats,
+	TaskTombstone,
+	get_column_list,
+)
+from .cache import invalidate_task_cache
+from .events import queue_task_events
+from .activity import (
+	ACTIVITY_BATCH_SIZE,
+	ACTIVITY_BUFFER,
+	FLUSH_LOCK,
+	PARTITION_PREFIX,
+	ensure_activity_partitions,
+	get_client,
+	record_activity,
+	write_activity,
+)
+
+logger = logging.getLogger(__name__)
+
+# Work done by the Celery tasks in tasks.py, kept here so it can also run
+# from the shell or a management command
+
+OVERDUE_JOB = 'check_overdue_tasks'
+OVERDUE_CHUNK_SIZE = 500
+# Re-read a bit before the last high-water mark, for rows that were being
+# written while the previous run looked at that range
+OVERDUE_OVERLAP = timedelta(minutes=5)
+
+def get_open_tasks() -> QuerySet:
+	# Same predicate as the tasks_task_open_due_idx partial index, objects
+	# adds the is_deleted = false
+	return Task.objects.exclude(status__in=CLOSED_STATUSES)
+
+def mark_overdue_tasks(
+	now: Optional[datetime] = None,
+	chunk_size: int = OVERDUE_CHUNK_SIZE,
+	full: bool = False,
+) -> Dict[str, int]:
+	# Only tasks whose due date passed since the last run, or that were saved
+	# since then (created or edited with a due date already behind the mark):
+	# range scans on the open due date and the updated_at partial indexes from
+	# the high-water mark, so the cost follows the number of tasks that just
+	# became overdue or changed, not the table size.
+	# full=True drops the lower bound and checks every open task
+	now = now or timezone.now()
+	checkpoint, _ = JobCheckpoint.objects.get_or_create(name=OVERDUE_JOB)
+	candidates = get_open_tasks().filter(due_date__lt=now)
+	if checkpoint.position_at and not full:
+		since = checkpoint.position_at - OVERDUE_OVERLAP
+		candidates = candidates.filter(Q(due_date__gte=since) | Q(updated_at__gte=since))
+
+	updated = chunks = 0
+	while True:
+		ids = list(candidates.order_by('due_date', 'id').values_list('id', flat=True)[:chunk_size])
+		if not ids:
+			break
+		# One short transaction per chunk, row locks are held only for its rows.
+		# The chunk is read again under the lock: a task completed or moved
+		# meanwhile is left alone, and events and activity only go out for the
+		# rows written, with the status they had then. updated_at is the write
+		# time, not the run's now, for the delta sync
+		with transaction.atomic():
+			locked = dict(
+				get_open_tasks().filter(pk__in=ids, due_date__lt=now).select_for_update()
+				.order_by('id').values_list('id', 'status')
+			)
+			if locked:
+				updated += Task.objects.filter(pk__in=locked).update(status='overdue', updated_at=timezone.now())
+				queue_task_events('updated', list(locked))
+			for status in set(locked.values()):
+				record_activity(
+					'updated', [pk for pk in locked if locked[pk] == status],
+					{'status': [status, 'overdue']},
+				)
+		chunks += 1
+		if len(ids) < chunk_size:
+			break
+
+	checkpoint.position_at = now
+	checkpoint.save(update_fields=['position_at', 'updated_at'])
+	if updated:
+		invalidate_task_cache()
+	return {'updated': updated, 'chunks': chunks}
+
+ARCHIVE_BATCH_SIZE = 500
+
+# Moves a batch of tasks with all their descendants, assignments and tag rows
+# to the archive tables (migration 0012) in one statement. UNION stops on
+# parent_task cycles, FKs are deferred so the deletes can run side by side.
+# The tombstone triggers fire as for any delete
+ARCHIVE_BATCH_SQL = """
+	WITH RECURSIVE moving(id) AS (
+		SELECT unnest(%s::bigint[])
+		UNION
+		SELECT child.id FROM tasks_task child JOIN moving ON child.parent_task_id = moving.id
+	), tags AS (
+		DELETE FROM tasks_task_tags WHERE task_id IN (SELECT id FROM moving) RETURNING {tag_columns}
+	), assignments AS (
+		DELETE FROM tasks_taskassignment WHERE task_id IN (SELECT id FROM moving) RETURNING {assignment_columns}
+	), tasks AS (
+		DELETE FROM tasks_task WHERE id IN (SELECT id FROM moving) RETURNING {task_columns}
+	), archived_tags AS (
+		INSERT INTO tasks_task_tags_archive ({tag_columns}) SELECT {tag_columns} FROM tags RETURNING 1
+	), archived_assignments AS (
+		INSERT INTO tasks_taskassignment_archive ({assignment_columns})
+		SELECT {assignment_columns} FROM assignments RETURNING 1
+	), archived_tasks AS (
+		INSERT INTO tasks_task_archive ({task_columns}) SELECT {task_columns} FROM tasks RETURNING id
+	)
+	SELECT
+		array(SELECT id FROM archived_tasks ORDER BY id),
+		(SELECT count(*) FROM archived_assignments),
+		(SELECT count(*) FROM archived_tags)
+""".format(
+	task_columns=get_column_list(Task),
+	assignment_columns=get_column_list(TaskAssignment),
+	tag_columns=get_column_list(Task.tags.through),
+)
+
+def get_archive_candidates(cutoff: datetime) -> QuerySet:
+	# Completed or archived and untouched since the cutoff. A task with live
+	# subtasks stays until they're gone, deleted ones move along with it
+	return Task.objects.filter(Q(status='completed') | Q(is_archived=True), updated_at__lt=cutoff).exclude(
+		Exists(Task.objects.filter(parent_task=OuterRef('pk')))
+	)
+
+def move_task_batch(ids: List[int]) -> Dict[str, Any]:
+	with transaction.atomic(), connection.cursor() as cursor:
+		cursor.execute(ARCHIVE_BATCH_SQL, [ids])
+		tasks, assignments, tags = cursor.fetchone()
+	return {'ids': tasks, 'assignments': assignments, 'tags': tags}
+
+def archive_tasks(
+	days: int = 14,
+	batch_size: int = ARCHIVE_BATCH_SIZE,
+	max_seconds: Optional[float] = None,
+	progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+	# Keeps the hot tables (and their indexes) down to the tasks still in use.
+	# Walks the candidates by the live (updated_at, id) index, one short
+	# transaction per batch, until the time budget runs out. A parent passed
+	# over for its subtasks can be a candidate once they moved, so the walk
+	# starts over while a pass still moves something
+	cutoff = timezone.now() - timedelta(days=days)
+	started = time.monotonic()
+	candidates = get_archive_candidates(cutoff).order_by('updated_at', 'id')
+	report = {'archived': 0, 'assignments': 0, 'tags': 0, 'batches': 0, 'passes': 1, 'finished': False}
+	position = None
+	moved_in_pass = 0
+
+	while max_seconds is None or time.monotonic() - started < max_seconds:
+		batch = candidates
+		if position is not None:
+			batch = batch.filter(Q(updated_at__gt=position[0]) | Q(updated_at=position[0], id__gt=position[1]))
+		rows = list(batch.values_list('updated_at', 'id')[:batch_size])
+		if not rows:
+			if not moved_in_pass:
+				report['finished'] = True
+				break
+			position, moved_in_pass = None, 0
+			report['passes'] += 1
+			continue
+		position = rows[-1]
+
+		with transaction.atomic():
+			# Checked again with the rows locked, one may have been reopened
+			# since it was read
+			ids = list(get_archive_candidates(cutoff).select_for_update().filter(
+				pk__in=[pk for _, pk in rows],
+			).values_list('id', flat=True))
+			if not ids:
+				continue
+			moved = move_task_batch(ids)
+			queue_task_events('archived', moved['ids'])
+			record_activity('archived', moved['ids'])
+		moved_in_pass += len(moved['ids'])
+		report['archived'] += len(moved['ids'])
+		report['assignments'] += moved['assignments']
+		report['tags'] += moved['tags']
+		report['batches'] += 1
+		if progress:
+			progress(dict(report))
+
+	if report['archived']:
+		invalidate_task_cache()
+	report['seconds'] = round(time.monotonic() - started, 3)
+	return report
+
+PURGE_JOB = 'cleanup_archived_tasks'
+PURGE_BATCH_SIZE = 200
+
+# Deletes a batch of tasks with all their descendants, assignments and tag
+# rows from the archive tables. Subtasks of an archived task are always in the
+# archive too (moved along, restored with their ancestors)
+PURGE_BATCH_SQL = """
+	WITH RECURSIVE doomed(id) AS (
+		SELECT unnest(%s::bigint[])
+		UNION
+		SELECT child.id FROM tasks_task_archive child JOIN doomed ON child.parent_task_id = doomed.id
+	), tags AS (
+		DELETE FROM tasks_task_tags_archive WHERE task_id IN (SELECT id FROM doomed) RETURNING 1
+	), assignments AS (
+		DELETE FROM tasks_taskassignment_archive WHERE task_id IN (SELECT id FROM doomed) RETURNING 1
+	), tasks AS (
+		DELETE FROM tasks_task_archive WHERE id IN (SELECT id FROM doomed) RETURNING 1
+	)
+	SELECT (SELECT count(*) FROM tasks), (SELECT count(*) FROM assignments), (SELECT count(*) FROM tags)
+"""
+
+PURGE_CANDIDATES_SQL = """
+	SELECT id FROM tasks_task_archive
+	WHERE is_archived AND updated_at < %s AND id > %s
+	ORDER BY id LIMIT %s
+"""
+
+def delete_task_batch(ids: List[int]) -> Dict[str, int]:
+	with transaction.atomic(), connection.cursor() as cursor:
+		cursor.execute(PURGE_BATCH_SQL, [ids])
+		tasks, assignments, tags = cursor.fetchone()
+	return {'tasks': tasks, 'assignments': assignments, 'tags': tags}
+
+def purge_archived_tasks(
+	days: int = 30,
+	batch_size: int = PURGE_BATCH_SIZE,
+	max_seconds: Optional[float] = None,
+	max_rows: Optional[int] = None,
+	progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+	# Walks the is_archived tasks of the archive tier (archive_tasks moves
+	# them there first) by id in fixed-size batches, one short transaction
+	# each, and stops when the time or row budget runs out. The last id is
+	# kept in a JobCheckpoint so the next run carries on from there.
+	# Completed tasks stay in the archive
+	cutoff = timezone.now() - timedelta(days=days)
+	started = time.monotonic()
+	checkpoint, _ = JobCheckpoint.objects.get_or_create(name=PURGE_JOB)
+	report = {'deleted': 0, 'assignments': 0, 'tags': 0, 'batches': 0, 'finished': False}
+
+	while True:
+		if max_seconds is not None and time.monotonic() - started >= max_seconds:
+			break
+		if max_rows is not None and report['deleted'] >= max_rows:
+			break
+		with connection.cursor() as cursor:
+			cursor.execute(PURGE_CANDIDATES_SQL, [cutoff, checkpoint.position_id or 0, batch_size])
+			ids = [row[0] for row in cursor.fetchall()]
+		if not ids:
+			# Backlog done, next run starts over for rows archived since
+			checkpoint.position_id = None
+			report['finished'] = True
+			break
+
+		# The checkpoint moves in the same transaction as the delete
+		with transaction.atomic():
+			deleted = delete_task_batch(ids)
+			checkpoint.position_id = ids[-1]
+			checkpoint.save(update_fields=['position_id', 'updated_at'])
+		report['deleted'] += deleted['tasks']
+		report['assignments'] += deleted['assignments']
+		report['tags'] += deleted['tags']
+		report['batches'] += 1
+		logger.info('Purged %s archived tasks so far, up to id %s', report['deleted'], ids[-1])
+		if progress:
+			progress(dict(report, position_id=ids[-1]))
+
+	checkpoint.position_at = cutoff
+	checkpoint.save(update_fields=['position_at', 'position_id', 'updated_at'])
+	if report['deleted']:
+		# ?include_archived=true lists
+		invalidate_task_cache()
+	report['position_id'] = checkpoint.position_id
+	report['seconds'] = round(time.monotonic() - started, 3)
+	return report
+
+STATS_JOB = 'refresh_task_stats'
+
+def refresh_task_stats() -> Dict[str, Any]:
+	# CONCURRENTLY keeps /api/tasks/stats/ readable during the refresh. The
+	# checkpoint holds the time the data is current as of
+	as_of = timezone.now()
+	with connection.cursor() as cursor:
+		cursor.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {TaskStats._meta.db_table}')
+	JobCheckpoint.objects.update_or_create(name=STATS_JOB, defaults={'position_at': as_of})
+	return {'as_of': as_of.isoformat(), 'seconds': round((timezone.now() - as_of).total_seconds(), 3)}
+
+TOMBSTONE_JOB = 'cleanup_sync_tombstones'
+
+def purge_sync_tombstones(days: int = 30) -> Dict[str, Any]:
+	# Sync tokens from before the cutoff could miss deletions now, the
+	# checkpoint lets /api/tasks/changes tell those clients to sync again
+	cutoff = timezone.now() - timedelta(days=days)
+	with transaction.atomic():
+		deleted, _ = TaskTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+		JobCheckpoint.objects.update_or_create(name=TOMBSTONE_JOB, defaults={'position_at': cutoff})
+	return {'deleted': deleted, 'cutoff': cutoff.isoformat()}
+
+ACTIVITY_JOB = 'flush_task_activity'
+ACTIVITY_FLUSH_SECONDS = 30
+# Longest a batch may take, one started just before max_seconds still has
+# the lock until it's written
+ACTIVITY_FLUSH_BATCH_SECONDS = 60
+
+def flush_task_activity(
+	batch_size: int = ACTIVITY_BATCH_SIZE,
+	max_seconds: float = ACTIVITY_FLUSH_SECONDS,
+) -> Dict[str, Any]:
+	# Moves the buffered entries from Redis into tasks_task_activity, a batch
+	# per COPY (activity.write_activity). Entries leave the list only once they
+	# are written, a crash in between writes that batch again on the next run
+	# (at least once). The lock keeps two runs from writing the same batch and
+	# outlives the run: no new batch starts after max_seconds
+	started = time.monotonic()
+	client = get_client()
+	lock = client.lock(FLUSH_LOCK, timeout=max_seconds + ACTIVITY_FLUSH_BATCH_SECONDS)
+	if not lock.acquire(blocking=False):
+		return {'written': 0, 'batches': 0, 'skipped': True}
+	report = {'written': 0, 'batches': 0, 'skipped': False}
+	try:
+		while time.monotonic() - started < max_seconds:
+			raw = client.lrange(ACTIVITY_BUFFER, 0, batch_size - 1)
+			if not raw:
+				break
+			report['written'] += write_activity([json.loads(item) for item in raw])
+			client.ltrim(ACTIVITY_BUFFER, len(raw), -1)
+			report['batches'] += 1
+	finally:
+		lock.release()
+	report['pending'] = client.llen(ACTIVITY_BUFFER)
+	report['seconds'] = round(time.monotonic() - started, 3)
+	return report
+
+def purge_task_activity(months: int = 24) -> Dict[str, Any]:
+	# Drops whole monthly partitions older than the cutoff, no row by row
+	# delete (the table doesn't allow them anyway). Also makes next month's
+	# partition ahead of time. months=0 keeps everything
+	now = timezone.now()
+	ensure_activity_partitions([now, now + timedelta(days=32)])
+	if not months:
+		return {'dropped': []}
+	month = now.year * 12 + now.month - 1 - months
+	cutoff = f'{PARTITION_PREFIX}{month // 12}_{month % 12 + 1:02d}'
+	with connection.cursor() as cursor:
+		cursor.execute(
+			'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid'
+			' WHERE i.inhparent = %s::regclass',
+			[TaskActivity._meta.db_table],
+		)
+		# p2024_01 < p2024_02, the names sort by month
+		dropped = sorted(name for name, in cursor.fetchall() if name.startswith(PARTITION_PREFIX) and name < cutoff)
+		for name in dropped:
+			cursor.execute(f'DROP TABLE {name}')
+	return {'dropped': dropped}
@@ -0,0 +1,62 @@
+from django.core.management.base import (
+	BaseCommand,
+	CommandError,
+)
+from apps.tasks.bench import (
+	api_get,
+	get_bench_user,
+	measure,
+	seed_tasks,
+)
+from apps.tasks.models import Task
+from apps.tasks.pagination import TaskKeysetPagination
+from apps.tasks.views import TaskListView
+
+class Command(BaseCommand):
+	help = 'Page latency against page depth for page number and cursor pagination on /api/tasks/'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--seed', type=int, default=0, help='Insert this many tasks before measuring')
+		parser.add_argument('--depths', default='1,10,100,1000', help='Comma separated page numbers')
+		parser.add_argument('--page-size', type=int, default=30)
+		parser.add_argument('--ordering', default='due_date', choices=TaskKeysetPagination.ordering_fields)
+		parser.add_argument('--repeat', type=int, default=5)
+
+	def handle(self, *args, **options):
+		user = get_bench_user()
+		if options['seed']:
+			seeded = seed_tasks(options['seed'], user)
+			self.stdout.write(f'Seeded {seeded} tasks')
+
+		total = Task.objects.count()
+		page_size = options['page_size']
+		field = options['ordering']
+		depths = [int(depth) for depth in options['depths'].split(',')]
+		if not total:
+			raise CommandError('No tasks to paginate, use --seed')
+
+		view = TaskListView.as_view()
+		paginator = TaskKeysetPagination()
+		paginator.field, paginator.descending = field, False
+		keys = Task.objects.order_by(field, 'id').values_list(field, 'id')
+
+		self.stdout.write(f'{total} tasks, page_size={page_size}, ordering={field}')
+		self.stdout.write(f'{"page":>8} {"offset p50 ms":>14} {"offset p99 ms":>14} {"cursor p50 ms":>14} {"cursor p99 ms":>14}')
+		for depth in depths:
+			offset = (depth - 1) * page_size
+			if offset >= total:
+				self.stdout.write(f'{depth:>8} skipped, only {total} tasks')
+				continue
+			page_params = {'page': depth, 'page_size': page_size}
+			cursor_params = {'pagination': 'cursor', 'page_size': page_size, 'ordering': field}
+			if offset:
+				# Cursor of the last row of the previous page, built outside the timed section
+				value, pk = keys[offset - 1]
+				cursor_params['cursor'] = paginator.encode_cursor(value, pk)
+
+			offset_stats = measure(lambda: api_get(view, user, '/api/tasks/', page_params), options['repeat'])
+			cursor_stats = measure(lambda: api_get(view, user, '/api/tasks/', cursor_params), options['repeat'])
+			self.stdout.write(
+				f'{depth:>8} {offset_stats["p50"]:>14.2f} {offset_stats["p99"]:>14.2f}'
+				f' {cursor_stats["p50"]:>14.2f} {cursor_stats["p99"]:>14.2f}'
+			)
@@ -0,0 +1,89 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from apps.tasks.activity import (
+	ACTIVITY_BUFFER,
+	get_client,
+	push_activity,
+)
+from apps.tasks.bench import (
+	api_get,
+	api_patch,
+	get_bench_user,
+	measure,
+)
+from apps.tasks.jobs import flush_task_activity
+from apps.tasks.models import (
+	Task,
+	TaskActivity,
+)
+from apps.tasks.views import (
+	TaskActivityView,
+	TaskDetailView,
+)
+
+class Command(BaseCommand):
+	help = 'What the activity log adds to a task PATCH, how fast the buffer is flushed and the history read'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--requests', type=int, default=200)
+		parser.add_argument('--flush-entries', type=int, default=50000)
+
+	def handle(self, *args, **options):
+		user = get_bench_user()
+		task = Task.objects.create(
+			title='bench activity', description='', status='pending', priority='low',
+			due_date=timezone.now(), estimated_hours=1, created_by=user,
+		)
+		detail_view = TaskDetailView.as_view()
+		counter = iter(range(10 ** 9))
+
+		def patch():
+			# Two fields change every time, so every request has a diff to record
+			n = next(counter)
+			api_patch(detail_view, user, f'/api/tasks/{task.id}/', {'title': f'bench activity {n}', 'estimated_hours': n % 100 + 1}, pk=task.id)
+
+		try:
+			self.stdout.write(f'{"PATCH /api/tasks/<id>/":>24} {"p50 ms":>8} {"p99 ms":>8} {"mean ms":>8}')
+			results = {}
+			for label, enabled in (('activity off', False), ('activity on', True)):
+				with override_settings(TASK_ACTIVITY_ENABLED=enabled):
+					for _ in range(10):
+						patch()
+					results[label] = stats = measure(patch, options['requests'])
+				self.stdout.write(f'{label:>24} {stats["p50"]:>8.2f} {stats["p99"]:>8.2f} {stats["mean"]:>8.2f}')
+			self.stdout.write(
+				f'{"overhead":>24} {results["activity on"]["p50"] - results["activity off"]["p50"]:>8.2f}'
+				f' {results["activity on"]["p99"] - results["activity off"]["p99"]:>8.2f}'
+				f' {results["activity on"]["mean"] - results["activity off"]["mean"]:>8.2f}'
+			)
+
+			# A backlog of entries in the buffer, as after a burst of writes
+			flush_task_activity()
+			at = timezone.now().isoformat()
+			entries = [
+				{'task': task.id, 'user': user.pk, 'action': 'updated', 'changes': {'title': ['a', 'b']}, 'at': at}
+				for _ in range(1000)
+			]
+			for _ in range(options['flush_entries'] // 1000):
+				push_activity(entries)
+			pending = get_client().llen(ACTIVITY_BUFFER)
+			started = time.perf_counter()
+			report = flush_task_activity()
+			seconds = time.perf_counter() - started
+			self.stdout.write(
+				f'flush: {report["written"]} entries in {report["batches"]} batches, {seconds:.2f}s,'
+				f' {report["written"] / max(seconds, 1e-9):.0f} entries/s (pending before: {pending})'
+			)
+
+			# As autovacuum would after the load, the fresh partition has no statistics
+			with connection.cursor() as cursor:
+				cursor.execute(f'ANALYZE {TaskActivity._meta.db_table}')
+			activity_view = TaskActivityView.as_view()
+			stats = measure(lambda: api_get(activity_view, user, f'/api/tasks/{task.id}/activity/', {}, pk=task.id), 50)
+			self.stdout.write(f'GET /api/tasks/<id>/activity/ first page: p50 {stats["p50"]:.2f} ms, p99 {stats["p99"]:.2f} ms')
+		finally:
+			task.delete()
+			flush_task_activity()
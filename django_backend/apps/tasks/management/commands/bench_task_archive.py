@@ -0,0 +1,87 @@
+import time
+from datetime import timedelta
+from typing import (
+	Dict,
+	List,
+)
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from apps.tasks.bench import (
+	api_get,
+	get_bench_user,
+	measure,
+	seed_tasks,
+)
+from apps.tasks.jobs import (
+	archive_tasks,
+	delete_task_batch,
+)
+from apps.tasks.models import Task
+from apps.tasks.views import TaskListView
+
+# Far enough back that the archive run only takes the tasks this command added
+BENCH_AGE_DAYS = 3650
+
+CASES = [
+	('page 1', {}),
+	('page 1, pending', {'status': 'pending'}),
+	('cursor page 1', {'pagination': 'cursor'}),
+	('cursor, by due_date', {'pagination': 'cursor', 'ordering': 'due_date'}),
+	('search "bench"', {'search': 'bench', 'pagination': 'cursor'}),
+]
+
+class Command(BaseCommand):
+	help = 'Hot set /api/tasks/ latency as old completed tasks pile up, and once archive_tasks moved them'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--seed', type=int, default=0, help='Insert this many live tasks first')
+		parser.add_argument('--completed', type=int, default=200000, help='Old completed tasks to pile up and archive')
+		parser.add_argument('--repeat', type=int, default=30)
+
+	def run_cases(self, user, params: Dict[str, str]) -> List[float]:
+		with connection.cursor() as cursor:
+			cursor.execute('VACUUM ANALYZE tasks_task')
+		view = TaskListView.as_view()
+		return [
+			measure(lambda: api_get(view, user, '/api/tasks/', dict(case, **params)), self.repeat)['p50']
+			for _, case in CASES
+		]
+
+	def handle(self, *args, **options):
+		user = get_bench_user()
+		self.repeat = options['repeat']
+		if options['seed']:
+			self.stdout.write(f'Seeded {seed_tasks(options["seed"], user)} tasks')
+
+		# The response cache would hide everything but the first request
+		with override_settings(TASK_CACHE_TIMEOUT=0):
+			baseline = self.run_cases(user, {})
+
+			last_id = Task.all_objects.order_by('-id').values_list('id', flat=True).first() or 0
+			seed_tasks(options['completed'], user)
+			old = timezone.now() - timedelta(days=BENCH_AGE_DAYS)
+			piled = Task.objects.filter(id__gt=last_id).update(status='completed', updated_at=old)
+			grown = self.run_cases(user, {})
+
+			started = time.perf_counter()
+			report = archive_tasks(days=BENCH_AGE_DAYS - 1)
+			seconds = time.perf_counter() - started
+			archived = self.run_cases(user, {})
+			with_archive = self.run_cases(user, {'include_archived': 'true'})
+
+		self.stdout.write(
+			f'archive_tasks moved {report["archived"]} of {piled} tasks in {seconds:.1f}s'
+			f' ({report["archived"] / seconds:.0f}/s, {report["batches"]} batches)'
+		)
+		self.stdout.write(f'{"p50 ms":>24} {"before":>10} {"+completed":>12} {"archived":>10} {"+archive":>10}')
+		for (name, _), row in zip(CASES, zip(baseline, grown, archived, with_archive)):
+			self.stdout.write(f'{name:>24} ' + ' '.join(f'{value:>10.2f}' for value in row))
+
+		# The bench rows only, in purge sized batches
+		with connection.cursor() as cursor:
+			cursor.execute('SELECT id FROM tasks_task_archive WHERE id > %s AND updated_at = %s', [last_id, old])
+			ids = [row[0] for row in cursor.fetchall()]
+		for offset in range(0, len(ids), 5000):
+			delete_task_batch(ids[offset:offset + 5000])
@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import asyncio
+import subprocess
+from typing import (
+	Dict,
+	List,
+	Tuple,
+)
+from django.conf import settings
+from django.core.management.base import (
+	BaseCommand,
+	CommandError,
+)
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.tasks.bench import (
+	get_bench_user,
+	percentile,
+)
+from apps.tasks.models import Task
+from .bench_task_events import get_free_port
+
+# name, server command ({port} filled in), ASYNC_API_VIEWS
+SERVERS = [
+	('wsgi runserver', [sys.executable, 'manage.py', 'runserver', '--noreload', '127.0.0.1:{port}'], '0'),
+	('asgi sync views', [sys.executable, '-m', 'uvicorn', 'config.asgi:application', '--port', '{port}', '--log-level', 'warning', '--backlog', '4096'], '0'),
+	('asgi async views', [sys.executable, '-m', 'uvicorn', 'config.asgi:application', '--port', '{port}', '--log-level', 'warning', '--backlog', '4096'], '1'),
+]
+
+ENDPOINTS = [
+	('list', '/api/tasks/?page_size=10'),
+	('cursor list', '/api/tasks/?pagination=cursor&page_size=10'),
+	('detail', '/api/tasks/{pk}/'),
+]
+
+async def fetch(port: int, request: bytes) -> bytes:
+	reader, writer = await asyncio.open_connection('127.0.0.1', port)
+	try:
+		writer.write(request)
+		await writer.drain()
+		return await reader.read()
+	finally:
+		writer.close()
+
+class Command(BaseCommand):
+	help = 'Requests per second and p50/p99 of the task list, cursor list and detail under WSGI, ASGI with sync views and ASGI with async views'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--concurrency', default='1,16,64', help='Comma separated client counts')
+		parser.add_argument('--seconds', type=float, default=5, help='Per server, endpoint and concurrency')
+
+	def handle(self, *args, **options):
+		user = get_bench_user()
+		token = str(AccessToken.for_user(user))
+		pk = Task.objects.filter(created_by=user).values_list('pk', flat=True).first()
+		if pk is None:
+			raise CommandError('No bench tasks, seed some with bench_task_archive --seed or bench_pagination')
+		concurrency = [int(value) for value in options['concurrency'].split(',')]
+
+		results: Dict[Tuple[str, str, int], Tuple[float, float, float, int]] = {}
+		for name, command, async_views in SERVERS:
+			port = get_free_port()
+			# The response cache would turn every run into cache hits
+			env = dict(os.environ, ASYNC_API_VIEWS=async_views, TASK_CACHE_TIMEOUT='0')
+			server = subprocess.Popen(
+				[part.format(port=port) for part in command], cwd=settings.BASE_DIR, env=env,
+				stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+			)
+			try:
+				asyncio.run(self.wait_for(port))
+				for endpoint, path in ENDPOINTS:
+					request = (
+						f'GET {path.format(pk=pk)} HTTP/1.1\r\nHost: localhost\r\n'
+						f'Authorization: Bearer {token}\r\nConnection: close\r\n\r\n'
+					).encode('ascii')
+					for clients in concurrency:
+						results[name, endpoint, clients] = asyncio.run(
+							self.run(port, request, clients, options['seconds'])
+						)
+			finally:
+				server.terminate()
+				server.wait()
+
+		self.stdout.write(f'{"":>12} {"clients":>8} ' + ' '.join(f'{name:>26}' for name, _, _ in SERVERS))
+		self.stdout.write(f'{"":>12} {"":>8} ' + ' '.join(f'{"rps  p50 ms  p99 ms":>26}' for _ in SERVERS))
+		for endpoint, _ in ENDPOINTS:
+			for clients in concurrency:
+				cells = []
+				for name, _, _ in SERVERS:
+					rps, p50, p99, errors = results[name, endpoint, clients]
+					cell = f'{rps:.0f} {p50:7.1f} {p99:7.1f}'
+					cells.append(f'{cell + (f" ({errors} err)" if errors else ""):>26}')
+				self.stdout.write(f'{endpoint:>12} {clients:>8} ' + ' '.join(cells))
+
+	async def wait_for(self, port: int) -> None:
+		for _ in range(100):
+			try:
+				await asyncio.open_connection('127.0.0.1', port)
+				return
+			except OSError:
+				await asyncio.sleep(0.1)
+		raise CommandError('Server did not start')
+
+	async def run(self, port: int, request: bytes, clients: int, seconds: float) -> Tuple[float, float, float, int]:
+		# Warm up the workers and connections, then as many requests as the
+		# clients get through, each one waiting for its previous response
+		await asyncio.gather(*(fetch(port, request) for _ in range(clients)), return_exceptions=True)
+		latencies: List[float] = []
+		errors = 0
+
+		async def client(deadline: float) -> None:
+			nonlocal errors
+			while time.perf_counter() < deadline:
+				started = time.perf_counter()
+				try:
+					response = await fetch(port, request)
+				except OSError:
+					# Refused or reset, runserver only queues 5 connections
+					errors += 1
+					continue
+				latencies.append((time.perf_counter() - started) * 1000)
+				if not response.startswith(b'HTTP/1.1 200'):
+					errors += 1
+
+		started = time.perf_counter()
+		await asyncio.gather(*(client(started + seconds) for _ in range(clients)))
+		elapsed = time.perf_counter() - started
+		latencies.sort()
+		return len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 99), errors
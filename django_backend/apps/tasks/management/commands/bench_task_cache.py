@@ -0,0 +1,51 @@
+from django.core.management.base import (
+	BaseCommand,
+	CommandError,
+)
+from django.test.utils import override_settings
+from apps.tasks.bench import (
+	api_get,
+	get_bench_user,
+	measure,
+	seed_tasks,
+)
+from apps.tasks.cache import bump_generation
+from apps.tasks.models import Task
+from apps.tasks.views import (
+	TaskListView,
+	TaskDetailView,
+)
+
+class Command(BaseCommand):
+	help = 'p50/p99 latency of task list/detail requests with and without the response cache'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--seed', type=int, default=0, help='Insert this many tasks before measuring')
+		parser.add_argument('--requests', type=int, default=200)
+		parser.add_argument('--page-size', type=int, default=30)
+
+	def handle(self, *args, **options):
+		user = get_bench_user()
+		if options['seed']:
+			self.stdout.write(f'Seeded {seed_tasks(options["seed"], user)} tasks')
+		task_id = Task.objects.values_list('id', flat=True).first()
+		if task_id is None:
+			raise CommandError('No tasks to request, use --seed')
+
+		list_view = TaskListView.as_view()
+		detail_view = TaskDetailView.as_view()
+		cases = [
+			('list', lambda: api_get(list_view, user, '/api/tasks/', {'page_size': options['page_size'], 'status': 'pending'})),
+			('detail', lambda: api_get(detail_view, user, f'/api/tasks/{task_id}/', {}, pk=task_id)),
+		]
+		self.stdout.write(f'{"endpoint":>10} {"cache":>8} {"p50 ms":>10} {"p99 ms":>10}')
+		for name, request in cases:
+			with override_settings(TASK_CACHE_TIMEOUT=0):
+				uncached = measure(request, options['requests'])
+			bump_generation()
+			with override_settings(TASK_CACHE_TIMEOUT=60):
+				# First request fills the entry, the rest are hits
+				request()
+				cached = measure(request, options['requests'])
+			for label, stats in (('off', uncached), ('on', cached)):
+				self.stdout.write(f'{name:>10} {label:>8} {stats["p50"]:>10.2f} {stats["p99"]:>10.2f}')
@@ -0,0 +1,143 @@
+import sys
+import time
+import socket
+import asyncio
+import statistics
+import subprocess
+from typing import (
+	List,
+	Optional,
+)
+from asgiref.sync import sync_to_async
+from django.core.management.base import (
+	BaseCommand,
+	CommandError,
+)
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.tasks.bench import get_bench_user
+from apps.tasks.events import TASK_EVENTS_PATH
+from apps.tasks.models import Task
+
+def get_rss_kb(pid: int) -> int:
+	with open(f'/proc/{pid}/status') as status:
+		for line in status:
+			if line.startswith('VmRSS:'):
+				return int(line.split()[1])
+	return 0
+
+def get_free_port() -> int:
+	with socket.socket() as sock:
+		sock.bind(('127.0.0.1', 0))
+		return sock.getsockname()[1]
+
+class Stream:
+	def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		self.reader, self.writer = reader, writer
+		self.received: List[float] = []
+
+	async def read(self) -> None:
+		while True:
+			chunk = await self.reader.read(65536)
+			if not chunk:
+				return
+			self.received.extend(time.perf_counter() for _ in range(chunk.count(b'event: tasks')))
+
+class Command(BaseCommand):
+	help = 'Idle /api/tasks/events streams one uvicorn process holds, its memory per stream and the fan-out latency'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--connections', type=int, default=2000)
+		parser.add_argument('--bursts', type=int, default=5)
+		parser.add_argument('--writes-per-burst', type=int, default=50)
+
+	def handle(self, *args, **options):
+		port = get_free_port()
+		server = subprocess.Popen([
+			sys.executable, '-m', 'uvicorn', 'config.asgi:application',
+			'--port', str(port), '--log-level', 'warning', '--backlog', '4096',
+		])
+		try:
+			asyncio.run(self.run(server, port, options))
+		finally:
+			server.terminate()
+			server.wait()
+
+	async def connect(self, port: int, token: str) -> Optional[Stream]:
+		reader, writer = await asyncio.open_connection('127.0.0.1', port)
+		writer.write((
+			f'GET {TASK_EVENTS_PATH} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+			f'Authorization: Bearer {token}\r\nAccept: text/event-stream\r\n\r\n'
+		).encode('ascii'))
+		await writer.drain()
+		head = await reader.readuntil(b'retry: 3000\n\n')
+		if b' 200 ' not in head.split(b'\r\n', 1)[0]:
+			raise CommandError(head.decode('latin-1'))
+		return Stream(reader, writer)
+
+	async def run(self, server: subprocess.Popen, port: int, options) -> None:
+		user = await sync_to_async(get_bench_user)()
+		token = str(AccessToken.for_user(user))
+		for _ in range(100):
+			try:
+				await asyncio.open_connection('127.0.0.1', port)
+				break
+			except OSError:
+				await asyncio.sleep(0.1)
+		else:
+			raise CommandError('uvicorn did not start')
+
+		# First stream starts the Redis subscription, then the baseline
+		streams = [await self.connect(port, token)]
+		await asyncio.sleep(0.5)
+		baseline = get_rss_kb(server.pid)
+		started = time.perf_counter()
+		for offset in range(1, options['connections'], 200):
+			batch = range(offset, min(offset + 200, options['connections']))
+			streams += await asyncio.gather(*(self.connect(port, token) for _ in batch))
+		connect_seconds = time.perf_counter() - started
+		await asyncio.sleep(1)
+		held = get_rss_kb(server.pid)
+		readers = [asyncio.ensure_future(stream.read()) for stream in streams]
+
+		self.stdout.write(f'{len(streams)} streams opened in {connect_seconds:.2f}s')
+		self.stdout.write(f'server RSS {baseline / 1024:.1f} MB -> {held / 1024:.1f} MB, {(held - baseline) / len(streams):.1f} KB per stream')
+
+		task = await sync_to_async(Task.objects.create)(
+			title='bench events', description='', status='pending', priority='low',
+			due_date=timezone.now(), estimated_hours=1, created_by=user,
+		)
+		latencies = []
+		try:
+			for burst in range(options['bursts']):
+				before = [len(stream.received) for stream in streams]
+				published = time.perf_counter()
+				for write in range(options['writes_per_burst']):
+					task.title = f'bench events {burst}.{write}'
+					await sync_to_async(task.save)()
+				# Bursts are coalesced, wait for the one message per stream
+				deadline = time.perf_counter() + 10
+				while time.perf_counter() < deadline:
+					if all(len(stream.received) > count for stream, count in zip(streams, before)):
+						break
+					await asyncio.sleep(0.01)
+				latencies += [
+					(stream.received[count] - published) * 1000
+					for stream, count in zip(streams, before) if len(stream.received) > count
+				]
+				messages = sum(len(stream.received) - count for stream, count in zip(streams, before))
+				self.stdout.write(f'burst {burst}: {options["writes_per_burst"]} writes -> {messages} messages for {len(streams)} streams')
+		finally:
+			await sync_to_async(task.delete)()
+			for reader in readers:
+				reader.cancel()
+			for stream in streams:
+				stream.writer.close()
+
+		if latencies:
+			latencies.sort()
+			self.stdout.write(
+				f'delivery after the first write: p50 {statistics.median(latencies):.1f} ms,'
+				f' p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms,'
+				f' last {latencies[-1]:.1f} ms ({len(latencies)} deliveries)'
+			)
@@ -0,0 +1,53 @@
+from django.core.management.base import (
+	BaseCommand,
+	CommandError,
+)
+from django.db import connection
+from django.test.utils import (
+	CaptureQueriesContext,
+	override_settings,
+)
+from apps.tasks.bench import (
+	api_get,
+	get_bench_user,
+	measure,
+	seed_tasks,
+)
+from apps.tasks.models import Task
+from apps.tasks.views import TaskListView
+
+class Command(BaseCommand):
+	help = 'Response size, query time and latency of /api/tasks/ with and without ?fields= / ?expand='
+
+	def add_arguments(self, parser):
+		parser.add_argument('--seed', type=int, default=0, help='Insert this many tasks before measuring')
+		parser.add_argument('--page-size', type=int, default=30)
+		parser.add_argument('--repeat', type=int, default=50)
+		parser.add_argument('--fields', default='id,title,status,due_date')
+
+	def handle(self, *args, **options):
+		user = get_bench_user()
+		if options['seed']:
+			self.stdout.write(f'Seeded {seed_tasks(options["seed"], user)} tasks')
+		if not Task.objects.exists():
+			raise CommandError('No tasks to list, use --seed')
+
+		view = TaskListView.as_view()
+		base = {'pagination': 'cursor', 'page_size': options['page_size']}
+		cases = [
+			('all fields', base),
+			(f'fields={options["fields"]}', dict(base, fields=options['fields'])),
+			('expand=all', dict(base, expand='created_by,parent_task,assigned_to,tags')),
+		]
+		self.stdout.write(f'{"request":>40} {"bytes":>8} {"queries":>8} {"query ms":>9} {"p50 ms":>8} {"p99 ms":>8}')
+		# The response cache would hide everything but the first request
+		with override_settings(TASK_CACHE_TIMEOUT=0):
+			for name, params in cases:
+				with CaptureQueriesContext(connection) as queries:
+					response = api_get(view, user, '/api/tasks/', params)
+				query_ms = sum(float(query['time']) for query in queries.captured_queries) * 1000
+				stats = measure(lambda: api_get(view, user, '/api/tasks/', params), options['repeat'])
+				self.stdout.write(
+					f'{name:>40} {len(response.content):>8} {len(queries.captured_queries):>8}'
+					f' {query_ms:>9.2f} {stats["p50"]:>8.2f} {stats["p99"]:>8.2f}'
+				)
@@ -0,0 +1,65 @@
+import json
+from django.core.management.base import (
+	BaseCommand,
+	CommandError,
+)
+from django.db import connection
+from django.test.utils import override_settings
+from apps.tasks.bench import (
+	api_get,
+	get_bench_user,
+	measure,
+	seed_tasks,
+)
+from apps.tasks.filters import filter_metadata
+from apps.tasks.models import Task
+from apps.tasks.views import TaskListView
+
+def get_plan(params: dict) -> str:
+	# The scan nodes of the filter's plan, to see which index served it
+	queryset = filter_metadata(Task.objects.order_by('-id'), params).values('id')[:30]
+	sql, sql_params = queryset.query.sql_with_params()
+	with connection.cursor() as cursor:
+		cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', sql_params)
+		plan = cursor.fetchone()[0]
+	plan = json.loads(plan) if isinstance(plan, str) else plan
+	nodes, stack = [], [plan[0]['Plan']]
+	while stack:
+		node = stack.pop()
+		if 'Scan' in node['Node Type']:
+			nodes.append(f'{node["Node Type"]} {node.get("Index Name", "")}'.strip())
+		stack += node.get('Plans', [])
+	return ', '.join(nodes)
+
+class Command(BaseCommand):
+	help = 'Latency and plan of /api/tasks/?metadata__<key>= lookups'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--seed', type=int, default=0, help='Insert this many tasks before measuring')
+		parser.add_argument('--repeat', type=int, default=50)
+
+	def handle(self, *args, **options):
+		user = get_bench_user()
+		if options['seed']:
+			self.stdout.write(f'Seeded {seed_tasks(options["seed"], user)} tasks')
+		metadata = Task.objects.filter(metadata__has_key='external_id').values_list('metadata', flat=True).last()
+		if metadata is None:
+			raise CommandError('No tasks with bench metadata, use --seed')
+
+		view = TaskListView.as_view()
+		cases = [
+			{'metadata__external_id': metadata['external_id']},
+			{'metadata__customer_id': str(metadata['customer_id'])},
+			{'metadata__source': metadata['source'], 'metadata__sprint': metadata['sprint']},
+			{'metadata__source': metadata['source']},
+			# Nothing matches: without the GIN index this reads the whole table
+			{'metadata__source': 'nowhere'},
+			{'metadata__has_key': 'external_id'},
+		]
+		self.stdout.write(f'{"filter":>60} {"p50 ms":>8} {"p99 ms":>8}  plan')
+		# The response cache would hide everything but the first request
+		with override_settings(TASK_CACHE_TIMEOUT=0):
+			for params in cases:
+				stats = measure(lambda: api_get(view, user, '/api/tasks/', dict(params, pagination='cursor')), options['repeat'])
+				name = '&'.join(f'{key}={value}' for key, value in params.items())
+				self.stdout.write(f'{name:>60} {stats["p50"]:>8.2f} {stats["p99"]:>8.2f}  {get_plan(params)}')
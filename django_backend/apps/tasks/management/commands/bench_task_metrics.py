@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from apps.tasks.bench import (
+	BENCH_HOST,
+	get_bench_user,
+	measure,
+)
+from apps.tasks.models import Task
+
+CASES = [
+	('list', '/api/tasks/', {'page_size': 30, 'expand': 'tags,assigned_to'}),
+	('cursor list', '/api/tasks/', {'pagination': 'cursor', 'page_size': 30}),
+	('detail', '/api/tasks/{pk}/', {}),
+	('activity', '/api/tasks/{pk}/activity/', {}),
+	('health', '/health/', {}),
+]
+
+class Command(BaseCommand):
+	help = 'Cost of the request instrumentation (metrics_middleware, query wrapper, timers), full middleware stack'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--repeat', type=int, default=300)
+
+	def handle(self, *args, **options):
+		user = get_bench_user()
+		pk = Task.objects.filter(created_by=user).values_list('pk', flat=True).first()
+		client = APIClient(HTTP_HOST=BENCH_HOST)
+		client.force_authenticate(user)
+
+		self.stdout.write(f'{"":>12} {"off p50":>10} {"on p50":>10} {"off p99":>10} {"on p99":>10} {"p50 +":>8}')
+		for name, path, params in CASES:
+			path = path.format(pk=pk)
+			results = {}
+			# The response cache would turn every request into a hit
+			with override_settings(TASK_CACHE_TIMEOUT=0):
+				# Interleaved, so drift hits both the same
+				for _ in range(2):
+					for enabled in (False, True):
+						with override_settings(METRICS_ENABLED=enabled):
+							results[enabled] = measure(lambda: client.get(path, params), options['repeat'])
+			off, on = results[False], results[True]
+			self.stdout.write(
+				f'{name:>12} {off["p50"]:>10.3f} {on["p50"]:>10.3f} {off["p99"]:>10.3f} {on["p99"]:>10.3f}'
+				f' {(on["p50"] - off["p50"]) / off["p50"] * 100:>7.1f}%'
+			)
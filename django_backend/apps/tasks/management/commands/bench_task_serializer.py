@@ -0,0 +1,70 @@
+import json
+from django.core.management.base import (
+	BaseCommand,
+	CommandError,
+)
+from django.db.models import F
+from rest_framework.renderers import JSONRenderer
+from apps.tasks.bench import (
+	get_bench_user,
+	measure,
+	seed_tasks,
+)
+from apps.tasks.models import Task
+from apps.tasks.serializer import (
+	TaskSerializer,
+	TaskRowSerializer,
+)
+from apps.tasks.services import (
+	get_task_queryset,
+	get_task_rows,
+)
+
+class Command(BaseCommand):
+	help = 'Compare TaskSerializer and TaskRowSerializer: identical JSON, then query + serialize + render time per page size'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--seed', type=int, default=0, help='Insert this many tasks before measuring')
+		parser.add_argument('--page-sizes', default='10,30,100,500')
+		parser.add_argument('--repeat', type=int, default=20)
+		parser.add_argument('--check-rows', type=int, default=5000, help='Rows compared field by field first')
+
+	def render_model_page(self, size: int) -> bytes:
+		tasks = list(get_task_queryset().order_by('id')[:size])
+		return JSONRenderer().render(TaskSerializer(tasks, many=True).data)
+
+	def render_row_page(self, size: int) -> bytes:
+		rows = list(get_task_rows(get_task_queryset().order_by('id'))[:size])
+		return JSONRenderer().render(TaskRowSerializer(rows, many=True).data)
+
+	def check_compatibility(self, rows: int) -> None:
+		# Subtasks first, then the newest ones
+		mismatches = 0
+		ordering = (F('parent_task').desc(nulls_last=True), '-id')
+		ids = list(Task.objects.order_by(*ordering).values_list('id', flat=True)[:rows])
+		for start in range(0, len(ids), 500):
+			chunk = ids[start:start + 500]
+			expected = TaskSerializer(get_task_queryset().filter(pk__in=chunk).order_by('id'), many=True).data
+			actual = TaskRowSerializer(get_task_rows(get_task_queryset().filter(pk__in=chunk).order_by('id')), many=True).data
+			for old, new in zip(expected, actual):
+				if JSONRenderer().render(old) != JSONRenderer().render(new):
+					mismatches += 1
+					if mismatches <= 5:
+						self.stderr.write(f'Task {old["id"]}:\n  {json.dumps(old, default=str)}\n  {json.dumps(new, default=str)}')
+		if mismatches:
+			raise CommandError(f'{mismatches} of {len(ids)} tasks render differently')
+		self.stdout.write(f'{len(ids)} tasks render identical JSON')
+
+	def handle(self, *args, **options):
+		user = get_bench_user()
+		if options['seed']:
+			self.stdout.write(f'Seeded {seed_tasks(options["seed"], user)} tasks')
+		if not Task.objects.exists():
+			raise CommandError('No tasks to serialize, use --seed')
+		self.check_compatibility(options['check_rows'])
+
+		self.stdout.write(f'{"page size":>10} {"model p50 ms":>13} {"rows p50 ms":>12} {"speedup":>8}')
+		for size in [int(size) for size in options['page_sizes'].split(',')]:
+			model = measure(lambda: self.render_model_page(size), options['repeat'])
+			rows = measure(lambda: self.render_row_page(size), options['repeat'])
+			self.stdout.write(f'{size:>10} {model["p50"]:>13.2f} {rows["p50"]:>12.2f} {model["p50"] / rows["p50"]:>7.1f}x')
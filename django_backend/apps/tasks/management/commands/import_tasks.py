@@ -0,0 +1,64 @@
+from django.core.management.base import (
+	BaseCommand,
+	CommandError,
+)
+from apps.users.models import User
+from apps.tasks.importer import (
+	MAX_REPORTED_ERRORS,
+	TaskImportError,
+	import_files,
+)
+
+class Command(BaseCommand):
+	help = 'Import tasks, assignments and tags from CSV or NDJSON files with COPY and set-based upserts'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--tasks', help='Tasks file, same columns as /api/tasks/export')
+		parser.add_argument('--assignments', help='Assignments file with task, user and optional assigned_by')
+		parser.add_argument('--tags', help='Tags file with a name column')
+		parser.add_argument('--format', choices=['csv', 'ndjson'], help='Default: from the file extension')
+		parser.add_argument('--assigned-by', help='Username recorded as assigned_by when the file has none')
+		parser.add_argument('--dry-run', action='store_true', help='Validate and write, then roll back')
+		parser.add_argument('--errors', help='Write every error to this CSV file')
+		parser.add_argument('--max-errors', type=int, default=MAX_REPORTED_ERRORS, help='Errors printed here')
+
+	def handle(self, *args, **options):
+		files = {source: options[source] for source in ('tasks', 'assignments', 'tags') if options[source]}
+		if not files:
+			raise CommandError('Nothing to import, use --tasks, --assignments or --tags')
+		assigned_by_id = None
+		if options['assigned_by']:
+			assigned_by_id = User.objects.filter(username=options['assigned_by']).values_list('id', flat=True).first()
+			if assigned_by_id is None:
+				raise CommandError(f'User {options["assigned_by"]} does not exist')
+
+		try:
+			report = import_files(
+				files,
+				file_format=options['format'],
+				dry_run=options['dry_run'],
+				assigned_by_id=assigned_by_id,
+				error_report=options['errors'],
+				max_errors=options['max_errors'],
+			)
+		except (TaskImportError, OSError) as e:
+			raise CommandError(str(e))
+
+		for source, rows in report['rows'].items():
+			self.stdout.write(f'{source}: {rows} rows')
+		if report['errors']:
+			for error in report['error_sample']:
+				self.stdout.write(
+					f'{error["source"]} row {error["row"]} {error["field"] or ""}: {error["message"]} ({error["value"]!r})'
+				)
+			if options['errors']:
+				self.stdout.write(f'All errors written to {options["errors"]}')
+			raise CommandError(f'{report["errors"]} invalid values, nothing imported')
+
+		for key in ('tags_created', 'tasks_inserted', 'tasks_updated', 'task_tags_added', 'assignments_added'):
+			if key in report:
+				self.stdout.write(f'{key}: {report[key]}')
+		rows = sum(report['rows'].values())
+		per_minute = int(rows / report['seconds'] * 60) if report['seconds'] else rows
+		prefix = 'Dry run, rolled back. ' if report['dry_run'] else ''
+		self.stdout.write(self.style.SUCCESS(f'{prefix}{rows} rows in {report["seconds"]}s ({per_minute} rows/min)'))
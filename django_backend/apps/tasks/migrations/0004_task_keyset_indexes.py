@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('tasks', '0003_remove_taskassignment_tasks_taska_user_id_d33430_idx_and_more'),
+	]
+
+	operations = [
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(fields=['due_date', 'id'], name='tasks_task_due_date_id_idx'),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(fields=['created_at', 'id'], name='tasks_task_created_id_idx'),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(fields=['updated_at', 'id'], name='tasks_task_updated_id_idx'),
+		),
+	]
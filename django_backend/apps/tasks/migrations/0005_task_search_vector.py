@@ -0,0 +1,106 @@
+# Generated by Django 4.2 on 2026-10-18 17:09
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# search_vector = title (A) + tag names (B) + description (C), built in the
+# database so ORM saves, bulk writes and raw SQL imports all keep it current
+SEARCH_TRIGGERS = """
+CREATE OR REPLACE FUNCTION tasks_task_build_search_vector(task_id bigint, title text, description text)
+RETURNS tsvector AS $$
+	SELECT
+		setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+		setweight(to_tsvector('english', coalesce((
+			SELECT string_agg(tag.name, ' ')
+			FROM tasks_task_tags task_tag
+			JOIN tasks_tag tag ON tag.id = task_tag.tag_id
+			WHERE task_tag.task_id = $1
+		), '')), 'B') ||
+		setweight(to_tsvector('english', coalesce(description, '')), 'C')
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION tasks_task_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+	NEW.search_vector := tasks_task_build_search_vector(NEW.id, NEW.title, NEW.description);
+	RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_task_search_vector_update
+	BEFORE INSERT OR UPDATE OF title, description ON tasks_task
+	FOR EACH ROW EXECUTE FUNCTION tasks_task_search_vector_trigger();
+
+-- Statement level with transition tables: one UPDATE per tags.set()/bulk insert
+CREATE OR REPLACE FUNCTION tasks_task_tags_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+	UPDATE tasks_task task
+	SET search_vector = tasks_task_build_search_vector(task.id, task.title, task.description)
+	WHERE task.id IN (SELECT task_id FROM changed_rows);
+	RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_task_tags_search_vector_insert
+	AFTER INSERT ON tasks_task_tags
+	REFERENCING NEW TABLE AS changed_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION tasks_task_tags_search_vector_trigger();
+
+CREATE TRIGGER tasks_task_tags_search_vector_delete
+	AFTER DELETE ON tasks_task_tags
+	REFERENCING OLD TABLE AS changed_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION tasks_task_tags_search_vector_trigger();
+
+CREATE OR REPLACE FUNCTION tasks_tag_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+	UPDATE tasks_task task
+	SET search_vector = tasks_task_build_search_vector(task.id, task.title, task.description)
+	WHERE task.id IN (SELECT task_id FROM tasks_task_tags WHERE tag_id = NEW.id);
+	RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_tag_search_vector_rename
+	AFTER UPDATE OF name ON tasks_tag
+	FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+	EXECUTE FUNCTION tasks_tag_search_vector_trigger();
+
+UPDATE tasks_task SET search_vector = tasks_task_build_search_vector(id, title, description);
+"""
+
+DROP_SEARCH_TRIGGERS = """
+DROP TRIGGER IF EXISTS tasks_tag_search_vector_rename ON tasks_tag;
+DROP TRIGGER IF EXISTS tasks_task_tags_search_vector_delete ON tasks_task_tags;
+DROP TRIGGER IF EXISTS tasks_task_tags_search_vector_insert ON tasks_task_tags;
+DROP TRIGGER IF EXISTS tasks_task_search_vector_update ON tasks_task;
+DROP FUNCTION IF EXISTS tasks_tag_search_vector_trigger();
+DROP FUNCTION IF EXISTS tasks_task_tags_search_vector_trigger();
+DROP FUNCTION IF EXISTS tasks_task_search_vector_trigger();
+DROP FUNCTION IF EXISTS tasks_task_build_search_vector(bigint, text, text);
+"""
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('tasks', '0004_task_keyset_indexes'),
+	]
+
+	operations = [
+		TrigramExtension(),
+		migrations.AddField(
+			model_name='task',
+			name='search_vector',
+			field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='tasks_task_search_idx'),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='tasks_task_title_trgm_idx', opclasses=['gin_trgm_ops']),
+		),
+		migrations.RunSQL(SEARCH_TRIGGERS, DROP_SEARCH_TRIGGERS),
+	]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-18 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('tasks', '0005_task_search_vector'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='JobCheckpoint',
+			fields=[
+				('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+				('position_at', models.DateTimeField(null=True)),
+				('position_id', models.BigIntegerField(null=True)),
+				('updated_at', models.DateTimeField(auto_now=True)),
+			],
+		),
+		migrations.AlterField(
+			model_name='task',
+			name='status',
+			field=models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('completed', 'Completed'), ('overdue', 'Overdue')], max_length=20),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(condition=models.Q(models.Q(('status__in', ['completed', 'overdue']), _negated=True), ('is_deleted', False)), fields=['due_date', 'id'], name='tasks_task_open_due_idx'),
+		),
+	]
@@ -0,0 +1,83 @@
+# Generated by Django 4.2 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+# One row per (dimension, key) with the task count and hour sums. Refreshed
+# CONCURRENTLY by refresh_task_stats, which needs the unique index on id.
+# Due date buckets are relative to the refresh time
+TASK_STATS_VIEW = """
+CREATE MATERIALIZED VIEW tasks_task_stats AS
+WITH live AS (
+	SELECT id, status, priority, due_date, estimated_hours, actual_hours
+	FROM tasks_task
+	WHERE NOT is_deleted
+), grouped AS (
+	SELECT 'total' AS dimension, 'all' AS key, NULL AS label,
+		count(*) AS tasks, sum(estimated_hours) AS estimated_hours, sum(actual_hours) AS actual_hours
+	FROM live
+	UNION ALL
+	SELECT 'status', status, NULL, count(*), sum(estimated_hours), sum(actual_hours)
+	FROM live GROUP BY status
+	UNION ALL
+	SELECT 'priority', priority, NULL, count(*), sum(estimated_hours), sum(actual_hours)
+	FROM live GROUP BY priority
+	UNION ALL
+	SELECT 'assignee', assignment.user_id::text, min(assignee.username), count(*), sum(estimated_hours), sum(actual_hours)
+	FROM live
+	JOIN tasks_taskassignment assignment ON assignment.task_id = live.id
+	JOIN users_user assignee ON assignee.id = assignment.user_id
+	GROUP BY assignment.user_id
+	UNION ALL
+	SELECT 'tag', task_tag.tag_id::text, min(tag.name), count(*), sum(estimated_hours), sum(actual_hours)
+	FROM live
+	JOIN tasks_task_tags task_tag ON task_tag.task_id = live.id
+	JOIN tasks_tag tag ON tag.id = task_tag.tag_id
+	GROUP BY task_tag.tag_id
+	UNION ALL
+	SELECT 'due_date', bucket, NULL, count(*), sum(estimated_hours), sum(actual_hours)
+	FROM (
+		SELECT estimated_hours, actual_hours, CASE
+			WHEN due_date < now() THEN 'past'
+			WHEN due_date < now() + interval '1 day' THEN 'next_day'
+			WHEN due_date < now() + interval '7 days' THEN 'next_week'
+			WHEN due_date < now() + interval '30 days' THEN 'next_month'
+			ELSE 'later'
+		END AS bucket
+		FROM live
+	) bucketed
+	GROUP BY bucket
+)
+SELECT dimension || ':' || key AS id, dimension, key, label, tasks,
+	coalesce(estimated_hours, 0)::numeric(20, 2) AS estimated_hours,
+	coalesce(actual_hours, 0)::numeric(20, 2) AS actual_hours
+FROM grouped;
+
+CREATE UNIQUE INDEX tasks_task_stats_id_idx ON tasks_task_stats (id);
+"""
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('tasks', '0006_task_overdue_status'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='TaskStats',
+			fields=[
+				('id', models.TextField(primary_key=True, serialize=False)),
+				('dimension', models.TextField()),
+				('key', models.TextField()),
+				('label', models.TextField(null=True)),
+				('tasks', models.BigIntegerField()),
+				('estimated_hours', models.DecimalField(decimal_places=2, max_digits=20)),
+				('actual_hours', models.DecimalField(decimal_places=2, max_digits=20)),
+			],
+			options={
+				'db_table': 'tasks_task_stats',
+				'managed': False,
+			},
+		),
+		migrations.RunSQL(TASK_STATS_VIEW, 'DROP MATERIALIZED VIEW IF EXISTS tasks_task_stats'),
+	]
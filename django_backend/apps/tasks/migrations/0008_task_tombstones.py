@@ -0,0 +1,66 @@
+# Generated by Django 4.2 on 2026-10-18 17:46
+
+from django.db import migrations, models
+
+# One statement level trigger per table, so ORM deletes, bulk deletes, the
+# purge job's SQL and cascades all leave a tombstone per row, inserted with
+# a single INSERT ... SELECT from the transition table. clock_timestamp() is
+# the time of the delete itself, not the start of its transaction, see
+# sync.get_sync_horizon
+TOMBSTONE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION tasks_task_tombstone_trigger() RETURNS trigger AS $$
+BEGIN
+	INSERT INTO tasks_tasktombstone (task_id, user_id, deleted_at)
+	SELECT id, NULL, clock_timestamp() FROM deleted_rows;
+	RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_task_tombstone
+	AFTER DELETE ON tasks_task
+	REFERENCING OLD TABLE AS deleted_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION tasks_task_tombstone_trigger();
+
+CREATE OR REPLACE FUNCTION tasks_taskassignment_tombstone_trigger() RETURNS trigger AS $$
+BEGIN
+	INSERT INTO tasks_tasktombstone (task_id, user_id, deleted_at)
+	SELECT task_id, user_id, clock_timestamp() FROM deleted_rows;
+	RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_taskassignment_tombstone
+	AFTER DELETE ON tasks_taskassignment
+	REFERENCING OLD TABLE AS deleted_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION tasks_taskassignment_tombstone_trigger();
+"""
+
+DROP_TOMBSTONE_TRIGGERS = """
+DROP TRIGGER IF EXISTS tasks_taskassignment_tombstone ON tasks_taskassignment;
+DROP TRIGGER IF EXISTS tasks_task_tombstone ON tasks_task;
+DROP FUNCTION IF EXISTS tasks_taskassignment_tombstone_trigger();
+DROP FUNCTION IF EXISTS tasks_task_tombstone_trigger();
+"""
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('tasks', '0007_task_stats_view'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='TaskTombstone',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('task_id', models.BigIntegerField()),
+				('user_id', models.BigIntegerField(null=True)),
+				('deleted_at', models.DateTimeField()),
+			],
+		),
+		migrations.AddIndex(
+			model_name='tasktombstone',
+			index=models.Index(fields=['deleted_at', 'id'], name='tasks_tombstone_deleted_idx'),
+		),
+		migrations.RunSQL(TOMBSTONE_TRIGGERS, DROP_TOMBSTONE_TRIGGERS),
+	]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('tasks', '0008_task_tombstones'),
+	]
+
+	operations = [
+		migrations.RemoveIndex(
+			model_name='task',
+			name='tasks_task_due_date_id_idx',
+		),
+		migrations.RemoveIndex(
+			model_name='task',
+			name='tasks_task_created_id_idx',
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(condition=models.Q(('is_deleted', False)), fields=['due_date', 'id'], name='tasks_task_live_due_idx'),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(condition=models.Q(('is_deleted', False)), fields=['created_at', 'id'], name='tasks_task_live_created_idx'),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(condition=models.Q(('is_deleted', False)), fields=['updated_at', 'id'], name='tasks_task_live_updated_idx'),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(condition=models.Q(('is_deleted', False)), fields=['created_by'], name='tasks_task_live_creator_idx'),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(condition=models.Q(('is_deleted', False)), fields=['status', 'priority'], name='tasks_task_live_status_idx'),
+		),
+	]
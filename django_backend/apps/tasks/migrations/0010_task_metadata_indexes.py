@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-18 18:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.fields.json
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('tasks', '0009_task_live_indexes'),
+	]
+
+	operations = [
+		migrations.AddIndex(
+			model_name='task',
+			index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('is_deleted', False)), fields=['metadata'], name='tasks_task_metadata_idx', opclasses=['jsonb_path_ops']),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(django.db.models.fields.json.KeyTransform('external_id', 'metadata'), name='tasks_meta_external_id_idx'),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(django.db.models.fields.json.KeyTransform('sprint', 'metadata'), name='tasks_meta_sprint_idx'),
+		),
+		migrations.AddIndex(
+			model_name='task',
+			index=models.Index(django.db.models.fields.json.KeyTransform('customer_id', 'metadata'), name='tasks_meta_customer_id_idx'),
+		),
+	]
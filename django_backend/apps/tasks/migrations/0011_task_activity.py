@@ -0,0 +1,64 @@
+# Generated by Django 4.2 on 2026-10-18 18:03
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+# Range partitioned by month, the partitions are created as rows for a month
+# come in (activity.ensure_activity_partitions) and dropped whole by
+# cleanup_task_activity. A partitioned table's primary key has to include the
+# partition key. Rows can't be changed or deleted, only their partition dropped
+ACTIVITY_TABLE = """
+CREATE TABLE tasks_task_activity (
+	id bigserial,
+	task_id bigint NOT NULL,
+	user_id bigint,
+	action varchar(20) NOT NULL,
+	changes jsonb NOT NULL,
+	created_at timestamptz NOT NULL,
+	PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- GET /api/tasks/<pk>/activity/, newest first
+CREATE INDEX tasks_activity_task_idx ON tasks_task_activity (task_id, created_at, id);
+
+CREATE OR REPLACE FUNCTION tasks_task_activity_append_only() RETURNS trigger AS $$
+BEGIN
+	RAISE EXCEPTION 'tasks_task_activity is append-only';
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tasks_task_activity_append_only
+	BEFORE UPDATE OR DELETE ON tasks_task_activity
+	FOR EACH ROW EXECUTE FUNCTION tasks_task_activity_append_only();
+"""
+
+DROP_ACTIVITY_TABLE = """
+DROP TABLE IF EXISTS tasks_task_activity;
+DROP FUNCTION IF EXISTS tasks_task_activity_append_only();
+"""
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('tasks', '0010_task_metadata_indexes'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='TaskActivity',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('task_id', models.BigIntegerField()),
+				('user_id', models.BigIntegerField(null=True)),
+				('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted'), ('assigned', 'Assigned'), ('unassigned', 'Unassigned'), ('tags', 'Tags changed')], max_length=20)),
+				('changes', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+				('created_at', models.DateTimeField()),
+			],
+			options={
+				'db_table': 'tasks_task_activity',
+				'managed': False,
+			},
+		),
+		migrations.RunSQL(ACTIVITY_TABLE, DROP_ACTIVITY_TABLE),
+	]
@@ -0,0 +1,96 @@
+# Generated by Django 4.2 on 2026-10-18 18:11
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+# Cold tier for jobs.archive_tasks: the same columns as the hot tables (LIKE),
+# without their foreign keys, triggers or partial indexes. Only the indexes the
+# ?include_archived=true listing orders, filters and searches by. The views
+# union both tiers for the *WithArchive models, predicates and ORDER BY are
+# pushed down into each branch so both tiers' indexes are used
+ARCHIVE_TABLES = """
+CREATE TABLE tasks_task_archive (LIKE tasks_task, PRIMARY KEY (id));
+CREATE INDEX tasks_archive_due_idx ON tasks_task_archive (due_date, id);
+CREATE INDEX tasks_archive_created_idx ON tasks_task_archive (created_at, id);
+CREATE INDEX tasks_archive_updated_idx ON tasks_task_archive (updated_at, id);
+CREATE INDEX tasks_archive_creator_idx ON tasks_task_archive (created_by_id);
+CREATE INDEX tasks_archive_parent_idx ON tasks_task_archive (parent_task_id);
+CREATE INDEX tasks_archive_search_idx ON tasks_task_archive USING gin (search_vector);
+
+CREATE TABLE tasks_taskassignment_archive (LIKE tasks_taskassignment, PRIMARY KEY (id));
+CREATE INDEX tasks_assignment_archive_task_idx ON tasks_taskassignment_archive (task_id);
+
+CREATE TABLE tasks_task_tags_archive (LIKE tasks_task_tags, PRIMARY KEY (id));
+CREATE INDEX tasks_tags_archive_task_idx ON tasks_task_tags_archive (task_id);
+
+CREATE VIEW tasks_task_all AS
+	SELECT * FROM tasks_task UNION ALL SELECT * FROM tasks_task_archive;
+CREATE VIEW tasks_taskassignment_all AS
+	SELECT * FROM tasks_taskassignment UNION ALL SELECT * FROM tasks_taskassignment_archive;
+CREATE VIEW tasks_task_tags_all AS
+	SELECT * FROM tasks_task_tags UNION ALL SELECT * FROM tasks_task_tags_archive;
+"""
+
+DROP_ARCHIVE_TABLES = """
+DROP VIEW IF EXISTS tasks_task_tags_all;
+DROP VIEW IF EXISTS tasks_taskassignment_all;
+DROP VIEW IF EXISTS tasks_task_all;
+DROP TABLE IF EXISTS tasks_task_tags_archive;
+DROP TABLE IF EXISTS tasks_taskassignment_archive;
+DROP TABLE IF EXISTS tasks_task_archive;
+"""
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('tasks', '0011_task_activity'),
+	]
+
+	operations = [
+		migrations.RunSQL(ARCHIVE_TABLES, DROP_ARCHIVE_TABLES),
+		migrations.CreateModel(
+			name='TaskAssignmentWithArchive',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('assigned_at', models.DateTimeField()),
+			],
+			options={
+				'db_table': 'tasks_taskassignment_all',
+				'managed': False,
+			},
+		),
+		migrations.CreateModel(
+			name='TaskTagWithArchive',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+			],
+			options={
+				'db_table': 'tasks_task_tags_all',
+				'managed': False,
+			},
+		),
+		migrations.CreateModel(
+			name='TaskWithArchive',
+			fields=[
+				('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+				('title', models.CharField(max_length=200)),
+				('description', models.TextField()),
+				('status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('completed', 'Completed'), ('overdue', 'Overdue')], max_length=20)),
+				('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('extreme', 'Extreme')], max_length=20)),
+				('due_date', models.DateTimeField()),
+				('estimated_hours', models.DecimalField(decimal_places=2, max_digits=5)),
+				('actual_hours', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+				('metadata', models.JSONField(blank=True, default=dict, null=True)),
+				('created_at', models.DateTimeField()),
+				('updated_at', models.DateTimeField()),
+				('is_archived', models.BooleanField(default=False)),
+				('is_deleted', models.BooleanField(default=False)),
+				('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+			],
+			options={
+				'db_table': 'tasks_task_all',
+				'managed': False,
+			},
+		),
+	]
@@ -0,0 +1,52 @@
+from django.db import migrations
+
+# The tasks_*_all views of 0012 were SELECT * on both sides of the UNION ALL,
+# which pairs columns by position. A column added to a hot table and its
+# archive table in a different order would silently end up under the wrong
+# name, so the views name their columns. A new column goes in both lists
+ARCHIVE_VIEWS = """
+DROP VIEW tasks_task_all;
+CREATE VIEW tasks_task_all AS
+	SELECT id, title, description, status, priority, due_date, estimated_hours, actual_hours, metadata,
+		created_at, updated_at, is_archived, created_by_id, parent_task_id, is_deleted, search_vector
+	FROM tasks_task
+	UNION ALL
+	SELECT id, title, description, status, priority, due_date, estimated_hours, actual_hours, metadata,
+		created_at, updated_at, is_archived, created_by_id, parent_task_id, is_deleted, search_vector
+	FROM tasks_task_archive;
+
+DROP VIEW tasks_taskassignment_all;
+CREATE VIEW tasks_taskassignment_all AS
+	SELECT id, assigned_at, assigned_by_id, task_id, user_id FROM tasks_taskassignment
+	UNION ALL
+	SELECT id, assigned_at, assigned_by_id, task_id, user_id FROM tasks_taskassignment_archive;
+
+DROP VIEW tasks_task_tags_all;
+CREATE VIEW tasks_task_tags_all AS
+	SELECT id, task_id, tag_id FROM tasks_task_tags
+	UNION ALL
+	SELECT id, task_id, tag_id FROM tasks_task_tags_archive;
+"""
+
+STAR_VIEWS = """
+DROP VIEW tasks_task_all;
+CREATE VIEW tasks_task_all AS
+	SELECT * FROM tasks_task UNION ALL SELECT * FROM tasks_task_archive;
+DROP VIEW tasks_taskassignment_all;
+CREATE VIEW tasks_taskassignment_all AS
+	SELECT * FROM tasks_taskassignment UNION ALL SELECT * FROM tasks_taskassignment_archive;
+DROP VIEW tasks_task_tags_all;
+CREATE VIEW tasks_task_tags_all AS
+	SELECT * FROM tasks_task_tags UNION ALL SELECT * FROM tasks_task_tags_archive;
+"""
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('tasks', '0012_task_archive'),
+	]
+
+	operations = [
+		migrations.RunSQL(ARCHIVE_VIEWS, STAR_VIEWS),
+	]
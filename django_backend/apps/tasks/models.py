@@ -1,14 +1,39 @@
-from django.db import models
-from django.db.models import UniqueConstraint
+from typing import (
+	List,
+	Type,
+)
+from django.db import (
+	connections,
+	models,
+)
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import (
+	Q,
+	UniqueConstraint,
+)
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.fields.json import KeyTransform
+from django.utils import timezone
 from apps.users.models import User
-from apps.common.models import SoftDeleteModel
+from apps.common.models import (
+	SoftDeleteManager,
+	SoftDeleteModel,
+	SoftDeleteQuerySet,
+)
+from apps.common.signals import soft_deleted
 
 STATUS_CHOICES = [
 	('pending', 'Pending'),
 	('in_progress', 'In Progress'),
 	('completed', 'Completed'),
+	# Set by the check_overdue_tasks job, not by users
+	('overdue', 'Overdue'),
 ]
 
+# Statuses the overdue job never touches
+CLOSED_STATUSES = ['completed', 'overdue']
+
 PRIORITY_CHOICES = [
 	('low', 'Low'),
 	('medium', 'Medium'),
@@ -22,6 +47,40 @@ class Tag(models.Model):
 	def __str__(self):
 			return self.name
 
+# The tasks and all their live subtasks in one UPDATE, UNION stops on cycles.
+# updated_at is set like auto_now would, /api/tasks/changes reports them
+SOFT_DELETE_SQL = """
+	WITH RECURSIVE doomed(id) AS (
+		{tasks}
+		UNION
+		SELECT child.id FROM tasks_task child JOIN doomed ON child.parent_task_id = doomed.id
+		WHERE NOT child.is_deleted
+	)
+	UPDATE tasks_task SET is_deleted = true, updated_at = %s
+	WHERE id IN (SELECT id FROM doomed) AND NOT is_deleted
+	RETURNING id
+"""
+
+class TaskQuerySet(SoftDeleteQuerySet):
+	# Returns the ids it soft-deleted, subtasks included
+	def soft_delete(self) -> List[int]:
+		tasks, params = self.order_by().values('pk').query.sql_with_params()
+		with connections[self.db].cursor() as cursor:
+			cursor.execute(SOFT_DELETE_SQL.format(tasks=tasks), [*params, timezone.now()])
+			deleted = [row[0] for row in cursor.fetchall()]
+		if deleted:
+			soft_deleted.send(sender=self.model)
+		return deleted
+
+# Live rows only (WHERE is_deleted = false) are served by the partial indexes
+# below, so deleted rows don't make them any bigger
+LIVE = Q(is_deleted=False)
+
+# Top-level metadata keys the integrations look tasks up by, each one gets a
+# btree index on metadata -> 'key' (see filters.filter_metadata). Adding a key
+# needs a makemigrations, and short keys: the index name is limited to 30 chars
+METADATA_INDEXED_KEYS = ('external_id', 'sprint', 'customer_id')
+
 class Task(SoftDeleteModel, models.Model):
 	title = models.CharField(max_length=200)
 	description = models.TextField()
@@ -42,6 +101,110 @@ class Task(SoftDeleteModel, models.Model):
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 	is_archived = models.BooleanField(default=False)
+	# Title, tag names and description, kept up to date by triggers (migration 0005)
+	search_vector = SearchVectorField(null=True, editable=False)
+
+	objects = SoftDeleteManager.from_queryset(TaskQuerySet)()
+	all_objects = models.Manager.from_queryset(TaskQuerySet)()
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# The values as read, for the activity log diff (activity.pop_task_changes)
+		instance._loaded_values = dict(zip(field_names, values))
+		return instance
+
+	# Composite indexes for keyset pagination, see pagination.TaskKeysetPagination.
+	# updated_at also has a full one for /api/tasks/changes, which reads deleted rows
+	class Meta:
+		indexes = [
+			models.Index(fields=['due_date', 'id'], name='tasks_task_live_due_idx', condition=LIVE),
+			models.Index(fields=['created_at', 'id'], name='tasks_task_live_created_idx', condition=LIVE),
+			models.Index(fields=['updated_at', 'id'], name='tasks_task_live_updated_idx', condition=LIVE),
+			models.Index(fields=['updated_at', 'id'], name='tasks_task_updated_id_idx'),
+			# ?created_by=, ?status= and ?priority=
+			models.Index(fields=['created_by'], name='tasks_task_live_creator_idx', condition=LIVE),
+			models.Index(fields=['status', 'priority'], name='tasks_task_live_status_idx', condition=LIVE),
+			GinIndex(fields=['search_vector'], name='tasks_task_search_idx'),
+			GinIndex(fields=['title'], name='tasks_task_title_trgm_idx', opclasses=['gin_trgm_ops']),
+			# ?metadata__<key>=<value> containment (@>). jsonb_path_ops is a
+			# fraction of the default jsonb_ops size but can't serve ? (has key)
+			GinIndex(fields=['metadata'], name='tasks_task_metadata_idx', opclasses=['jsonb_path_ops'], condition=LIVE),
+			# Not partial, the planner only takes expression statistics from
+			# full indexes and would guess the selectivity otherwise
+			*[
+				models.Index(KeyTransform(key, 'metadata'), name=f'tasks_meta_{key}_idx')
+				for key in METADATA_INDEXED_KEYS
+			],
+			# Only tasks that can still become overdue, so the overdue job scans
+			# just the rows it's going to update
+			models.Index(
+				fields=['due_date', 'id'],
+				name='tasks_task_open_due_idx',
+				condition=~Q(status__in=CLOSED_STATUSES) & LIVE,
+			),
+		]
+
+# HOT/COLD SPLIT
+# The archive_tasks job moves completed and archived tasks that nobody touched
+# for TASK_ARCHIVE_AFTER_DAYS, with their assignments and tag rows, to
+# tasks_task_archive, tasks_taskassignment_archive and tasks_task_tags_archive
+# (migration 0012, views in 0013). Same columns, no foreign keys or triggers, so the hot
+# tables and their indexes only hold what's still being worked on. A column
+# added to Task has to be added to the archive table and its view too.
+# The models below read the tasks_*_all views, hot rows UNION ALL cold rows,
+# for ?include_archived=true. Same field names as Task so the filters, search,
+# pagination and row queries work on them unchanged. Read only
+
+# Columns of a hot table for the INSERT ... SELECT between it and its archive
+# table (jobs.ARCHIVE_BATCH_SQL, archive.RESTORE_SQL). By name, a column
+# added to both later can end up in a different position in each
+def get_column_list(model: Type[models.Model]) -> str:
+	return ', '.join(f'"{field.column}"' for field in model._meta.concrete_fields)
+
+class TaskWithArchive(models.Model):
+	title = models.CharField(max_length=200)
+	description = models.TextField()
+	status = models.CharField(choices=STATUS_CHOICES, max_length=20)
+	priority = models.CharField(choices=PRIORITY_CHOICES, max_length=20)
+	due_date = models.DateTimeField()
+	estimated_hours = models.DecimalField(max_digits=5, decimal_places=2)
+	actual_hours = models.DecimalField(null=True, max_digits=5, decimal_places=2)
+	created_by = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+	assigned_to = models.ManyToManyField(User, through='TaskAssignmentWithArchive', through_fields=('task', 'user'), related_name='+')
+	tags = models.ManyToManyField(Tag, through='TaskTagWithArchive', related_name='+')
+	parent_task = models.ForeignKey('self', null=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+	metadata = models.JSONField(default=dict, blank=True, null=True)
+	created_at = models.DateTimeField()
+	updated_at = models.DateTimeField()
+	is_archived = models.BooleanField(default=False)
+	is_deleted = models.BooleanField(default=False)
+	search_vector = SearchVectorField(null=True, editable=False)
+
+	objects = SoftDeleteManager()
+	all_objects = models.Manager()
+
+	class Meta:
+		managed = False
+		db_table = 'tasks_task_all'
+
+class TaskAssignmentWithArchive(models.Model):
+	user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+	task = models.ForeignKey(TaskWithArchive, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+	assigned_at = models.DateTimeField()
+	assigned_by = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+
+	class Meta:
+		managed = False
+		db_table = 'tasks_taskassignment_all'
+
+class TaskTagWithArchive(models.Model):
+	task = models.ForeignKey(TaskWithArchive, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+	tag = models.ForeignKey(Tag, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+
+	class Meta:
+		managed = False
+		db_table = 'tasks_task_tags_all'
 
 class TaskAssignment(models.Model):
 	user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -57,3 +220,69 @@ class TaskAssignment(models.Model):
 
 	def __str__(self):
 		return f"{self.user.username} assigned to {self.task.title} by {self.assigned_by.username}"
+
+
+# Where a periodic job stopped, so the next run continues from there
+# instead of scanning everything again
+class JobCheckpoint(models.Model):
+	name = models.CharField(max_length=100, primary_key=True)
+	position_at = models.DateTimeField(null=True)
+	position_id = models.BigIntegerField(null=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return f"{self.name} at {self.position_at} / {self.position_id}"
+
+# Read-only rows of the tasks_task_stats materialized view (migration 0007),
+# refreshed by the refresh_task_stats Celery task
+class TaskStats(models.Model):
+	id = models.TextField(primary_key=True)
+	dimension = models.TextField()
+	key = models.TextField()
+	label = models.TextField(null=True)
+	tasks = models.BigIntegerField()
+	estimated_hours = models.DecimalField(max_digits=20, decimal_places=2)
+	actual_hours = models.DecimalField(max_digits=20, decimal_places=2)
+
+	class Meta:
+		managed = False
+		db_table = 'tasks_task_stats'
+
+# Tasks and assignments removed from the database, written by triggers
+# (migration 0008) so /api/tasks/changes can report deletions whatever
+# deleted the rows. user_id is null for a task, set for an assignment
+class TaskTombstone(models.Model):
+	task_id = models.BigIntegerField()
+	user_id = models.BigIntegerField(null=True)
+	deleted_at = models.DateTimeField()
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['deleted_at', 'id'], name='tasks_tombstone_deleted_idx'),
+		]
+
+ACTIVITY_ACTIONS = [
+	('created', 'Created'),
+	('updated', 'Updated'),
+	('deleted', 'Deleted'),
+	('assigned', 'Assigned'),
+	('unassigned', 'Unassigned'),
+	('tags', 'Tags changed'),
+	('archived', 'Moved to the archive'),
+	('restored', 'Restored from the archive'),
+]
+
+# Append-only history of tasks for auditing, see activity.py. The table is
+# partitioned by month on created_at (migration 0011), so its primary key is
+# (id, created_at) and it has no foreign keys: the history outlives purged
+# tasks and users. user_id is who did it, null for background jobs
+class TaskActivity(models.Model):
+	task_id = models.BigIntegerField()
+	user_id = models.BigIntegerField(null=True)
+	action = models.CharField(max_length=20, choices=ACTIVITY_ACTIONS)
+	changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+	created_at = models.DateTimeField()
+
+	class Meta:
+		managed = False
+		db_table = 'tasks_task_activity'
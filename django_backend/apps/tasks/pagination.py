@@ -0,0 +1,222 @@
+import json
+import base64
+import binascii
+from typing import (
+	Any,
+	Dict,
+	List,
+	Optional,
+	Tuple,
+)
+from django.core.paginator import InvalidPage
+from django.db.models import (
+	Q,
+	QuerySet,
+)
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+	BasePagination,
+	PageNumberPagination,
+)
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import (
+	remove_query_param,
+	replace_query_param,
+)
+
+class TaskListPagination(PageNumberPagination):
+	page_size = 10
+	page_size_query_param = 'page_size'
+	max_page_size = 30 # To protect max page size of API
+
+	# paginate_queryset for async views, with the COUNT(*) and the page
+	# awaited. Paginator counts once, so the count is filled in first
+	async def apaginate_queryset(self, queryset: QuerySet, request: Request, view: Any = None) -> Optional[List[Any]]:
+		self.request = request
+		page_size = self.get_page_size(request)
+		if not page_size:
+			return None
+
+		paginator = self.django_paginator_class(queryset, page_size)
+		paginator.count = await queryset.acount()
+		page_number = self.get_page_number(request, paginator)
+		try:
+			self.page = paginator.page(page_number)
+		except InvalidPage as exc:
+			raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+		if paginator.num_pages > 1 and self.template is not None:
+			self.display_page_controls = True
+		self.page.object_list = [row async for row in self.page.object_list]
+		return self.page.object_list
+
+
+# Keyset pagination, opt-in with ?pagination=cursor
+# Every ordering is a (column, id) pair backed by a composite index, so a deep
+# page is the same index range scan as the first one: no OFFSET and no COUNT(*)
+class TaskKeysetPagination(BasePagination):
+	page_size = 10
+	page_size_query_param = 'page_size'
+	max_page_size = 30
+	mode_query_param = 'pagination'
+	cursor_query_param = 'cursor'
+	ordering_query_param = 'ordering'
+	count_query_param = 'count'
+	ordering_fields = ('due_date', 'created_at', 'updated_at')
+	default_ordering = 'due_date'
+	# Needed in dict rows to build cursors, whatever ?fields= shows
+	row_keys = ('id',) + ordering_fields
+	invalid_cursor_message = 'Invalid cursor'
+
+	@classmethod
+	def is_requested(cls, request: Request) -> bool:
+		params = request.query_params
+		return params.get(cls.mode_query_param) == 'cursor' or cls.cursor_query_param in params
+
+	def paginate_queryset(self, queryset: QuerySet, request: Request, view: Any = None) -> List[Any]:
+		page = self.get_page_queryset(queryset, request)
+		if self.is_count_requested(request):
+			self.approximate_count = self.get_approximate_count(queryset)
+		return self.set_page(list(page))
+
+	async def apaginate_queryset(self, queryset: QuerySet, request: Request, view: Any = None) -> List[Any]:
+		page = self.get_page_queryset(queryset, request)
+		if self.is_count_requested(request):
+			self.approximate_count = self.get_plan_rows(await queryset.order_by().aexplain(format='json'))
+		return self.set_page([row async for row in page])
+
+	def get_page_queryset(self, queryset: QuerySet, request: Request) -> QuerySet:
+		self.request = request
+		self.page_size = self.get_page_size(request)
+		self.field, self.descending = self.get_ordering(request)
+		self.approximate_count = None
+		self.cursor = self.decode_cursor(request)
+		self.reverse = bool(self.cursor and self.cursor[2])
+		if self.cursor:
+			queryset = queryset.filter(self.get_keyset_filter(self.cursor[0], self.cursor[1], self.reverse))
+		# Fetch one extra row to know if there is another page without counting
+		return queryset.order_by(*self.get_order_by(self.reverse))[:self.page_size + 1]
+
+	def set_page(self, rows: List[Any]) -> List[Any]:
+		has_more = len(rows) > self.page_size
+		rows = rows[:self.page_size]
+		if self.reverse:
+			rows.reverse()
+			self.has_previous, self.has_next = has_more, True
+		else:
+			self.has_previous, self.has_next = self.cursor is not None, has_more
+		self.page = rows
+		return rows
+
+	def is_count_requested(self, request: Request) -> bool:
+		return request.query_params.get(self.count_query_param) == 'approximate'
+
+	def get_paginated_response(self, data: List[Any]) -> Response:
+		payload = {
+			'next': self.get_next_link(),
+			'previous': self.get_previous_link(),
+		}
+		if self.approximate_count is not None:
+			payload['approximate_count'] = self.approximate_count
+		payload['results'] = data
+		return Response(payload)
+
+	def get_page_size(self, request: Request) -> int:
+		# Like PageNumberPagination: a positive int capped at max_page_size
+		try:
+			page_size = int(request.query_params[self.page_size_query_param])
+		except (KeyError, ValueError):
+			return self.page_size
+		if page_size <= 0:
+			return self.page_size
+		return min(page_size, self.max_page_size)
+
+	def get_ordering(self, request: Request) -> Tuple[str, bool]:
+		ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+		if ordering.lstrip('-') not in self.ordering_fields:
+			ordering = self.default_ordering
+		return ordering.lstrip('-'), ordering.startswith('-')
+
+	def get_order_by(self, reverse: bool) -> Tuple[str, str]:
+		if self.descending != reverse:
+			return f'-{self.field}', '-id'
+		return self.field, 'id'
+
+	def get_keyset_filter(self, value: Any, pk: int, reverse: bool) -> Q:
+		# (field, id) > (value, pk) written so Postgres can range scan the index:
+		# field >= value AND (field > value OR id > pk)
+		op = 'lt' if self.descending != reverse else 'gt'
+		return Q(**{f'{self.field}__{op}e': value}) & (
+			Q(**{f'{self.field}__{op}': value}) | Q(**{f'id__{op}': pk})
+		)
+
+	def get_approximate_count(self, queryset: QuerySet) -> int:
+		# Planner estimate, free compared to COUNT(*) on big tables
+		return self.get_plan_rows(queryset.order_by().explain(format='json'))
+
+	@staticmethod
+	def get_plan_rows(plan: str) -> int:
+		return int(json.loads(plan)[0]['Plan']['Plan Rows'])
+
+	def get_next_link(self) -> Optional[str]:
+		if not self.has_next or not self.page:
+			return None
+		return self.build_link(self.page[-1], reverse=False)
+
+	def get_previous_link(self) -> Optional[str]:
+		if not self.has_previous:
+			return None
+		if not self.page:
+			url = self.request.build_absolute_uri()
+			return remove_query_param(url, self.cursor_query_param)
+		return self.build_link(self.page[0], reverse=True)
+
+	def build_link(self, row: Any, reverse: bool) -> str:
+		url = self.request.build_absolute_uri()
+		url = replace_query_param(url, self.mode_query_param, 'cursor')
+		cursor = self.encode_cursor(self.get_row_value(row, self.field), self.get_row_value(row, 'id'), reverse)
+		return replace_query_param(url, self.cursor_query_param, cursor)
+
+	@staticmethod
+	def get_row_value(row: Any, field: str) -> Any:
+		if isinstance(row, dict):
+			return row[field]
+		return getattr(row, field)
+
+	# Cursors are opaque for the client: urlsafe base64 of a small JSON. They
+	# carry the ordering they were made for, a value of another column would
+	# give wrong pages
+	def encode_cursor(self, value: Any, pk: int, reverse: bool = False) -> str:
+		payload: Dict[str, Any] = {'f': self.field, 'd': int(self.descending), 'v': value.isoformat(), 'id': pk}
+		if reverse:
+			payload['r'] = 1
+		raw = json.dumps(payload, separators=(',', ':')).encode('ascii')
+		return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+	def decode_cursor(self, request: Request) -> Optional[Tuple[Any, int, bool]]:
+		encoded = request.query_params.get(self.cursor_query_param)
+		if not encoded:
+			return None
+		try:
+			raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+			payload = json.loads(raw)
+			field, descending = payload['f'], bool(payload['d'])
+			value = parse_datetime(payload['v'])
+			pk = int(payload['id'])
+			reverse = bool(payload.get('r'))
+		except (binascii.Error, ValueError, TypeError, KeyError):
+			raise NotFound(self.invalid_cursor_message)
+		if value is None or (field, descending) != (self.field, self.descending):
+			raise NotFound(self.invalid_cursor_message)
+		return value, pk, reverse
+
+# GET /api/tasks/<pk>/activity/, newest first by default. A range scan of the
+# task's (task_id, created_at, id) index in each monthly partition, which
+# Postgres reads in order and stops once the page is full
+class TaskActivityPagination(TaskKeysetPagination):
+	page_size = 50
+	max_page_size = 200
+	ordering_fields = ('created_at',)
+	default_ordering = '-created_at'
@@ -1,9 +1,136 @@
+from typing import (
+	Any,
+	Callable,
+	Dict,
+	Iterable,
+	List,
+	Optional,
+	Tuple,
+)
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from .models import Task
+from .models import (
+	Task,
+	TaskActivity,
+)
 
 class TaskSerializer(serializers.ModelSerializer):
 	created_by = serializers.StringRelatedField(read_only=True)
 
 	class Meta:
 		model = Task
-		fields = '__all__'
\ No newline at end of file
+		# search_vector is maintained by database triggers, see filters.TaskSearchFilter
+		exclude = ['search_vector']
+		# Only DELETE sets it, see services.soft_delete_tasks
+		read_only_fields = ['is_deleted']
+
+	# 'overdue' is set by the overdue job (jobs.mark_overdue_tasks), a client
+	# can only send it back unchanged
+	def validate_status(self, value: str) -> str:
+		if value == 'overdue' and getattr(self.instance, 'status', None) != 'overdue':
+			raise serializers.ValidationError('Tasks are only marked overdue by the system.')
+		return value
+
+
+# Resolves ids against objects loaded once for a whole batch (context['preloaded'],
+# {model: {pk: obj}}) instead of one query per item and relation
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+	def to_internal_value(self, data: Any) -> Any:
+		preloaded = self.context.get('preloaded', {}).get(self.get_queryset().model)
+		if preloaded is None:
+			return super().to_internal_value(data)
+		if isinstance(data, bool):
+			self.fail('incorrect_type', data_type=type(data).__name__)
+		try:
+			pk = self.get_queryset().model._meta.pk.to_python(data)
+		except (TypeError, ValueError, DjangoValidationError):
+			self.fail('incorrect_type', data_type=type(data).__name__)
+		if pk not in preloaded:
+			self.fail('does_not_exist', pk_value=data)
+		return preloaded[pk]
+
+# TaskSerializer validation for the bulk endpoints
+class TaskBulkSerializer(TaskSerializer):
+	serializer_related_field = PreloadedPrimaryKeyRelatedField
+
+	class Meta(TaskSerializer.Meta):
+		pass
+
+
+# Read-only twin of TaskSerializer for the dict rows of services.get_task_rows():
+# same fields in the same order and the same JSON, without building a model
+# instance, related objects and field bindings per row.
+# context['fields'] keeps only those fields (?fields=), context['expand'] swaps
+# relation ids for the nested objects (?expand=)
+class TaskRowSerializer(serializers.BaseSerializer):
+	# Output field: row key, when it isn't the same
+	row_keys = {
+		'created_by': 'created_by__username',
+		'parent_task': 'parent_task_id',
+		'assigned_to': 'assigned_to_ids',
+		'tags': 'tag_ids',
+	}
+	expanded_keys = {
+		'created_by': 'created_by_expanded',
+		'parent_task': 'parent_task_expanded',
+		'assigned_to': 'assigned_to_expanded',
+		'tags': 'tags_expanded',
+	}
+	# Fields whose TaskSerializer representation differs from the database value
+	converted_fields = ('due_date', 'estimated_hours', 'actual_hours', 'created_at', 'updated_at')
+	_converters = None
+
+	@classmethod
+	def get_converters(cls) -> Dict[str, Optional[Callable[[Any], Any]]]:
+		# Built once: TaskSerializer's own field objects do the conversions
+		if cls._converters is None:
+			fields = TaskSerializer().fields
+			cls._converters = {
+				name: fields[name].to_representation if name in cls.converted_fields else None
+				for name in fields
+			}
+		return cls._converters
+
+	@classmethod
+	def get_field_names(cls) -> List[str]:
+		return list(cls.get_converters())
+
+	@classmethod
+	def get_columns(
+		cls,
+		fields: Optional[Iterable[str]] = None,
+		expand: Iterable[str] = (),
+	) -> List[Tuple[str, str, Optional[Callable[[Any], Any]]]]:
+		# ?expand= only changes how selected fields look, it doesn't add any
+		columns = []
+		for name, to_representation in cls.get_converters().items():
+			if fields is not None and name not in fields:
+				continue
+			if name in expand:
+				columns.append((name, cls.expanded_keys[name], None))
+			else:
+				columns.append((name, cls.row_keys.get(name, name), to_representation))
+		return columns
+
+	@classmethod
+	def get_row_keys(cls, fields: Optional[Iterable[str]] = None, expand: Iterable[str] = ()) -> List[str]:
+		return [key for _, key, _ in cls.get_columns(fields, expand)]
+
+	def to_representation(self, row: Dict[str, Any]) -> Dict[str, Any]:
+		if not hasattr(self, '_columns'):
+			self._columns = self.get_columns(self.context.get('fields'), self.context.get('expand', ()))
+		data = {}
+		for name, key, to_representation in self._columns:
+			value = row[key]
+			if to_representation is not None and value is not None:
+				value = to_representation(value)
+			data[name] = value
+		return data
+
+# Entries of GET /api/tasks/<pk>/activity/, from .values() rows
+class TaskActivitySerializer(serializers.ModelSerializer):
+	user = serializers.IntegerField(source='user_id', read_only=True)
+
+	class Meta:
+		model = TaskActivity
+		fields = ['id', 'action', 'user', 'changes', 'created_at']
@@ -0,0 +1,273 @@
+import logging
+from datetime import datetime
+from typing import (
+	Any,
+	Dict,
+	Iterable,
+	List,
+	Optional,
+	Tuple,
+	Type,
+	Union,
+)
+from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import (
+	Case,
+	JSONField,
+	Model,
+	OuterRef,
+	Prefetch,
+	QuerySet,
+	Value,
+	When,
+)
+from django.db.models.functions import JSONObject
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import (
+	NotFound,
+	ValidationError,
+)
+from rest_framework.request import Request
+from apps.users.models import User
+from apps.common.metrics import timed
+from apps.common.utils import make_etag
+from .models import (
+	JobCheckpoint,
+	Tag,
+	Task,
+	TaskActivity,
+	TaskStats,
+	TaskWithArchive,
+)
+from .filters import (
+	TaskFilter,
+	TaskSearchFilter,
+)
+from .pagination import (
+	TaskListPagination,
+	TaskKeysetPagination,
+)
+from .cache import get_generation
+from .events import queue_task_events
+from .activity import record_activity
+from .jobs import STATS_JOB
+from .serializer import (
+	TaskSerializer,
+	TaskRowSerializer,
+)
+from .tree import format_hours
+
+logger = logging.getLogger(__name__)
+
+
+# Task queries shared by the API views and the HTML views, so a page render runs
+# the same filters, pagination and serialization in-process instead of calling
+# the API over HTTP
+
+def get_task_model(request: Optional[Request] = None) -> Type[Model]:
+	# The hot tier only, both tiers with ?include_archived=true (see
+	# models.TaskWithArchive). Reads only, writes always go to Task
+	if request is not None and request.query_params.get('include_archived') in ('true', '1'):
+		return TaskWithArchive
+	return Task
+
+def get_task_queryset(request: Optional[Request] = None) -> QuerySet:
+	# Related ids by id, the same order get_task_rows() aggregates them in
+	return get_task_model(request).objects.select_related('created_by', 'parent_task').prefetch_related(
+		Prefetch('assigned_to', queryset=User.objects.order_by('id')),
+		Prefetch('tags', queryset=Tag.objects.order_by('id')),
+	)
+
+# ?expand= nested objects, built by the same query as JSON
+EXPANDABLE_FIELDS = ('created_by', 'parent_task', 'assigned_to', 'tags')
+
+def get_field_selection(request: Request) -> Dict[str, Any]:
+	# TaskRowSerializer context for ?fields=id,title and ?expand=tags
+	params = request.query_params
+	selection: Dict[str, Any] = {'fields': None, 'expand': ()}
+	errors = {}
+	if params.get('fields'):
+		fields = [field.strip() for field in params['fields'].split(',') if field.strip()]
+		unknown = [field for field in fields if field not in TaskRowSerializer.get_field_names()]
+		if unknown:
+			errors['fields'] = [f'Unknown field: {field}' for field in unknown]
+		selection['fields'] = fields
+	if params.get('expand'):
+		expand = [field.strip() for field in params['expand'].split(',') if field.strip()]
+		unknown = [field for field in expand if field not in EXPANDABLE_FIELDS]
+		if unknown:
+			errors['expand'] = [f'Can not expand: {field}' for field in unknown]
+		# Left out by ?fields=, nothing to expand (keeps ETags and cache keys the same)
+		selection['expand'] = tuple(
+			field for field in expand if selection['fields'] is None or field in selection['fields']
+		)
+	if errors:
+		raise ValidationError(errors)
+	return selection
+
+def get_related_expressions(keys: List[str], model: Type[Model] = Task) -> Dict[str, Any]:
+	# Only the relations the rows will show. Both M2Ms are correlated
+	# ARRAY(SELECT ...) subqueries instead of ARRAY_AGG over joins, which
+	# would multiply rows between them and need a GROUP BY. Through the
+	# model's own M2M tables, for Task or TaskWithArchive. Deleted users are
+	# left out, like the User.objects prefetch of TaskSerializer
+	assignments = model.assigned_to.through.objects.filter(task=OuterRef('pk'), user__is_deleted=False)
+	tags = model.tags.through.objects.filter(task=OuterRef('pk'))
+	expressions = {
+		'assigned_to_ids': lambda: ArraySubquery(assignments.order_by('user_id').values('user_id')),
+		'tag_ids': lambda: ArraySubquery(tags.order_by('tag_id').values('tag_id')),
+		'created_by_expanded': lambda: JSONObject(
+			id='created_by_id', username='created_by__username', nickname='created_by__nickname',
+		),
+		'parent_task_expanded': lambda: Case(
+			When(parent_task__isnull=True, then=Value(None)),
+			default=JSONObject(id='parent_task_id', title='parent_task__title', status='parent_task__status'),
+			output_field=JSONField(),
+		),
+		'assigned_to_expanded': lambda: ArraySubquery(
+			assignments.order_by('user_id').values(
+				json=JSONObject(id='user_id', username='user__username', nickname='user__nickname'),
+			)
+		),
+		'tags_expanded': lambda: ArraySubquery(
+			tags.order_by('tag_id').values(json=JSONObject(id='tag_id', name='tag__name'))
+		),
+	}
+	return {key: expressions[key]() for key in keys if key in expressions}
+
+def get_task_rows(
+	queryset: QuerySet,
+	fields: Optional[List[str]] = None,
+	expand: Tuple[str, ...] = (),
+	extra_keys: Tuple[str, ...] = (),
+) -> QuerySet:
+	# Plain dicts for TaskRowSerializer in one query, with only the columns
+	# and subqueries the selected fields need. extra_keys are fetched but not
+	# shown (e.g. the keyset pagination columns)
+	keys = TaskRowSerializer.get_row_keys(fields, expand)
+	keys += [key for key in extra_keys if key not in keys]
+	queryset = queryset.select_related(None).prefetch_related(None)
+	return queryset.annotate(**get_related_expressions(keys, queryset.model)).values(*keys)
+
+def filter_tasks(request: Request, queryset: QuerySet) -> QuerySet:
+	filterset = TaskFilter(request.query_params, queryset=queryset, request=request)
+	if not filterset.is_valid():
+		raise ValidationError(filterset.errors)
+	return TaskSearchFilter().filter_queryset(request, filterset.qs, None)
+
+def get_task_paginator(request: Request) -> Union[TaskListPagination, TaskKeysetPagination]:
+	# Page numbers by default, keyset pages with ?pagination=cursor
+	if TaskKeysetPagination.is_requested(request):
+		return TaskKeysetPagination()
+	return TaskListPagination()
+
+# CONDITIONAL REQUESTS
+# ETags from one cheap lookup, before anything is serialized
+
+def touch_tasks(task_ids: Iterable[int]) -> None:
+	# Assignments and tags are part of the task payload, changing them moves
+	# updated_at too so the task's ETag changes
+	Task.objects.filter(pk__in=task_ids).update(updated_at=timezone.now())
+
+def get_task_validators(request: Request, pk: int, lock: bool = False) -> Tuple[str, datetime]:
+	# ETag and Last-Modified of GET /api/tasks/<pk>/: the row's updated_at and
+	# the creator's username, by primary key. Expanded objects come from other
+	# tables, so with ?expand= the cache generation is added (any task, tag or
+	# assignment write)
+	selection = get_field_selection(request)
+	queryset = (Task if lock else get_task_model(request)).objects.filter(pk=pk)
+	if lock:
+		queryset = queryset.select_for_update(of=('self',))
+	row = queryset.values_list('updated_at', 'created_by__username').first()
+	if row is None:
+		raise NotFound()
+	updated_at, username = row
+	parts = [pk, updated_at.isoformat(), username, selection['fields'], selection['expand']]
+	if selection['expand']:
+		parts.append(get_generation())
+	return make_etag(*parts), updated_at
+
+def get_task_list_etag(request: Request) -> Optional[str]:
+	# max(updated_at) and count() over the filtered set would cost a scan of
+	# it, more than the page itself. The cache generation already changes on
+	# every write to tasks, tags or assignments, so it's the list's version
+	try:
+		generation = get_generation()
+	except Exception:
+		logger.exception('Task cache generation unavailable, no ETag')
+		return None
+	params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+	return make_etag(generation, params, weak=True)
+
+# Same payload as GET /api/tasks/
+def list_tasks(request: Request) -> Dict[str, Any]:
+	queryset = get_task_rows(filter_tasks(request, get_task_queryset(request)))
+	paginator = get_task_paginator(request)
+	page = paginator.paginate_queryset(queryset, request)
+	with timed('serialize'):
+		data = TaskRowSerializer(page, many=True).data
+	return paginator.get_paginated_response(data).data
+
+# Same validation as POST /api/tasks/, raises ValidationError
+def create_task(request: Request, data: Dict[str, Any]) -> Task:
+	serializer = TaskSerializer(data=data, context={'request': request})
+	serializer.is_valid(raise_exception=True)
+	return serializer.save(created_by=request.user)
+
+
+def soft_delete_tasks(queryset: QuerySet) -> List[int]:
+	# DELETE of one task or a batch: one UPDATE for the tasks and their
+	# subtasks. Only soft_deleted is sent (it moves the cache generation), so
+	# the streams and activity are told here
+	deleted = queryset.soft_delete()
+	if deleted:
+		queue_task_events('deleted', deleted)
+		record_activity('deleted', deleted)
+	return deleted
+
+
+# STATS
+# Read from the tasks_task_stats materialized view, a few hundred rows at
+# most whatever the table size. as_of says how fresh they are
+
+STATS_DIMENSIONS = ['status', 'priority', 'assignee', 'tag', 'due_date']
+
+def format_stats_row(row: TaskStats) -> Dict[str, Any]:
+	return {
+		'tasks': row.tasks,
+		'estimated_hours': format_hours(row.estimated_hours),
+		'actual_hours': format_hours(row.actual_hours),
+	}
+
+def get_task_stats() -> Dict[str, Any]:
+	checkpoint = JobCheckpoint.objects.filter(name=STATS_JOB).first()
+	as_of = checkpoint.position_at if checkpoint else None
+	stats = {
+		'as_of': serializers.DateTimeField().to_representation(as_of) if as_of else None,
+		'age_seconds': round((timezone.now() - as_of).total_seconds(), 3) if as_of else None,
+		'refresh_interval': settings.TASK_STATS_REFRESH_SECONDS,
+		'total': {'tasks': 0, 'estimated_hours': '0.00', 'actual_hours': '0.00'},
+	}
+	stats.update({f'by_{dimension}': [] for dimension in STATS_DIMENSIONS})
+	for row in TaskStats.objects.order_by('dimension', '-tasks', 'key'):
+		if row.dimension == 'total':
+			stats['total'] = format_stats_row(row)
+			continue
+		item = {'key': int(row.key) if row.dimension in ('assignee', 'tag') else row.key}
+		if row.label is not None:
+			item['label'] = row.label
+		item.update(format_stats_row(row))
+		stats[f'by_{row.dimension}'].append(item)
+	return stats
+
+
+# ACTIVITY
+# What was flushed from the activity buffer so far, see activity.py
+
+def get_task_activity(pk: int) -> QuerySet:
+	# Archived tasks keep their history
+	if not TaskWithArchive.objects.filter(pk=pk).exists():
+		raise NotFound()
+	return TaskActivity.objects.filter(task_id=pk).values('id', 'action', 'user_id', 'changes', 'created_at')
@@ -0,0 +1,120 @@
+from django.db.models.signals import (
+	post_save,
+	post_delete,
+	pre_delete,
+	m2m_changed,
+)
+from django.dispatch import receiver
+from apps.users.models import User
+from apps.common.signals import soft_deleted
+from .cache import invalidate_task_cache
+from .models import (
+	Tag,
+	Task,
+	TaskAssignment,
+)
+from .services import touch_tasks
+from .events import queue_task_events
+from .activity import (
+	pop_task_changes,
+	record_activity,
+)
+
+# Bulk writes don't send signals, services and jobs call invalidate_task_cache(),
+# touch_tasks(), queue_task_events() and record_activity() themselves. Soft
+# deletes only send soft_deleted
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=TaskAssignment)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=TaskAssignment)
+@receiver(post_delete, sender=Tag)
+def task_changed(sender, **kwargs) -> None:
+	invalidate_task_cache()
+
+@receiver(post_save, sender=Task)
+def task_saved(sender, instance: Task, created: bool, **kwargs) -> None:
+	queue_task_events('created' if created else 'updated', [instance.pk])
+	changes = pop_task_changes(instance)
+	if created:
+		record_activity('created', [instance.pk])
+	# None: not read from the database, what changed isn't known
+	elif changes is None or changes:
+		record_activity('updated', [instance.pk], changes)
+
+@receiver(post_delete, sender=Task)
+def task_deleted(sender, instance: Task, **kwargs) -> None:
+	# The row is gone by the time the event is published
+	queue_task_events(
+		'deleted', [instance.pk],
+		status=instance.status, priority=instance.priority, created_by=instance.created_by_id,
+		assigned_to=[], tags=[],
+	)
+	record_activity('deleted', [instance.pk])
+
+@receiver(post_save, sender=TaskAssignment)
+def assignment_saved(sender, instance: TaskAssignment, created: bool, **kwargs) -> None:
+	touch_tasks([instance.task_id])
+	if created:
+		queue_task_events('assigned', [instance.task_id], user=instance.user_id)
+		record_activity('assigned', [instance.task_id], {'user': instance.user_id}, user_id=instance.assigned_by_id)
+
+@receiver(post_delete, sender=TaskAssignment)
+def assignment_deleted(sender, instance: TaskAssignment, origin=None, **kwargs) -> None:
+	# Only a single assignment.delete(). Queryset deletes touch their tasks
+	# in one query and cascades from a deleted task have nothing to touch
+	if isinstance(origin, TaskAssignment):
+		touch_tasks([instance.task_id])
+	if getattr(origin, 'model', type(origin)) is not Task:
+		queue_task_events('unassigned', [instance.task_id], user=instance.user_id)
+		record_activity('unassigned', [instance.task_id], {'user': instance.user_id})
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(sender, instance: Tag, **kwargs) -> None:
+	task_ids = list(Task.objects.filter(tags=instance).values_list('pk', flat=True))
+	touch_tasks(task_ids)
+	record_activity('tags', task_ids, {'removed': [instance.pk]})
+
+@receiver(m2m_changed, sender=Task.tags.through)
+def task_tags_changed(sender, instance, action: str, reverse: bool, pk_set, **kwargs) -> None:
+	if action.startswith('post_'):
+		invalidate_task_cache()
+		queue_task_events('updated', (pk_set or []) if reverse else [instance.pk])
+	record_tag_activity(instance, action, reverse, pk_set)
+	# instance is the task, or the tag when changed from tag.tasks
+	if not reverse and (pk_set or action == 'post_clear') and action.startswith('post_'):
+		touch_tasks([instance.pk])
+	elif reverse and pk_set and action in ('post_add', 'post_remove'):
+		touch_tasks(pk_set)
+	elif reverse and action == 'pre_clear':
+		touch_tasks(instance.tasks.values('pk'))
+
+def record_tag_activity(instance, action: str, reverse: bool, pk_set) -> None:
+	# {"added": [tag ids]} or {"removed": [tag ids]}. A clear has no pk_set,
+	# the rows are read before they go
+	change = {'post_add': 'added', 'post_remove': 'removed', 'pre_clear': 'removed'}.get(action)
+	if change is None:
+		return
+	if action == 'pre_clear':
+		related = instance.tasks if reverse else instance.tags
+		pk_set = set(related.values_list('pk', flat=True))
+	if not pk_set:
+		return
+	if reverse:
+		record_activity('tags', sorted(pk_set), {change: [instance.pk]})
+	else:
+		record_activity('tags', [instance.pk], {change: sorted(pk_set)})
+
+# Task payloads show the creator's username (and more with ?expand=), but
+# not for a new user or a login
+@receiver(post_save, sender=User)
+def user_changed(sender, created: bool, update_fields=None, **kwargs) -> None:
+	if not created and set(update_fields or ['username']) != {'last_login'}:
+		invalidate_task_cache()
+
+# Soft deletes of tasks (subtasks included) and users change the payloads too
+@receiver(soft_deleted, sender=Task)
+@receiver(soft_deleted, sender=User)
+def soft_deleted_changed(sender, **kwargs) -> None:
+	invalidate_task_cache()
@@ -0,0 +1,153 @@
+import json
+import base64
+import binascii
+from datetime import (
+	datetime,
+	timedelta,
+)
+from typing import (
+	Any,
+	Dict,
+	Optional,
+	Tuple,
+)
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import (
+	APIException,
+	ValidationError,
+)
+from rest_framework.request import Request
+from .models import (
+	JobCheckpoint,
+	Task,
+	TaskTombstone,
+)
+from .jobs import TOMBSTONE_JOB
+from .serializer import TaskRowSerializer
+from .services import (
+	get_field_selection,
+	get_task_rows,
+)
+
+# DELTA SYNC
+# GET /api/tasks/changes?since=<token>: tasks created or updated after the
+# token, walked by the (updated_at, id) index, and deleted tasks/assignments,
+# walked by the tombstones' (deleted_at, id) index. Each poll reads only
+# the rows changed since the previous one
+
+SYNC_PAGE_SIZE = 500
+SYNC_MAX_PAGE_SIZE = 2000
+# Python's clock against the database's, and auto_now taken a moment before
+# the UPDATE runs
+SYNC_CLOCK_MARGIN = timedelta(seconds=1)
+
+# Start of the oldest transaction that has written something and is still
+# open. Its rows are stamped after that, so everything older is committed.
+# Only sessions of the same role (or with pg_read_all_stats) are visible
+SYNC_HORIZON_SQL = """
+	SELECT least(now(), min(xact_start)) FROM pg_stat_activity
+	WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()
+"""
+
+class SyncTokenExpired(APIException):
+	status_code = status.HTTP_410_GONE
+	default_detail = 'Sync token too old, sync again without ?since=.'
+	default_code = 'sync_token_expired'
+
+def get_sync_horizon() -> datetime:
+	# Rows are only handed out up to here, so a transaction that commits late
+	# can't leave a row with an earlier updated_at behind a token already sent
+	with connection.cursor() as cursor:
+		cursor.execute(SYNC_HORIZON_SQL)
+		return cursor.fetchone()[0] - SYNC_CLOCK_MARGIN
+
+# Tokens are opaque for the client: urlsafe base64 of the last (time, id)
+# read from each stream, like pagination cursors
+def encode_sync_token(tasks_after: Optional[Tuple[datetime, int]], tombstones_after: Tuple[datetime, int]) -> str:
+	payload = {
+		't': [tasks_after[0].isoformat(), tasks_after[1]] if tasks_after else None,
+		'd': [tombstones_after[0].isoformat(), tombstones_after[1]],
+	}
+	raw = json.dumps(payload, separators=(',', ':')).encode('ascii')
+	return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_sync_token(encoded: str) -> Tuple[Optional[Tuple[datetime, int]], Tuple[datetime, int]]:
+	try:
+		payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+		cursors = [
+			(parse_datetime(payload[key][0]), int(payload[key][1])) if payload[key] else None
+			for key in ('t', 'd')
+		]
+	except (binascii.Error, ValueError, TypeError, KeyError, IndexError):
+		cursors = [None, None]
+	if cursors[1] is None or any(cursor and cursor[0] is None for cursor in cursors):
+		raise ValidationError({'since': ['Invalid sync token.']})
+	return cursors[0], cursors[1]
+
+def after_cursor(field: str, cursor: Optional[Tuple[datetime, int]]) -> Q:
+	# (field, id) > cursor, written so Postgres can range scan the index
+	if cursor is None:
+		return Q()
+	value, pk = cursor
+	return Q(**{f'{field}__gte': value}) & (Q(**{f'{field}__gt': value}) | Q(id__gt=pk))
+
+def get_task_changes(request: Request) -> Dict[str, Any]:
+	selection = get_field_selection(request)
+	# A positive int capped at SYNC_MAX_PAGE_SIZE, like the pagination classes
+	try:
+		page_size = int(request.query_params['page_size'])
+	except (KeyError, ValueError):
+		page_size = SYNC_PAGE_SIZE
+	if page_size <= 0:
+		page_size = SYNC_PAGE_SIZE
+	page_size = min(page_size, SYNC_MAX_PAGE_SIZE)
+	horizon = get_sync_horizon()
+
+	since = request.query_params.get('since')
+	if since:
+		tasks_after, tombstones_after = decode_sync_token(since)
+		expired_before = JobCheckpoint.objects.filter(name=TOMBSTONE_JOB).values_list('position_at', flat=True).first()
+		if expired_before and tombstones_after[0] < expired_before:
+			raise SyncTokenExpired()
+	else:
+		# Full sync: every task, and the deletions from now on
+		tasks_after, tombstones_after = None, (horizon, 0)
+
+	tasks = list(get_task_rows(
+		Task.all_objects.filter(after_cursor('updated_at', tasks_after), updated_at__lt=horizon).order_by('updated_at', 'id'),
+		extra_keys=('id', 'updated_at', 'is_deleted'),
+		**selection,
+	)[:page_size + 1])
+	tombstones = list(
+		TaskTombstone.objects.filter(after_cursor('deleted_at', tombstones_after), deleted_at__lt=horizon)
+		.order_by('deleted_at', 'id').values('id', 'task_id', 'user_id', 'deleted_at')[:page_size + 1]
+	)
+	has_more = len(tasks) > page_size or len(tombstones) > page_size
+	tasks, tombstones = tasks[:page_size], tombstones[:page_size]
+
+	# A stream read to its end continues from the horizon, so quiet streams
+	# don't keep an old token around
+	if len(tasks) < page_size:
+		tasks_after = (horizon, 0)
+	elif tasks:
+		tasks_after = (tasks[-1]['updated_at'], tasks[-1]['id'])
+	if len(tombstones) < page_size:
+		tombstones_after = (horizon, 0)
+	elif tombstones:
+		tombstones_after = (tombstones[-1]['deleted_at'], tombstones[-1]['id'])
+
+	live = [row for row in tasks if not row['is_deleted']]
+	return {
+		'tasks': TaskRowSerializer(live, many=True, context=selection).data,
+		'deleted': [row['id'] for row in tasks if row['is_deleted']]
+			+ [tombstone['task_id'] for tombstone in tombstones if tombstone['user_id'] is None],
+		'unassigned': [
+			{'task_id': tombstone['task_id'], 'user_id': tombstone['user_id']}
+			for tombstone in tombstones if tombstone['user_id'] is not None
+		],
+		'next': encode_sync_token(tasks_after, tombstones_after),
+		'has_more': has_more,
+	}
@@ -1,17 +1,57 @@
 from celery import shared_task
-from django.utils import timezone
-from datetime import timedelta
 
 @shared_task
-def check_overdue_tasks():
-	from apps.tasks.models import Task
-	now = timezone.now()
-	updated = Task.objects.filter(due_date__lt=now).exclude(status='completed').update(status='overdue')
-	return {"updated": updated}
+def check_overdue_tasks(full=False):
+	from apps.tasks.jobs import mark_overdue_tasks
+	return mark_overdue_tasks(full=full)
 
 @shared_task
-def cleanup_archived_tasks(days=30):
-	from apps.tasks.models import Task
-	cutoff = timezone.now() - timedelta(days=days)
-	deleted, _ = Task.objects.filter(is_archived=True, updated_at__lt=cutoff).delete()
-	return {"deleted": deleted}
\ No newline at end of file
+def refresh_task_stats():
+	from apps.tasks.jobs import refresh_task_stats
+	return refresh_task_stats()
+
+# Moves old completed and archived tasks to the archive tables, see jobs.archive_tasks
+@shared_task(bind=True)
+def archive_tasks(self, days=None, max_seconds=300):
+	from django.conf import settings
+	from apps.tasks.jobs import archive_tasks
+
+	def progress(report):
+		if self.request.id:
+			self.update_state(state='PROGRESS', meta=report)
+
+	return archive_tasks(days=days or settings.TASK_ARCHIVE_AFTER_DAYS, max_seconds=max_seconds, progress=progress)
+
+# Time and row budgets keep one run from holding the worker, the next run
+# resumes where this one stopped
+@shared_task(bind=True)
+def cleanup_archived_tasks(self, days=30, max_seconds=300, max_rows=None):
+	from apps.tasks.jobs import purge_archived_tasks
+
+	def progress(report):
+		if self.request.id:
+			self.update_state(state='PROGRESS', meta=report)
+
+	return purge_archived_tasks(days=days, max_seconds=max_seconds, max_rows=max_rows, progress=progress)
+
+@shared_task
+def cleanup_sync_tombstones(days=None):
+	from django.conf import settings
+	from apps.tasks.jobs import purge_sync_tombstones
+	return purge_sync_tombstones(days=days or settings.TASK_SYNC_TOMBSTONE_DAYS)
+
+# Every few seconds, a run still busy makes the next one skip. Always
+# bounded, the lock is sized from max_seconds
+@shared_task
+def flush_task_activity(max_seconds=None):
+	from apps.tasks.jobs import (
+		ACTIVITY_FLUSH_SECONDS,
+		flush_task_activity,
+	)
+	return flush_task_activity(max_seconds=max_seconds or ACTIVITY_FLUSH_SECONDS)
+
+@shared_task
+def cleanup_task_activity(months=None):
+	from django.conf import settings
+	from apps.tasks.jobs import purge_task_activity
+	return purge_task_activity(months=settings.TASK_ACTIVITY_RETENTION_MONTHS if months is None else months)
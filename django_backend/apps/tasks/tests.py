@@ -1,3 +1,1079 @@
-from django.test import TestCase
+import os
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from urllib.parse import (
+	parse_qs,
+	urlparse,
+)
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.management import (
+	CommandError,
+	call_command,
+)
+from django.db import connection
+from django.test import (
+	AsyncClient,
+	Client,
+	TestCase,
+	override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import (
+	APIClient,
+	APIRequestFactory,
+	force_authenticate,
+)
+from rest_framework_simplejwt.tokens import (
+	AccessToken,
+	RefreshToken,
+)
+from apps.users.models import User
+from apps.tasks import (
+	jobs,
+	tasks as celery_tasks,
+)
+from apps.tasks.activity import FLUSH_LOCK
+from apps.tasks.importer import import_files
+from apps.tasks.jobs import (
+	mark_overdue_tasks,
+	purge_sync_tombstones,
+)
+from apps.tasks.models import (
+	JobCheckpoint,
+	Tag,
+	Task,
+	TaskAssignment,
+	TaskWithArchive,
+)
+from apps.tasks.serializer import (
+	TaskRowSerializer,
+	TaskSerializer,
+)
+from apps.tasks.services import (
+	get_task_queryset,
+	get_task_rows,
+	list_tasks,
+)
+from apps.tasks.views import (
+	TaskAssignView,
+	TaskDetailView,
+	TaskListView,
+)
 
-# Create your tests here.
+def make_user(username: str, **kwargs) -> User:
+	return User.objects.create_user(username=username, password='password', nickname=username, **kwargs)
+
+def make_task(user: User, **kwargs) -> Task:
+	fields = {
+		'title': 'Task', 'description': '', 'status': 'pending', 'priority': 'medium',
+		'due_date': timezone.now() + timedelta(days=1), 'estimated_hours': 1, 'created_by': user,
+	}
+	fields.update(kwargs)
+	return Task.objects.create(**fields)
+
+def get_query_param(url: str, name: str) -> str:
+	return parse_qs(urlparse(url).query)[name][0]
+
+# The response cache generation only moves after commit, which never happens
+# inside a TestCase
+@override_settings(TASK_CACHE_TIMEOUT=0)
+class TaskAPITestCase(TestCase):
+	def setUp(self):
+		self.user = make_user('alice')
+		self.other = make_user('bob')
+		# Seeded by migration 0002_default_tags
+		self.tag = Tag.objects.get(name='bug')
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+
+
+class TaskKeysetPaginationTests(TaskAPITestCase):
+	def test_cursor_only_fits_its_ordering(self):
+		now = timezone.now()
+		for day in range(3):
+			make_task(self.user, due_date=now + timedelta(days=day))
+		first = self.client.get('/api/tasks/', {'pagination': 'cursor', 'page_size': 1})
+		cursor = get_query_param(first.data['next'], 'cursor')
+
+		second = self.client.get('/api/tasks/', {'pagination': 'cursor', 'page_size': 1, 'cursor': cursor})
+		self.assertEqual(second.status_code, 200)
+		self.assertNotEqual(second.data['results'][0]['id'], first.data['results'][0]['id'])
+		for ordering in ('-due_date', 'created_at'):
+			response = self.client.get('/api/tasks/', {'page_size': 1, 'cursor': cursor, 'ordering': ordering})
+			self.assertEqual(response.status_code, 404)
+
+	def test_search_keeps_keyset_order(self):
+		now = timezone.now()
+		for day, title in enumerate(['deploy failed', 'deploy', 'deploy failed again']):
+			make_task(self.user, title=title, due_date=now + timedelta(days=day))
+		response = self.client.get('/api/tasks/', {'pagination': 'cursor', 'search': 'deploy', 'fields': 'title'})
+		self.assertEqual(
+			[row['title'] for row in response.data['results']],
+			['deploy failed', 'deploy', 'deploy failed again'],
+		)
+
+
+class TaskBulkTests(TaskAPITestCase):
+	def test_mixed_batch_writes_nothing(self):
+		valid = {
+			'title': 'Imported', 'description': 'From the importer', 'status': 'pending', 'priority': 'low',
+			'due_date': (timezone.now() + timedelta(days=1)).isoformat(), 'estimated_hours': '2.00', 'tags': [self.tag.pk],
+		}
+		invalid = dict(valid, status='unknown', tags=[self.tag.pk + 1000])
+		response = self.client.post('/api/tasks/bulk/', [valid, invalid, valid], format='json')
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.data[0], {})
+		self.assertEqual(set(response.data[1]), {'status', 'tags'})
+		self.assertEqual(response.data[2], {})
+		self.assertFalse(Task.objects.exists())
+
+		response = self.client.post('/api/tasks/bulk/', [valid, valid], format='json')
+		self.assertEqual(response.status_code, 201)
+		self.assertEqual(response.data['created'], 2)
+		self.assertEqual(
+			list(Task.tags.through.objects.filter(task_id__in=response.data['ids']).values_list('tag_id', flat=True)),
+			[self.tag.pk, self.tag.pk],
+		)
+
+	def test_mixed_update_writes_nothing(self):
+		task = make_task(self.user)
+		response = self.client.patch('/api/tasks/bulk/', [
+			{'id': task.pk, 'title': 'Renamed'},
+			{'id': task.pk + 1000, 'title': 'Missing'},
+		], format='json')
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.data, [{}, {'id': ['Task not found.']}])
+		response = self.client.patch('/api/tasks/bulk/', [
+			{'id': task.pk, 'title': 'Renamed'},
+			{'id': task.pk, 'priority': 'urgent'},
+		], format='json')
+		self.assertEqual(response.status_code, 400)
+		task.refresh_from_db()
+		self.assertEqual(task.title, 'Task')
+
+	def test_only_creator_or_staff(self):
+		own = make_task(self.user, title='Mine')
+		foreign = make_task(self.other, title='Theirs')
+		for method, data in (
+			(self.client.patch, [{'id': own.pk, 'title': 'Changed'}, {'id': foreign.pk, 'title': 'Changed'}]),
+			(self.client.delete, [own.pk, foreign.pk]),
+		):
+			response = method('/api/tasks/bulk/', data, format='json')
+			self.assertEqual(response.status_code, 403)
+		self.assertEqual(
+			sorted(Task.objects.values_list('title', flat=True)),
+			['Mine', 'Theirs'],
+		)
+
+		self.user.is_staff = True
+		self.user.save()
+		response = self.client.patch('/api/tasks/bulk/', [{'id': foreign.pk, 'title': 'Changed'}], format='json')
+		self.assertEqual(response.status_code, 200)
+
+		self.client.force_authenticate(None)
+		response = self.client.post('/api/tasks/bulk/', [], format='json')
+		self.assertEqual(response.status_code, 401)
+
+	def test_delete_cascades_to_subtasks(self):
+		parent = make_task(self.user)
+		child = make_task(self.user, parent_task=parent)
+		grandchild = make_task(self.user, parent_task=child)
+		other = make_task(self.user)
+		response = self.client.delete('/api/tasks/bulk/', [parent.pk], format='json')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data, {'deleted': 1})
+		self.assertEqual(
+			set(Task.all_objects.filter(is_deleted=True).values_list('pk', flat=True)),
+			{parent.pk, child.pk, grandchild.pk},
+		)
+		self.assertTrue(Task.objects.filter(pk=other.pk).exists())
+		self.assertEqual(self.client.get(f'/api/tasks/{child.pk}/').status_code, 404)
+
+
+class TaskBulkAssignTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		self.task = make_task(self.user)
+		self.carol = make_user('carol')
+		TaskAssignment.objects.create(task=self.task, user=self.other, assigned_by=self.user)
+		# Only what the services send, the signals aren't involved
+		self.events = mock.patch('apps.tasks.bulk.queue_task_events').start()
+		self.activity = mock.patch('apps.tasks.bulk.record_activity').start()
+		self.addCleanup(mock.patch.stopall)
+
+	def test_assign_reports_and_sends_inserted_pairs_only(self):
+		response = self.client.post('/api/tasks/bulk/assign', {
+			'task_ids': [self.task.pk], 'user_ids': [self.other.pk, self.carol.pk],
+		}, format='json')
+		self.assertEqual(response.status_code, 201)
+		self.assertEqual(response.data, {
+			'created': [{'task_id': self.task.pk, 'user_id': self.carol.pk}],
+			'existing': [{'task_id': self.task.pk, 'user_id': self.other.pk}],
+		})
+		self.assertEqual(
+			set(TaskAssignment.objects.filter(task=self.task).values_list('user_id', flat=True)),
+			{self.other.pk, self.carol.pk},
+		)
+		self.events.assert_called_once_with('assigned', [self.task.pk], user=self.carol.pk)
+		self.activity.assert_called_once_with('assigned', [self.task.pk], {'user': self.carol.pk})
+
+		response = self.client.post('/api/tasks/bulk/assign', {
+			'assignments': [{'task_id': self.task.pk, 'user_ids': [self.carol.pk]}],
+		}, format='json')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['created'], [])
+		self.assertEqual(self.events.call_count, 1)
+
+	def test_unassign_sends_removed_pairs(self):
+		response = self.client.post('/api/tasks/bulk/unassign', {
+			'task_ids': [self.task.pk], 'user_ids': [self.other.pk, self.carol.pk],
+		}, format='json')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data, {
+			'removed': [{'task_id': self.task.pk, 'user_id': self.other.pk}],
+			'missing': [{'task_id': self.task.pk, 'user_id': self.carol.pk}],
+		})
+		self.assertFalse(TaskAssignment.objects.filter(task=self.task).exists())
+		self.events.assert_called_once_with('unassigned', [self.task.pk], user=self.other.pk)
+		self.activity.assert_called_once_with('unassigned', [self.task.pk], {'user': self.other.pk})
+
+	def test_only_creator_or_staff(self):
+		foreign = make_task(self.other)
+		for path in ('/api/tasks/bulk/assign', '/api/tasks/bulk/unassign'):
+			response = self.client.post(path, {
+				'task_ids': [self.task.pk, foreign.pk], 'user_ids': [self.carol.pk],
+			}, format='json')
+			self.assertEqual(response.status_code, 403)
+		self.assertFalse(TaskAssignment.objects.filter(user=self.carol).exists())
+		self.events.assert_not_called()
+
+
+# The URLconf views are built once, with the ASYNC_API_VIEWS of that moment,
+# so these build their own
+class TaskAsyncViewTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		self.factory = APIRequestFactory()
+		self.task = make_task(self.user, title='Async')
+
+	def make_view(self, view_class, async_views: bool = True):
+		with override_settings(ASYNC_API_VIEWS=async_views):
+			view = view_class.as_view()
+		self.assertEqual(iscoroutinefunction(view), async_views)
+		return view
+
+	def make_request(self, method: str, path: str, user=None, **kwargs):
+		request = getattr(self.factory, method)(path, **kwargs)
+		force_authenticate(request, user or self.user)
+		return request
+
+	async def test_list(self):
+		view = self.make_view(TaskListView)
+		response = await view(self.make_request('get', '/api/tasks/', data={'fields': 'id,title', 'ordering': 'id'}))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['results'], [{'id': self.task.pk, 'title': 'Async'}])
+
+		response = await view(self.make_request('get', '/api/tasks/', data={'pagination': 'cursor', 'fields': 'id'}))
+		self.assertEqual(response.data['results'], [{'id': self.task.pk}])
+
+	async def test_detail(self):
+		view = self.make_view(TaskDetailView)
+		response = await view(self.make_request('get', f'/api/tasks/{self.task.pk}/'), pk=self.task.pk)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['title'], 'Async')
+		self.assertEqual(response.data['created_by'], 'alice')
+		self.assertTrue(response['ETag'])
+
+		response = await view(self.make_request('get', f'/api/tasks/{self.task.pk}/'), pk=self.task.pk + 1000)
+		self.assertEqual(response.status_code, 404)
+
+	def post_assign(self, view, data, user=None, pk=None):
+		# A coroutine for the async view
+		pk = pk or self.task.pk
+		request = self.make_request('post', f'/api/tasks/{pk}/assign', user=user, data=data, format='json')
+		return view(request, pk=pk)
+
+	def get_assign_cases(self):
+		return [
+			({'data': {'assigned_user_id': self.other.pk}}, 201),
+			({'data': {'assigned_user_id': self.other.pk}}, 200),
+			({'data': {}}, 400),
+			({'data': {'assigned_user_id': self.other.pk + 1000}}, 404),
+			({'data': {'assigned_user_id': self.user.pk}, 'pk': self.task.pk + 1000}, 404),
+			# Only the creator or staff
+			({'data': {'assigned_user_id': self.user.pk}, 'user': self.other}, 403),
+		]
+
+	async def test_assign(self):
+		view = self.make_view(TaskAssignView)
+		for kwargs, status_code in self.get_assign_cases():
+			response = await self.post_assign(view, **kwargs)
+			self.assertEqual(response.status_code, status_code, kwargs)
+		assignments = TaskAssignment.objects.filter(task=self.task).values_list('user_id', 'assigned_by_id')
+		self.assertEqual([row async for row in assignments], [(self.other.pk, self.user.pk)])
+
+	# post() runs apost() in an event loop
+	def test_assign_sync(self):
+		view = self.make_view(TaskAssignView, async_views=False)
+		for kwargs, status_code in self.get_assign_cases():
+			self.assertEqual(self.post_assign(view, **kwargs).status_code, status_code, kwargs)
+		assignments = TaskAssignment.objects.filter(task=self.task).values_list('user_id', 'assigned_by_id')
+		self.assertEqual(list(assignments), [(self.other.pk, self.user.pk)])
+
+
+class TaskCacheInvalidationTests(TaskAPITestCase):
+	# invalidate_task_cache() registers one bump per transaction, and the
+	# TestCase transaction never commits: the calls are counted instead
+	def setUp(self):
+		super().setUp()
+		self.invalidate = mock.patch('apps.tasks.signals.invalidate_task_cache').start()
+		self.addCleanup(mock.patch.stopall)
+
+	def assertInvalidates(self, write):
+		self.invalidate.reset_mock()
+		write()
+		self.invalidate.assert_called()
+
+	def test_user_writes_invalidate(self):
+		self.other.nickname = 'bobby'
+		self.assertInvalidates(self.other.save)
+		self.assertInvalidates(User.objects.filter(pk=self.other.pk).soft_delete)
+		self.assertInvalidates(make_task(self.user).soft_delete)
+		self.assertInvalidates(Task.objects.filter(pk=make_task(self.user).pk).soft_delete)
+
+	def test_login_does_not_invalidate(self):
+		self.invalidate.reset_mock()
+		self.user.save(update_fields=['last_login'])
+		self.invalidate.assert_not_called()
+
+	def test_stats_are_per_process(self):
+		self.user.is_staff = True
+		self.user.save()
+		response = self.client.get('/api/tasks/cache/stats')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['scope'], 'process')
+		self.assertIn('pid', response.data)
+
+
+class TaskOverdueTests(TaskAPITestCase):
+	def test_incremental_run_catches_saved_past_due_tasks(self):
+		now = timezone.now()
+		mark_overdue_tasks(now=now - timedelta(hours=1))
+		self.assertIsNotNone(JobCheckpoint.objects.get().position_at)
+		# Due long before the last run, but created after it
+		late = make_task(self.user, due_date=now - timedelta(days=3))
+		# Due before the last run and untouched since: the last run's business
+		untouched = make_task(self.user, due_date=now - timedelta(days=3))
+		Task.objects.filter(pk=untouched.pk).update(updated_at=now - timedelta(days=2))
+		upcoming = make_task(self.user, due_date=now + timedelta(days=1))
+
+		result = mark_overdue_tasks(now=now)
+		self.assertEqual(result['updated'], 1)
+		statuses = dict(Task.objects.values_list('pk', 'status'))
+		self.assertEqual(statuses[late.pk], 'overdue')
+		self.assertEqual(statuses[untouched.pk], 'pending')
+		self.assertEqual(statuses[upcoming.pk], 'pending')
+
+		mark_overdue_tasks(now=now, full=True)
+		self.assertEqual(Task.objects.get(pk=untouched.pk).status, 'overdue')
+
+	def test_clients_cannot_set_overdue(self):
+		task = make_task(self.user)
+		response = self.client.patch(f'/api/tasks/{task.pk}/', {'status': 'overdue'}, format='json')
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('status', response.data)
+		response = self.client.patch('/api/tasks/bulk/', [{'id': task.pk, 'status': 'overdue'}], format='json')
+		self.assertEqual(response.status_code, 400)
+		response = self.client.post('/api/tasks/bulk/', [{
+			'title': 'Late', 'description': 'Late', 'status': 'overdue', 'priority': 'low',
+			'due_date': timezone.now().isoformat(), 'estimated_hours': '1.00',
+		}], format='json')
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(Task.objects.get(pk=task.pk).status, 'pending')
+
+		# Sent back unchanged, e.g. a PUT of what was read
+		Task.objects.filter(pk=task.pk).update(status='overdue')
+		response = self.client.patch(f'/api/tasks/{task.pk}/', {'status': 'overdue', 'title': 'Late'}, format='json')
+		self.assertEqual(response.status_code, 200)
+		response = self.client.patch('/api/tasks/bulk/', [{'id': task.pk, 'status': 'overdue', 'title': 'Later'}], format='json')
+		self.assertEqual(response.status_code, 200)
+		response = self.client.patch(f'/api/tasks/{task.pk}/', {'status': 'completed'}, format='json')
+		self.assertEqual(response.status_code, 200)
+
+
+	def test_events_only_for_rows_written(self):
+		now = timezone.now()
+		pending = make_task(self.user, due_date=now - timedelta(hours=1))
+		started = make_task(self.user, status='in_progress', due_date=now - timedelta(hours=1))
+		finished = make_task(self.user, due_date=now - timedelta(hours=1))
+		get_open_tasks = jobs.get_open_tasks
+		calls = []
+
+		# Completed by someone else between the chunk read and its lock
+		def complete_meanwhile():
+			calls.append(1)
+			if len(calls) == 2:
+				Task.objects.filter(pk=finished.pk).update(status='completed')
+			return get_open_tasks()
+
+		with (
+			mock.patch('apps.tasks.jobs.get_open_tasks', side_effect=complete_meanwhile),
+			mock.patch('apps.tasks.jobs.queue_task_events') as events,
+			mock.patch('apps.tasks.jobs.record_activity') as activity,
+		):
+			result = mark_overdue_tasks(now=now)
+		self.assertEqual(result['updated'], 2)
+		self.assertEqual(Task.objects.get(pk=finished.pk).status, 'completed')
+		events.assert_called_once_with('updated', [pending.pk, started.pk])
+		self.assertEqual(sorted(call.args for call in activity.call_args_list), [
+			('updated', [pending.pk], {'status': ['pending', 'overdue']}),
+			('updated', [started.pk], {'status': ['in_progress', 'overdue']}),
+		])
+
+
+class TaskActivityFlushTests(TestCase):
+	def setUp(self):
+		self.client = mock.patch('apps.tasks.jobs.get_client').start().return_value
+		self.client.lrange.return_value = []
+		self.client.llen.return_value = 0
+		self.addCleanup(mock.patch.stopall)
+
+	def test_lock_outlives_the_run(self):
+		jobs.flush_task_activity(max_seconds=5)
+		self.client.lock.assert_called_once_with(FLUSH_LOCK, timeout=5 + jobs.ACTIVITY_FLUSH_BATCH_SECONDS)
+
+	def test_celery_task_is_always_bounded(self):
+		celery_tasks.flush_task_activity.run(max_seconds=None)
+		self.client.lock.assert_called_once_with(
+			FLUSH_LOCK, timeout=jobs.ACTIVITY_FLUSH_SECONDS + jobs.ACTIVITY_FLUSH_BATCH_SECONDS,
+		)
+
+
+class TaskRowSerializerTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		parent = make_task(self.user, title='Parent', actual_hours=None)
+		child = make_task(
+			self.other, title='Child', parent_task=parent, actual_hours='2.50',
+			metadata={'external_id': 'X-1', 'labels': ['a', 'b'], 'nested': {'n': 1.5}},
+		)
+		child.tags.add(self.tag, Tag.objects.create(name='backend'))
+		for user in (self.other, self.user):
+			TaskAssignment.objects.create(task=child, user=user, assigned_by=self.user)
+		make_task(self.user, title='Empty', metadata=None)
+		self.ids = list(Task.objects.order_by('id').values_list('id', flat=True))
+
+	def render(self, data):
+		return JSONRenderer().render(data)
+
+	def test_rows_render_like_models(self):
+		tasks = get_task_queryset().order_by('id')
+		expected = TaskSerializer(tasks, many=True).data
+		actual = TaskRowSerializer(get_task_rows(tasks), many=True).data
+		self.assertEqual(len(actual), 3)
+		for old, new in zip(expected, actual):
+			self.assertEqual(self.render(new), self.render(old))
+		for pk in self.ids:
+			expected = TaskSerializer(get_task_queryset().get(pk=pk)).data
+			actual = TaskRowSerializer(get_task_rows(get_task_queryset()).get(pk=pk)).data
+			self.assertEqual(self.render(actual), self.render(expected))
+
+	def test_endpoints_render_like_models(self):
+		response = self.client.get('/api/tasks/', {'pagination': 'cursor', 'ordering': 'id'})
+		self.assertEqual(
+			self.render(response.data['results']),
+			self.render(TaskSerializer(get_task_queryset().order_by('id'), many=True).data),
+		)
+		for pk in self.ids:
+			response = self.client.get(f'/api/tasks/{pk}/')
+			self.assertEqual(self.render(response.data), self.render(TaskSerializer(get_task_queryset().get(pk=pk)).data))
+
+	def test_fields_with_expand(self):
+		child = Task.objects.get(title='Child')
+		params = {'fields': 'id,title,tags', 'expand': 'tags,created_by'}
+		row = self.client.get(f'/api/tasks/{child.pk}/', params).data
+		self.assertEqual(list(row), ['id', 'title', 'tags'])
+		self.assertEqual([tag['name'] for tag in row['tags']], ['bug', 'backend'])
+
+		response = self.client.get('/api/tasks/', dict(params, pagination='cursor', ordering='id'))
+		self.assertEqual([list(row) for row in response.data['results']], [['id', 'title', 'tags']] * 3)
+		# Nothing selected to expand, same as without ?expand=
+		detail = self.client.get(f'/api/tasks/{child.pk}/', {'fields': 'id,title', 'expand': 'tags'})
+		self.assertEqual(detail.data, {'id': child.pk, 'title': 'Child'})
+		self.assertEqual(detail['ETag'], self.client.get(f'/api/tasks/{child.pk}/', {'fields': 'id,title'})['ETag'])
+		self.assertEqual(TaskRowSerializer.get_row_keys(['id'], ('created_by',)), ['id'])
+
+	def test_deleted_assignees_are_left_out(self):
+		child = Task.objects.get(title='Child')
+		User.objects.filter(pk=self.other.pk).soft_delete()
+		self.test_rows_render_like_models()
+		for params in ({}, {'expand': 'assigned_to'}):
+			row = self.client.get(f'/api/tasks/{child.pk}/', params).data
+			self.assertEqual(row['assigned_to'], [self.user.pk] if not params else [
+				{'id': self.user.pk, 'username': 'alice', 'nickname': 'alice'},
+			])
+		response = self.client.get('/api/tasks/export', {'format': 'ndjson'})
+		rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+		self.assertEqual([row['assigned_to'] for row in rows if row['id'] == child.pk], [[self.user.pk]])
+
+
+class TaskConditionalRequestTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		self.task = make_task(self.user)
+		self.url = f'/api/tasks/{self.task.pk}/'
+
+	def test_not_modified_and_etag_after_write(self):
+		etag = self.client.get(self.url)['ETag']
+		response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response['ETag'], etag)
+
+		self.assertEqual(self.client.patch(self.url, {'title': 'Renamed'}, format='json').status_code, 200)
+		response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response['ETag'], etag)
+
+		# Assignments are part of the payload too
+		etag = response['ETag']
+		self.client.post(f'{self.url}assign', {'assigned_user_id': self.other.pk}, format='json')
+		self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+
+	def test_stale_if_match_fails(self):
+		stale = self.client.get(self.url)['ETag']
+		response = self.client.patch(self.url, {'title': 'First'}, format='json', HTTP_IF_MATCH=stale)
+		self.assertEqual(response.status_code, 200)
+		current = response['ETag']
+		self.assertNotEqual(current, stale)
+
+		data = {
+			'title': 'Second', 'description': 'Put', 'status': 'pending', 'priority': 'low',
+			'due_date': timezone.now().isoformat(), 'estimated_hours': '1.00',
+		}
+		for method, kwargs in (
+			(self.client.put, {'data': data}),
+			(self.client.patch, {'data': {'title': 'Second'}}),
+			(self.client.delete, {}),
+		):
+			response = method(self.url, format='json', HTTP_IF_MATCH=stale, **kwargs)
+			self.assertEqual(response.status_code, 412)
+		task = Task.objects.get(pk=self.task.pk)
+		self.assertEqual(task.title, 'First')
+
+		response = self.client.delete(self.url, HTTP_IF_MATCH=current)
+		self.assertEqual(response.status_code, 204)
+
+
+class TaskChangesTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		# The horizon is the start of the oldest open writing transaction, the
+		# TestCase one here: the clock stands in for it
+		mock.patch('apps.tasks.sync.get_sync_horizon', side_effect=timezone.now).start()
+		self.addCleanup(mock.patch.stopall)
+
+	def sync(self, since=None, **params):
+		if since:
+			params['since'] = since
+		response = self.client.get('/api/tasks/changes', params)
+		self.assertEqual(response.status_code, 200)
+		return response.data
+
+	def test_create_update_sync(self):
+		task = make_task(self.user, title='First')
+		full = self.sync()
+		self.assertEqual([row['title'] for row in full['tasks']], ['First'])
+		self.assertEqual(self.sync(full['next'])['tasks'], [])
+
+		self.client.patch(f'/api/tasks/{task.pk}/', {'title': 'Renamed'}, format='json')
+		other = make_task(self.user, title='Second')
+		changes = self.sync(full['next'])
+		self.assertEqual([(row['id'], row['title']) for row in changes['tasks']], [(task.pk, 'Renamed'), (other.pk, 'Second')])
+		self.assertEqual(changes['deleted'], [])
+		self.assertFalse(changes['has_more'])
+		self.assertEqual(self.sync(changes['next'])['tasks'], [])
+
+	def test_pages_continue_where_they_stopped(self):
+		tasks = [make_task(self.user) for _ in range(3)]
+		first = self.sync(page_size=2)
+		self.assertTrue(first['has_more'])
+		second = self.sync(first['next'], page_size=2)
+		self.assertFalse(second['has_more'])
+		self.assertEqual([row['id'] for row in first['tasks'] + second['tasks']], [task.pk for task in tasks])
+
+	def test_deletes_and_unassignments(self):
+		parent = make_task(self.user)
+		child = make_task(self.user, parent_task=parent)
+		removed = make_task(self.user)
+		assignment = TaskAssignment.objects.create(task=parent, user=self.other, assigned_by=self.user)
+		full = self.sync()
+
+		self.assertEqual(self.client.delete(f'/api/tasks/{parent.pk}/').status_code, 204)
+		# A hard delete leaves a tombstone, trigger of migration 0008
+		Task.all_objects.filter(pk=removed.pk).delete()
+		assignment.delete()
+		changes = self.sync(full['next'])
+		self.assertEqual(changes['tasks'], [])
+		self.assertEqual(sorted(changes['deleted']), sorted([parent.pk, child.pk, removed.pk]))
+		self.assertEqual(changes['unassigned'], [{'task_id': parent.pk, 'user_id': self.other.pk}])
+
+	def test_expired_token_asks_for_resync(self):
+		make_task(self.user)
+		full = self.sync()
+		purge_sync_tombstones(days=0)
+		response = self.client.get('/api/tasks/changes', {'since': full['next']})
+		self.assertEqual(response.status_code, 410)
+		self.assertEqual(response.data['detail'].code, 'sync_token_expired')
+		self.assertEqual(len(self.sync()['tasks']), 1)
+
+		response = self.client.get('/api/tasks/changes', {'since': 'not-a-token'})
+		self.assertEqual(response.status_code, 400)
+
+
+class TaskExportTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		self.tasks = [make_task(self.user, title=f'Task {number}') for number in range(5)]
+
+	def test_wsgi_export(self):
+		response = self.client.get('/api/tasks/export', {'format': 'csv'})
+		self.assertEqual(response.status_code, 200)
+		self.assertFalse(response.is_async)
+		lines = b''.join(response.streaming_content).decode().splitlines()
+		self.assertEqual(len(lines), 6)
+		self.assertTrue(lines[0].startswith('id,title,'))
+
+	# Header and first row come before the rest is read from the cursor
+	@mock.patch('apps.tasks.export.EXPORT_CHUNK_SIZE', 2)
+	async def test_asgi_export_streams_chunks(self):
+		response = await AsyncClient().get(
+			'/api/tasks/export', {'format': 'ndjson'},
+			headers={'Authorization': f'Bearer {AccessToken.for_user(self.user)}'},
+		)
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.is_async)
+		chunks = [chunk async for chunk in response.streaming_content]
+		self.assertEqual(len(chunks), 3)
+		rows = [json.loads(line) for chunk in chunks for line in chunk.decode().splitlines()]
+		self.assertEqual([row['id'] for row in rows], [task.pk for task in self.tasks])
+
+
+class TaskArchiveTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		self.removed_tag = Tag.objects.create(name='legacy')
+		self.parent = make_task(self.user, title='Parent', status='completed', actual_hours='3.00', metadata={'sprint': '7'})
+		self.child = make_task(self.user, title='Child', status='completed', parent_task=self.parent)
+		self.parent.tags.add(self.tag, self.removed_tag)
+		TaskAssignment.objects.create(task=self.parent, user=self.other, assigned_by=self.user)
+		self.carol = make_user('carol')
+		TaskAssignment.objects.create(task=self.child, user=self.carol, assigned_by=self.user)
+		# Untouched for long enough
+		Task.objects.update(updated_at=timezone.now() - timedelta(days=30))
+
+	def get_detail(self, task, **params):
+		return self.client.get(f'/api/tasks/{task.pk}/', params)
+
+	def test_archive_and_restore(self):
+		before = self.get_detail(self.parent).data
+		result = jobs.archive_tasks(days=14)
+		self.assertEqual((result['archived'], result['assignments'], result['tags']), (2, 2, 2))
+		self.assertFalse(Task.all_objects.filter(pk__in=[self.parent.pk, self.child.pk]).exists())
+		self.assertFalse(TaskAssignment.objects.exists())
+
+		self.assertEqual(self.get_detail(self.parent).status_code, 404)
+		archived = self.get_detail(self.parent, include_archived='true')
+		self.assertEqual(archived.status_code, 200)
+		self.assertEqual(archived.data, before)
+		response = self.client.get('/api/tasks/', {'include_archived': 'true', 'pagination': 'cursor', 'ordering': 'id'})
+		self.assertEqual([row['id'] for row in response.data['results']], [self.parent.pk, self.child.pk])
+
+		# Gone while archived, nothing in the archive points at them with a FK
+		self.removed_tag.delete()
+		User.all_objects.filter(pk=self.carol.pk).delete()
+		response = self.client.post(f'/api/tasks/{self.child.pk}/restore')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data, {
+			'restored': 2, 'ids': [self.parent.pk, self.child.pk], 'dropped_assignments': 1, 'dropped_tags': 1,
+		})
+		restored = self.get_detail(self.parent).data
+		self.assertEqual(restored['tags'], [self.tag.pk])
+		self.assertEqual(restored['assigned_to'], [self.other.pk])
+		for field in ('title', 'status', 'actual_hours', 'metadata', 'due_date', 'created_at', 'created_by'):
+			self.assertEqual(restored[field], before[field])
+		self.assertEqual(self.get_detail(self.child).data['parent_task'], self.parent.pk)
+		self.assertEqual(self.client.post(f'/api/tasks/{self.child.pk}/restore').status_code, 404)
+
+	def test_restore_only_creator_or_staff(self):
+		jobs.archive_tasks(days=14)
+		self.client.force_authenticate(self.other)
+		self.assertEqual(self.client.post(f'/api/tasks/{self.parent.pk}/restore').status_code, 403)
+		self.assertEqual(self.get_detail(self.parent, include_archived='true').status_code, 200)
+		self.assertFalse(Task.objects.filter(pk=self.parent.pk).exists())
+
+
+
+class TaskPurgeTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		self.purged = [make_task(self.user, title=f'Archived {n}', is_archived=True) for n in range(5)]
+		self.kept = make_task(self.user, title='Completed', status='completed')
+		Task.objects.update(updated_at=timezone.now() - timedelta(days=60))
+		# Archived but recent, still in the hot table
+		self.live = make_task(self.user, title='Live', is_archived=True)
+		jobs.archive_tasks(days=14)
+
+	def test_budget_stops_and_next_run_resumes(self):
+		ids = [task.pk for task in self.purged]
+		# No time left, nothing done and nothing moved
+		report = jobs.purge_archived_tasks(days=30, max_seconds=0)
+		self.assertEqual((report['deleted'], report['batches'], report['position_id']), (0, 0, None))
+
+		report = jobs.purge_archived_tasks(days=30, batch_size=2, max_rows=2)
+		self.assertEqual((report['deleted'], report['finished'], report['position_id']), (2, False, ids[1]))
+		self.assertEqual(JobCheckpoint.objects.get(name=jobs.PURGE_JOB).position_id, ids[1])
+
+		report = jobs.purge_archived_tasks(days=30, batch_size=2, max_rows=2)
+		self.assertEqual((report['deleted'], report['position_id']), (2, ids[3]))
+		self.assertEqual(list(TaskWithArchive.objects.filter(pk__in=ids).values_list('pk', flat=True)), ids[4:])
+
+		report = jobs.purge_archived_tasks(days=30, batch_size=2)
+		self.assertEqual((report['deleted'], report['finished'], report['position_id']), (1, True, None))
+		self.assertFalse(TaskWithArchive.objects.filter(pk__in=ids).exists())
+		# Completed tasks stay archived, live rows are never touched
+		self.assertTrue(TaskWithArchive.objects.filter(pk=self.kept.pk).exists())
+		self.assertTrue(Task.objects.filter(pk=self.live.pk).exists())
+		self.assertEqual(Task.all_objects.count(), 1)
+
+
+
+class TaskTreeTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		self.root = make_task(self.user, title='Root', actual_hours='1.00')
+		self.left = make_task(self.user, title='Left', parent_task=self.root, status='completed', actual_hours='2.50')
+		self.right = make_task(self.user, title='Right', parent_task=self.root)
+		self.leaf = make_task(self.user, title='Leaf', parent_task=self.left, estimated_hours=3)
+
+	def get_tree(self, task, **params):
+		return self.client.get(f'/api/tasks/{task.pk}/tree/', params)
+
+	def test_nested_and_rolled_up(self):
+		tree = self.get_tree(self.root).data
+		self.assertEqual([child['id'] for child in tree['children']], [self.left.pk, self.right.pk])
+		left = tree['children'][0]
+		self.assertEqual([(child['id'], child['depth']) for child in left['children']], [(self.leaf.pk, 2)])
+		self.assertEqual(left['rollup'], {
+			'tasks': 2, 'estimated_hours': '4.00', 'actual_hours': '2.50', 'status_counts': {'completed': 1, 'pending': 1},
+		})
+		self.assertEqual(tree['rollup'], {
+			'tasks': 4, 'estimated_hours': '6.00', 'actual_hours': '3.50', 'status_counts': {'pending': 3, 'completed': 1},
+		})
+		self.assertFalse(any(node['truncated'] for node in (tree, left, left['children'][0])))
+		# A subtree on its own
+		self.assertEqual(self.get_tree(self.left).data['rollup']['tasks'], 2)
+
+	def test_cycle_terminates(self):
+		# Can't be saved through the API, but nothing in the table prevents it
+		Task.objects.filter(pk=self.root.pk).update(parent_task=self.leaf)
+		response = self.get_tree(self.root)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['rollup']['tasks'], 4)
+		leaf = response.data['children'][0]['children'][0]
+		self.assertEqual((leaf['id'], leaf['children'], leaf['truncated']), (self.leaf.pk, [], False))
+		self.assertEqual(self.get_tree(self.leaf, depth=50).data['rollup']['tasks'], 4)
+
+	def test_soft_deleted_children_left_out(self):
+		Task.objects.filter(pk=self.left.pk).update(is_deleted=True)
+		tree = self.get_tree(self.root).data
+		self.assertEqual([child['id'] for child in tree['children']], [self.right.pk])
+		self.assertEqual(tree['rollup']['tasks'], 2)
+		self.assertEqual(self.get_tree(self.left).status_code, 404)
+
+	def test_depth_cap(self):
+		tree = self.get_tree(self.root, depth=1).data
+		left, right = tree['children']
+		self.assertEqual((left['children'], left['truncated']), ([], True))
+		self.assertFalse(right['truncated'])
+		self.assertEqual(tree['rollup']['tasks'], 3)
+		self.assertTrue(self.get_tree(self.root, depth=0).data['truncated'])
+
+		self.assertEqual(self.get_tree(self.root, depth=50).status_code, 200)
+		for depth in (51, -1, 'deep'):
+			response = self.get_tree(self.root, depth=depth)
+			self.assertEqual(response.status_code, 400)
+			self.assertIn('depth', response.data)
+
+
+
+class TaskStatsTests(TaskAPITestCase):
+	def test_refresh_then_read(self):
+		make_task(self.user, estimated_hours=2, actual_hours='1.50', due_date=timezone.now() + timedelta(days=3))
+		done = make_task(self.user, status='completed', priority='high', due_date=timezone.now() - timedelta(days=1))
+		done.tags.add(self.tag)
+		TaskAssignment.objects.create(task=done, user=self.other, assigned_by=self.user)
+		make_task(self.user, is_deleted=True)
+		report = jobs.refresh_task_stats()
+
+		response = self.client.get('/api/tasks/stats/')
+		self.assertEqual(response.status_code, 200)
+		stats = response.data
+		self.assertEqual(stats['as_of'], report['as_of'].replace('+00:00', 'Z'))
+		self.assertLess(stats['age_seconds'], 60)
+		self.assertEqual(stats['refresh_interval'], settings.TASK_STATS_REFRESH_SECONDS)
+		self.assertEqual(stats['total'], {'tasks': 2, 'estimated_hours': '3.00', 'actual_hours': '1.50'})
+		self.assertEqual(
+			{row['key']: row['tasks'] for row in stats['by_status']}, {'pending': 1, 'completed': 1},
+		)
+		self.assertEqual(stats['by_assignee'], [
+			{'key': self.other.pk, 'label': 'bob', 'tasks': 1, 'estimated_hours': '1.00', 'actual_hours': '0.00'},
+		])
+		self.assertEqual([(row['key'], row['label']) for row in stats['by_tag']], [(self.tag.pk, 'bug')])
+		self.assertEqual({row['key'] for row in stats['by_due_date']}, {'past', 'next_week'})
+
+		# Until the next refresh the numbers stay as they were
+		make_task(self.user)
+		self.assertEqual(self.client.get('/api/tasks/stats/').data['total']['tasks'], 2)
+		jobs.refresh_task_stats()
+		self.assertEqual(self.client.get('/api/tasks/stats/').data['total']['tasks'], 3)
+
+
+
+class TaskImportTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.directory = directory.name
+		self.existing = make_task(self.user, title='Old title')
+		self.new_id = self.existing.pk + 100
+
+	def write_file(self, name: str, content: str) -> str:
+		path = os.path.join(self.directory, name)
+		with open(path, 'w') as stream:
+			stream.write(content)
+		return path
+
+	def csv_tasks(self, *rows: str) -> str:
+		header = 'id,title,description,status,priority,due_date,estimated_hours,created_by,parent_task,assigned_to,tags'
+		return self.write_file('tasks.csv', '\n'.join((header,) + rows) + '\n')
+
+	def test_csv_insert_update_parent_tags_assignments(self):
+		path = self.csv_tasks(
+			f'{self.existing.pk},New title,Updated,in_progress,high,2030-01-01T10:00:00Z,4,alice,,bob,bug;imported',
+			f'{self.new_id},Parent,From the file,pending,low,2030-01-02T10:00:00Z,2.5,bob,,,',
+			f',Child,Points at the row above,pending,low,2030-01-03T10:00:00Z,1,bob,{self.new_id},alice;bob,imported',
+		)
+		report = import_files({'tasks': path})
+		self.assertEqual(report['errors'], 0)
+		self.assertEqual((report['tasks_inserted'], report['tasks_updated']), (2, 1))
+		self.assertEqual((report['tags_created'], report['task_tags_added'], report['assignments_added']), (1, 3, 3))
+
+		self.existing.refresh_from_db()
+		self.assertEqual((self.existing.title, self.existing.status, self.existing.created_by), ('New title', 'in_progress', self.user))
+		self.assertEqual(set(self.existing.tags.values_list('name', flat=True)), {'bug', 'imported'})
+		self.assertEqual(list(self.existing.assigned_to.values_list('username', flat=True)), ['bob'])
+		# assigned_by falls back to the creator
+		self.assertEqual(TaskAssignment.objects.get(task=self.existing).assigned_by, self.user)
+
+		parent = Task.objects.get(pk=self.new_id)
+		child = Task.objects.get(title='Child')
+		self.assertEqual((parent.created_by, str(parent.estimated_hours)), (self.other, '2.50'))
+		self.assertEqual(child.parent_task, parent)
+		self.assertEqual(set(child.assigned_to.values_list('username', flat=True)), {'alice', 'bob'})
+		# The sequence skipped the explicit id
+		self.assertGreater(make_task(self.user).pk, self.new_id)
+
+	def test_ndjson_with_assignments_file(self):
+		rows = [
+			{'id': self.new_id, 'title': 'Parent', 'description': 'JSON', 'status': 'pending', 'priority': 'low',
+				'due_date': '2030-01-01T10:00:00Z', 'estimated_hours': '1', 'created_by': 'alice',
+				'metadata': {'source': 'legacy'}, 'tags': ['bug', 'json']},
+			{'title': 'Child', 'description': 'JSON', 'status': 'pending', 'priority': 'low',
+				'due_date': '2030-01-01T10:00:00Z', 'estimated_hours': 1, 'created_by': 'alice',
+				'parent_task': self.new_id, 'assigned_to': ['bob']},
+			{'id': self.existing.pk, 'title': 'Renamed', 'description': 'JSON', 'status': 'completed', 'priority': 'low',
+				'due_date': '2030-01-01T10:00:00Z', 'estimated_hours': '1', 'created_by': 'alice'},
+		]
+		tasks = self.write_file('tasks.ndjson', '\n'.join(json.dumps(row) for row in rows) + '\n\n')
+		assignments = self.write_file('assignments.csv', f'task,user,assigned_by\n{self.new_id},bob,bob\n{self.existing.pk},bob,\n')
+		report = import_files({'tasks': tasks, 'assignments': assignments}, assigned_by_id=self.other.pk)
+		self.assertEqual(report['errors'], 0)
+		self.assertEqual(report['rows'], {'tasks': 3, 'assignments': 2})
+		self.assertEqual((report['tasks_inserted'], report['tasks_updated'], report['assignments_added']), (2, 1, 3))
+
+		parent = Task.objects.get(pk=self.new_id)
+		self.assertEqual(parent.metadata, {'source': 'legacy'})
+		self.assertEqual(set(parent.tags.values_list('name', flat=True)), {'bug', 'json'})
+		self.assertEqual(Task.objects.get(title='Child').parent_task, parent)
+		self.assertEqual(Task.objects.get(pk=self.existing.pk).title, 'Renamed')
+		# --assigned-by for the rows without one
+		self.assertEqual(TaskAssignment.objects.get(task=self.existing).assigned_by, self.other)
+		self.assertEqual(TaskAssignment.objects.get(task=parent).assigned_by, self.other)
+
+	def test_one_bad_row_rolls_everything_back(self):
+		path = self.csv_tasks(
+			f'{self.existing.pk},New title,Updated,pending,low,2030-01-01T10:00:00Z,1,alice,,,imported',
+			',Broken,Row,someday,low,not a date,1,ghost,,,',
+		)
+		errors = os.path.join(self.directory, 'errors.csv')
+		report = import_files({'tasks': path}, error_report=errors)
+		self.assertEqual(report['errors'], 3)
+		self.assertEqual([(error['row'], error['field'], error['message']) for error in report['error_sample']], [
+			(2, 'created_by', 'User does not exist.'),
+			(2, 'due_date', 'Datetime has wrong format.'),
+			(2, 'status', 'Not a valid choice.'),
+		])
+		self.assertEqual(Task.objects.get(pk=self.existing.pk).title, 'Old title')
+		self.assertFalse(Tag.objects.filter(name='imported').exists())
+		with open(errors) as stream:
+			lines = stream.read().splitlines()
+		self.assertEqual(lines[0], 'source,row,field,value,message')
+		self.assertEqual(len(lines), 4)
+
+		with self.assertRaisesMessage(CommandError, '3 invalid values, nothing imported'):
+			call_command('import_tasks', tasks=path, stdout=StringIO())
+
+	def test_soft_deleted_users_are_missing(self):
+		carol = make_user('carol')
+		User.objects.filter(pk=carol.pk).soft_delete()
+		tasks = self.csv_tasks(
+			',By carol,Row,pending,low,2030-01-01T10:00:00Z,1,carol,,,',
+			',For carol,Row,pending,low,2030-01-01T10:00:00Z,1,alice,,bob;carol,',
+		)
+		assignments = self.write_file('assignments.csv', f'task,user,assigned_by\n{self.existing.pk},carol,\n{self.existing.pk},bob,carol\n')
+		report = import_files({'tasks': tasks, 'assignments': assignments})
+		self.assertEqual([(error['source'], error['row'], error['field']) for error in report['error_sample']], [
+			('assignments', 1, 'user'),
+			('assignments', 2, 'assigned_by'),
+			('tasks', 1, 'created_by'),
+			('tasks', 2, 'assigned_to'),
+		])
+		self.assertFalse(Task.objects.filter(title__in=['By carol', 'For carol']).exists())
+
+	def test_archived_ids_are_rejected(self):
+		archived = make_task(self.user, title='Archived', status='completed')
+		Task.objects.filter(pk=archived.pk).update(updated_at=timezone.now() - timedelta(days=30))
+		jobs.archive_tasks(days=14)
+		tasks = self.csv_tasks(
+			f'{archived.pk},Again,Row,pending,low,2030-01-01T10:00:00Z,1,alice,,,',
+			f',Child,Row,pending,low,2030-01-01T10:00:00Z,1,alice,{archived.pk},,',
+		)
+		assignments = self.write_file('assignments.csv', f'task,user\n{archived.pk},bob\n')
+		report = import_files({'tasks': tasks, 'assignments': assignments})
+		self.assertEqual([(error['source'], error['row'], error['field'], error['message']) for error in report['error_sample']], [
+			('assignments', 1, 'task', 'Task is archived, restore it first.'),
+			('tasks', 1, 'id', 'Task is archived, restore it first.'),
+			('tasks', 2, 'parent_task', 'Task is archived, restore it first.'),
+		])
+		self.assertFalse(Task.all_objects.filter(pk=archived.pk).exists())
+		self.assertEqual(TaskWithArchive.objects.filter(pk=archived.pk).count(), 1)
+
+	def test_dry_run_writes_nothing(self):
+		path = self.csv_tasks(
+			f'{self.existing.pk},New title,Updated,pending,low,2030-01-01T10:00:00Z,1,alice,,bob,imported',
+			',Another,Row,pending,low,2030-01-01T10:00:00Z,1,alice,,,',
+		)
+		out = StringIO()
+		call_command('import_tasks', tasks=path, dry_run=True, stdout=out)
+		self.assertIn('tasks_inserted: 1', out.getvalue())
+		self.assertIn('Dry run, rolled back.', out.getvalue())
+		self.assertEqual(Task.objects.get(pk=self.existing.pk).title, 'Old title')
+		self.assertEqual(Task.objects.count(), 1)
+		self.assertFalse(Tag.objects.filter(name='imported').exists())
+		self.assertFalse(TaskAssignment.objects.exists())
+
+
+
+class TaskMetadataFilterTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		self.string_id = make_task(self.user, metadata={
+			'external_id': '12', 'sprint': 3, 'labels': ['infra', 'db'], 'customer': {'id': 7, 'name': 'Acme'},
+		})
+		self.number_id = make_task(self.user, metadata={'external_id': 12, 'labels': ['ui']})
+		self.other_id = make_task(self.user, metadata={'external_id': 'X-1', 'customer': {'id': 8}})
+		self.empty = make_task(self.user, metadata={})
+
+	def get_ids(self, **params):
+		response = self.client.get('/api/tasks/', dict(params, pagination='cursor', ordering='id'))
+		self.assertEqual(response.status_code, 200)
+		return [row['id'] for row in response.data['results']]
+
+	def test_containment(self):
+		self.assertEqual(self.get_ids(metadata__labels='["infra"]'), [self.string_id.pk])
+		self.assertEqual(self.get_ids(metadata__labels='["db", "infra"]'), [self.string_id.pk])
+		self.assertEqual(self.get_ids(metadata__customer__id='7'), [self.string_id.pk])
+		self.assertEqual(self.get_ids(metadata__customer__name='Acme', metadata__labels='["db"]'), [self.string_id.pk])
+		self.assertEqual(self.get_ids(metadata__customer__id='9'), [])
+
+	def test_numbers_and_strings(self):
+		# Indexed key: metadata -> 'external_id' IN ('"12"', '12') for its btree index
+		with CaptureQueriesContext(connection) as queries:
+			ids = self.get_ids(metadata__external_id='12')
+		self.assertEqual(ids, [self.string_id.pk, self.number_id.pk])
+		sql = next(query['sql'] for query in queries if 'tasks_task' in query['sql'] and 'LIMIT' in query['sql'])
+		self.assertIn('"tasks_task"."metadata" ->', sql)
+		self.assertNotIn('@>', sql)
+		self.assertEqual(self.get_ids(metadata__external_id='X-1'), [self.other_id.pk])
+		self.assertEqual(self.get_ids(metadata__sprint='3'), [self.string_id.pk])
+		self.assertEqual(self.get_ids(metadata__sprint='"3"'), [])
+
+	def test_has_key(self):
+		self.assertEqual(self.get_ids(metadata__has_key='external_id'), [self.string_id.pk, self.number_id.pk, self.other_id.pk])
+		self.assertEqual(self.get_ids(metadata__has_key='external_id,customer'), [self.string_id.pk, self.other_id.pk])
+		self.assertEqual(self.get_ids(metadata__has_key='labels,sprint'), [self.string_id.pk])
+		self.assertEqual(self.get_ids(metadata__has_key='missing'), [])
+
+	def test_invalid_key(self):
+		for param in ('metadata__', 'metadata__customer____id'):
+			response = self.client.get('/api/tasks/', {param: '1'})
+			self.assertEqual(response.status_code, 400)
+			self.assertIn(param, response.data)
+
+
+class TaskHTMLViewTests(TaskAPITestCase):
+	def setUp(self):
+		super().setUp()
+		# Pages read the JWT pair that the login form keeps in the session
+		self.html = Client()
+		refresh = RefreshToken.for_user(self.user)
+		session = self.html.session
+		session['access_token'] = str(refresh.access_token)
+		session['refresh_token'] = str(refresh)
+		session.save()
+
+	def test_task_list_page_renders_through_services(self):
+		make_task(self.user, title='Write the report')
+		with mock.patch('apps.tasks.views.list_tasks', wraps=list_tasks) as listed:
+			response = self.html.get('/tasks/view/')
+		self.assertEqual(response.status_code, 200)
+		self.assertTemplateUsed(response, 'view_task.html')
+		self.assertContains(response, 'Write the report')
+		listed.assert_called_once()
+		self.assertEqual(response.context['tasks'][0]['title'], 'Write the report')
+
+	def test_add_page_creates_task_through_services(self):
+		response = self.html.post('/tasks/add/', {
+			'title': 'From the form', 'description': 'Added from the page', 'status': 'pending', 'priority': 'low',
+			'due_date': (timezone.now() + timedelta(days=2)).isoformat(), 'estimated_hours': '2',
+			'tags': [str(self.tag.pk)],
+		})
+		self.assertRedirects(response, '/tasks/view/', fetch_redirect_response=False)
+		task = Task.objects.get(title='From the form')
+		self.assertEqual(task.created_by, self.user)
+		self.assertEqual(list(task.tags.values_list('pk', flat=True)), [self.tag.pk])
+
+		response = self.html.post('/tasks/add/', {'title': '', 'status': 'pending', 'priority': 'low'})
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.context['error'])
+
+	def test_pages_redirect_without_session_tokens(self):
+		response = Client().get('/tasks/view/')
+		self.assertRedirects(response, '/auth/login/', fetch_redirect_response=False)
@@ -0,0 +1,105 @@
+from typing import (
+	Any,
+	Dict,
+	Optional,
+)
+from decimal import Decimal
+from django.db import connection
+from rest_framework import serializers
+from rest_framework.exceptions import (
+	NotFound,
+	ValidationError,
+)
+from rest_framework.request import Request
+
+# SUBTASK TREE
+# The whole descendant tree in one query: a recursive CTE over parent_task,
+# cut at max_depth, that never revisits a task already on its path (cycles).
+# Hours and status counts are rolled up bottom-up in Python
+
+TREE_DEFAULT_DEPTH = 10
+TREE_MAX_DEPTH = 50
+
+TASK_TREE_SQL = """
+	WITH RECURSIVE tree AS (
+		SELECT id, parent_task_id, 0 AS depth, ARRAY[id] AS path
+		FROM tasks_task WHERE id = %(root)s AND NOT is_deleted
+		UNION ALL
+		SELECT child.id, child.parent_task_id, tree.depth + 1, tree.path || child.id
+		FROM tasks_task child JOIN tree ON child.parent_task_id = tree.id
+		WHERE tree.depth < %(max_depth)s AND NOT child.id = ANY(tree.path) AND NOT child.is_deleted
+	)
+	SELECT
+		task.id, tree.parent_task_id, tree.depth, task.title, task.status, task.priority,
+		task.due_date, task.estimated_hours, task.actual_hours,
+		tree.depth = %(max_depth)s AND EXISTS (
+			SELECT 1 FROM tasks_task child
+			WHERE child.parent_task_id = task.id AND NOT child.id = ANY(tree.path) AND NOT child.is_deleted
+		) AS truncated
+	FROM tree JOIN tasks_task task ON task.id = tree.id
+	ORDER BY tree.depth, task.id
+"""
+
+def get_tree_depth(request: Request) -> int:
+	raw = request.query_params.get('depth', TREE_DEFAULT_DEPTH)
+	try:
+		depth = int(raw)
+	except (TypeError, ValueError):
+		raise ValidationError({'depth': 'A valid integer is required.'})
+	if not 0 <= depth <= TREE_MAX_DEPTH:
+		raise ValidationError({'depth': f'Must be between 0 and {TREE_MAX_DEPTH}.'})
+	return depth
+
+def format_hours(value: Optional[Decimal]) -> Optional[str]:
+	# Same format as the DecimalFields in TaskSerializer
+	return None if value is None else f'{value:.2f}'
+
+def get_task_tree(request: Request, pk: int) -> Dict[str, Any]:
+	max_depth = get_tree_depth(request)
+	with connection.cursor() as cursor:
+		cursor.execute(TASK_TREE_SQL, {'root': pk, 'max_depth': max_depth})
+		columns = [column.name for column in cursor.description]
+		rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+	if not rows:
+		raise NotFound()
+
+	due_date = serializers.DateTimeField()
+	nodes = {}
+	for row in rows:
+		nodes[row['id']] = {
+			'id': row['id'],
+			'title': row['title'],
+			'status': row['status'],
+			'priority': row['priority'],
+			'due_date': due_date.to_representation(row['due_date']),
+			'estimated_hours': format_hours(row['estimated_hours']),
+			'actual_hours': format_hours(row['actual_hours']),
+			'depth': row['depth'],
+			'truncated': row['truncated'],
+			'rollup': {
+				'tasks': 1,
+				'estimated_hours': row['estimated_hours'],
+				'actual_hours': row['actual_hours'] or Decimal('0'),
+				'status_counts': {row['status']: 1},
+			},
+			'children': [],
+		}
+
+	# Deepest first, so every child is complete before it's added to its parent
+	for row in reversed(rows):
+		node = nodes[row['id']]
+		rollup = node['rollup']
+		if row['depth']:
+			parent = nodes[row['parent_task_id']]
+			parent['children'].append(node)
+			parent_rollup = parent['rollup']
+			parent_rollup['tasks'] += rollup['tasks']
+			parent_rollup['estimated_hours'] += rollup['estimated_hours']
+			parent_rollup['actual_hours'] += rollup['actual_hours']
+			for task_status, count in rollup['status_counts'].items():
+				parent_rollup['status_counts'][task_status] = parent_rollup['status_counts'].get(task_status, 0) + count
+		node['children'].reverse()
+		rollup['estimated_hours'] = format_hours(rollup['estimated_hours'])
+		rollup['actual_hours'] = format_hours(rollup['actual_hours'])
+
+	return nodes[pk]
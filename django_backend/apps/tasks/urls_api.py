@@ -2,13 +2,33 @@ from django.urls import path
 from .views import (
 	TaskListView,
 	TaskDetailView,
-	TaskAssignView
+	TaskAssignView,
+	TaskBulkView,
+	TaskBulkAssignView,
+	TaskBulkUnassignView,
+	TaskCacheStatsView,
+	TaskTreeView,
+	TaskStatsView,
+	TaskExportView,
+	TaskChangesView,
+	TaskActivityView,
+	TaskRestoreView,
 )
 
 app_name = "tasks_api"
 
 urlpatterns = [
 	path('', TaskListView.as_view(), name='task_list'),
+	path('bulk/', TaskBulkView.as_view(), name='task_bulk'),
+	path('bulk/assign', TaskBulkAssignView.as_view(), name='task_bulk_assignment'),
+	path('bulk/unassign', TaskBulkUnassignView.as_view(), name='task_bulk_unassignment'),
+	path('stats/', TaskStatsView.as_view(), name='task_stats'),
+	path('export', TaskExportView.as_view(), name='task_export'),
+	path('changes', TaskChangesView.as_view(), name='task_changes'),
+	path('cache/stats', TaskCacheStatsView.as_view(), name='task_cache_stats'),
 	path('<int:pk>/', TaskDetailView.as_view(), name='task_detail'),
+	path('<int:pk>/tree/', TaskTreeView.as_view(), name='task_tree'),
+	path('<int:pk>/activity/', TaskActivityView.as_view(), name='task_activity'),
+	path('<int:pk>/restore', TaskRestoreView.as_view(), name='task_restore'),
 	path('<int:pk>/assign', TaskAssignView.as_view(), name='task_assignment'),
 ]
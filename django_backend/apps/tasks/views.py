@@ -1,16 +1,40 @@
-import requests
+from typing import (
+	Any,
+	Dict,
+)
+from asgiref.sync import (
+	async_to_sync,
+	sync_to_async,
+)
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db import transaction
+from django.db.models import QuerySet
+from django.core.handlers.asgi import ASGIRequest
 from django.http import (
 	HttpRequest,
 	HttpResponse,
+	StreamingHttpResponse,
 )
-from django.conf import settings
 from django.shortcuts import (
 	render,
 	redirect,
 	get_object_or_404,
 )
 from apps.users.models import User
+from apps.users.services import list_users
+from apps.auth_jwt.services import get_session_user
+from apps.common.async_api import (
+	AsyncAPIMixin,
+	aget_object_or_404,
+)
+from apps.common.metrics import timed
+from apps.common.replicas import ReplicaReadMixin
+from apps.common.utils import (
+	as_api_request,
+	api_error_data,
+	check_conditions,
+	set_validators,
+)
 from apps.tasks.models import (
 	Tag,
 	Task,
@@ -18,51 +42,293 @@ from apps.tasks.models import (
 )
 from rest_framework import (
 	generics,
-	filters,
 	status,
 )
+from rest_framework.exceptions import (
+	APIException,
+	ValidationError,
+)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
-from .serializer import TaskSerializer
-
-class TaskListPagination(PageNumberPagination):
-	page_size = 10
-	page_size_query_param = 'page_size'
-	max_page_size = 30 # To protect max page size of API
-
-# GET POST
-class TaskListView(generics.ListCreateAPIView):
-	queryset = Task.objects.select_related('created_by', 'parent_task').prefetch_related('assigned_to', 'tags')
+from rest_framework.permissions import (
+	IsAuthenticated,
+	IsAdminUser,
+)
+from .serializer import (
+	TaskSerializer,
+	TaskRowSerializer,
+	TaskActivitySerializer,
+)
+from .filters import (
+	TaskFilter,
+	TaskSearchFilter,
+)
+from .pagination import (
+	TaskListPagination,
+	TaskActivityPagination,
+)
+from .cache import (
+	CachedResponseMixin,
+	get_cache_stats,
+)
+from .services import (
+	get_task_queryset,
+	get_task_rows,
+	get_field_selection,
+	get_task_validators,
+	get_task_list_etag,
+	filter_tasks,
+	get_task_paginator,
+	list_tasks,
+	create_task,
+	soft_delete_tasks,
+	get_task_stats,
+	get_task_activity,
+)
+from .bulk import (
+	bulk_create_tasks,
+	bulk_update_tasks,
+	bulk_delete_tasks,
+	bulk_assign_users,
+	bulk_unassign_users,
+)
+from .tree import get_task_tree
+from .sync import get_task_changes
+from .archive import restore_task
+from .export import (
+	aiterate_export,
+	export_tasks,
+	EXPORT_FORMATS,
+)
+
+# GET POST, GET served async under ASGI (see apps/common/async_api.py)
+class TaskListView(AsyncAPIMixin, ReplicaReadMixin, CachedResponseMixin, generics.ListCreateAPIView):
 	serializer_class = TaskSerializer
 	permission_classes = [IsAuthenticated]
 	# Pagination
 	pagination_class = TaskListPagination
-	# Searching
-	filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-	search_fields = ['title', 'priority']
-	# Filtering
-	filterset_fields = ['status', 'priority', 'assigned_to', 'created_by', 'tags']
+	# Searching (full-text + trigram) and filtering, applied by services.filter_tasks,
+	# declared here for the browsable API filter forms
+	filter_backends = [DjangoFilterBackend, TaskSearchFilter]
+	filterset_class = TaskFilter
+
+	def get_queryset(self) -> QuerySet:
+		return get_task_queryset(self.request)
+
+	def filter_queryset(self, queryset: QuerySet) -> QuerySet:
+		return filter_tasks(self.request, queryset)
+
+	@property
+	def paginator(self):
+		if not hasattr(self, '_paginator'):
+			self._paginator = get_task_paginator(self.request)
+		return self._paginator
+
+	def list(self, request: Request, *args, **kwargs) -> Response:
+		etag = get_task_list_etag(request)
+		not_modified = check_conditions(request, etag)
+		if not_modified:
+			return not_modified
+		return set_validators(self.cached_response(request, self.list_rows), etag)
+
+	async def aget(self, request: Request, *args, **kwargs) -> Response:
+		etag = await sync_to_async(get_task_list_etag)(request)
+		not_modified = check_conditions(request, etag)
+		if not_modified:
+			return not_modified
+		return set_validators(await self.acached_response(request, self.alist_rows), etag)
+
+	# ListModelMixin.list on plain rows, see serializer.TaskRowSerializer
+	def list_rows(self, request: Request) -> Response:
+		selection = get_field_selection(request)
+		page = self.paginate_queryset(self.get_row_queryset(selection))
+		with timed('serialize'):
+			data = TaskRowSerializer(page, many=True, context=selection).data
+		return self.get_paginated_response(data)
+
+	async def alist_rows(self, request: Request) -> Response:
+		selection = get_field_selection(request)
+		# The filterset checks ids against the database, the rows are awaited
+		queryset = await sync_to_async(self.get_row_queryset)(selection)
+		page = await self.paginator.apaginate_queryset(queryset, request, self)
+		with timed('serialize'):
+			data = TaskRowSerializer(page, many=True, context=selection).data
+		return self.get_paginated_response(data)
+
+	def get_row_queryset(self, selection: Dict[str, Any]) -> QuerySet:
+		extra_keys = getattr(self.paginator, 'row_keys', ())
+		return get_task_rows(self.filter_queryset(self.get_queryset()), extra_keys=extra_keys, **selection)
 
 	def perform_create(self, serializer):
 		serializer.save(created_by=self.request.user)
 
-# GET PUT PATCH DELETE
-class TaskDetailView(generics.RetrieveUpdateDestroyAPIView):
-	queryset = Task.objects.select_related('created_by', 'parent_task').prefetch_related('assigned_to', 'tags')
+# GET PUT PATCH DELETE, GET served async under ASGI
+class TaskDetailView(AsyncAPIMixin, ReplicaReadMixin, CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
 	serializer_class = TaskSerializer
 	permission_classes = [IsAuthenticated]
 
+	def get_queryset(self) -> QuerySet:
+		return get_task_queryset()
+
+	def retrieve(self, request: Request, *args, **kwargs) -> Response:
+		validators = get_task_validators(request, kwargs['pk'])
+		not_modified = check_conditions(request, *validators)
+		if not_modified:
+			return not_modified
+		return set_validators(self.cached_response(request, self.retrieve_row, *args, **kwargs), *validators)
+
+	async def aget(self, request: Request, *args, **kwargs) -> Response:
+		validators = await sync_to_async(get_task_validators)(request, kwargs['pk'])
+		not_modified = check_conditions(request, *validators)
+		if not_modified:
+			return not_modified
+		return set_validators(await self.acached_response(request, self.aretrieve_row, *args, **kwargs), *validators)
+
+	# If-Match / If-Unmodified-Since, checked with the row locked so it can't
+	# change between the check and the write
+	def update(self, request: Request, *args, **kwargs) -> Response:
+		with transaction.atomic():
+			check_conditions(request, *get_task_validators(request, kwargs['pk'], lock=True))
+			response = super().update(request, *args, **kwargs)
+		# Read again, tag and assignment changes move updated_at after the save
+		return set_validators(response, *get_task_validators(request, kwargs['pk']))
+
+	def destroy(self, request: Request, *args, **kwargs) -> Response:
+		with transaction.atomic():
+			check_conditions(request, *get_task_validators(request, kwargs['pk'], lock=True))
+			return super().destroy(request, *args, **kwargs)
+
+	# Soft delete, subtasks go with it
+	def perform_destroy(self, instance: Task) -> None:
+		soft_delete_tasks(Task.objects.filter(pk=instance.pk))
+
+	def retrieve_row(self, request: Request, pk: int) -> Response:
+		selection = get_field_selection(request)
+		# Writes only find hot tasks, reads also archived ones with ?include_archived=true
+		row = get_object_or_404(get_task_rows(get_task_queryset(request), **selection), pk=pk)
+		with timed('serialize'):
+			data = TaskRowSerializer(row, context=selection).data
+		return Response(data)
+
+	async def aretrieve_row(self, request: Request, pk: int) -> Response:
+		selection = get_field_selection(request)
+		row = await aget_object_or_404(get_task_rows(get_task_queryset(request), **selection), pk=pk)
+		with timed('serialize'):
+			data = TaskRowSerializer(row, context=selection).data
+		return Response(data)
+
+# GET ?depth=, the task with all its subtasks nested and rolled up, see tree.get_task_tree
+class TaskTreeView(CachedResponseMixin, APIView):
+	permission_classes = [IsAuthenticated]
+
+	def get(self, request: Request, pk: int) -> Response:
+		return self.cached_response(request, self.get_tree, pk=pk)
+
+	def get_tree(self, request: Request, pk: int) -> Response:
+		return Response(get_task_tree(request, pk))
+
+# GET, counts and hour sums by status, priority, assignee, tag and due date
+class TaskStatsView(ReplicaReadMixin, APIView):
+	permission_classes = [IsAuthenticated]
+
+	def get(self, request: Request) -> Response:
+		return Response(get_task_stats())
+
+# GET ?since=<token>, what changed since the previous sync, see sync.get_task_changes
+class TaskChangesView(APIView):
+	permission_classes = [IsAuthenticated]
+
+	def get(self, request: Request) -> Response:
+		return Response(get_task_changes(request))
+
+# GET ?cursor= ?page_size= ?ordering=created_at, the task's history newest first
+class TaskActivityView(APIView):
+	permission_classes = [IsAuthenticated]
+
+	def get(self, request: Request, pk: int) -> Response:
+		paginator = TaskActivityPagination()
+		rows = paginator.paginate_queryset(get_task_activity(pk), request, self)
+		with timed('serialize'):
+			data = TaskActivitySerializer(rows, many=True).data
+		return paginator.get_paginated_response(data)
+
+# POST, moves an archived task (and its subtasks) back, see archive.restore_task
+class TaskRestoreView(APIView):
+	permission_classes = [IsAuthenticated]
+
+	def post(self, request: Request, pk: int) -> Response:
+		restored = restore_task(request, pk)
+		return Response(
+			{'restored': len(restored['ids']), **restored},
+			status=status.HTTP_200_OK)
+
+# GET ?format=csv|ndjson plus the same filters and search as TaskListView
+# Under ASGI the rows are sent from an async iterator, see export.aiterate_export
+class TaskExportView(ReplicaReadMixin, APIView):
+	permission_classes = [IsAuthenticated]
+	renderer_classes = [JSONRenderer]
+
+	def perform_content_negotiation(self, request: Request, force: bool = False):
+		# ?format= is the export format here, not DRF's renderer override.
+		# JSON is only used for errors
+		renderer = self.get_renderers()[0]
+		return renderer, renderer.media_type
+
+	def get(self, request: Request) -> StreamingHttpResponse:
+		export_format = request.query_params.get('format', 'csv')
+		rows = export_tasks(request, export_format)
+		if isinstance(request._request, ASGIRequest):
+			rows = aiterate_export(rows)
+		response = StreamingHttpResponse(rows, content_type=EXPORT_FORMATS[export_format])
+		response['Content-Disposition'] = f'attachment; filename="tasks.{export_format}"'
+		return response
+
+# GET, hit/miss counters of this process for the task response cache
+class TaskCacheStatsView(APIView):
+	permission_classes = [IsAdminUser]
+
+	def get(self, request: Request) -> Response:
+		return Response(get_cache_stats())
+
+
+# POST PATCH DELETE with a JSON array, see bulk.py
+class TaskBulkView(APIView):
+	permission_classes = [IsAuthenticated]
+
+	def post(self, request: Request) -> Response:
+		tasks = bulk_create_tasks(request, request.data)
+		return Response(
+			{'created': len(tasks), 'ids': [task.id for task in tasks]},
+			status=status.HTTP_201_CREATED)
+
+	def patch(self, request: Request) -> Response:
+		tasks = bulk_update_tasks(request, request.data)
+		return Response(
+			{'updated': len(tasks), 'ids': [task.id for task in tasks]},
+			status=status.HTTP_200_OK)
+
+	def delete(self, request: Request) -> Response:
+		deleted = bulk_delete_tasks(request, request.data)
+		return Response(
+			{'deleted': deleted},
+			status=status.HTTP_200_OK)
 
-class TaskAssignView(APIView):
+
+# POST, served async under ASGI
+class TaskAssignView(AsyncAPIMixin, APIView):
 	permission_classes = [IsAuthenticated]
 
+	# One implementation, the sync view (ASYNC_API_VIEWS = 0) runs it in an event loop
 	def post(self, request: Request, pk: int) -> Response:
-		task = get_object_or_404(Task, pk=pk)
+		return async_to_sync(self.apost)(request, pk)
+
+	async def apost(self, request: Request, pk: int) -> Response:
+		task = await aget_object_or_404(Task.objects, pk=pk)
 
-		if not (request.user == task.created_by or request.user.is_staff):
+		# By id, task.created_by would be a query outside the async ORM
+		if not (request.user.pk == task.created_by_id or request.user.is_staff):
 			return Response(
 				{'detail': 'Forbidden'},
 				status=status.HTTP_403_FORBIDDEN)
@@ -73,14 +339,14 @@ class TaskAssignView(APIView):
 				{'assigned_user_id': 'This field is required.'},
 				status=status.HTTP_400_BAD_REQUEST)
 
-		user_assigned = get_object_or_404(User, pk=assigned_user_id)
+		user_assigned = await aget_object_or_404(User.objects, pk=assigned_user_id)
 
-		if TaskAssignment.objects.filter(task=task, user=user_assigned).exists():
+		if await TaskAssignment.objects.filter(task=task, user=user_assigned).aexists():
 			return Response(
 				{'detail': 'User already assigned to this task.'},
 				status=status.HTTP_200_OK)
 
-		assignment = TaskAssignment.objects.create(
+		assignment = await TaskAssignment.objects.acreate(
 			task=task,
 			user=user_assigned,
 			assigned_by=request.user
@@ -91,24 +357,38 @@ class TaskAssignView(APIView):
 			status=status.HTTP_201_CREATED)
 
 
+# POST {"task_ids": [...], "user_ids": [...]} or {"assignments": [{"task_id": ..., "user_ids": [...]}]}
+class TaskBulkAssignView(APIView):
+	permission_classes = [IsAuthenticated]
+
+	def post(self, request: Request) -> Response:
+		result = bulk_assign_users(request, request.data)
+		return Response(
+			result,
+			status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)
+
+
+class TaskBulkUnassignView(APIView):
+	permission_classes = [IsAuthenticated]
+
+	def post(self, request: Request) -> Response:
+		return Response(
+			bulk_unassign_users(request, request.data),
+			status=status.HTTP_200_OK)
+
+
 # This 2 functions are made to check token validation, if not valid redirect to login
 def clear_tokens(request):
 	request.session.pop('access_token', None)
 	request.session.pop('refresh_token', None)
 
-def check_token_or_redirect(request: HttpRequest, test_url: str, redirect_url: str = 'auth_jwt_html:login'):
-	if 'access_token' not in request.session:
-		clear_tokens(request)
-		return redirect(redirect_url)
-	headers = {'Authorization': f'Bearer {request.session["access_token"]}'}
-	try:
-		response = requests.get(test_url, headers=headers)
-		if response.status_code == 401:
-			clear_tokens(request)
-			return redirect(redirect_url)
-	except Exception:
+# Validates the session token in-process and sets request.user for the service layer
+def check_token_or_redirect(request: HttpRequest, redirect_url: str = 'auth_jwt_html:login'):
+	user = get_session_user(request)
+	if user is None:
 		clear_tokens(request)
 		return redirect(redirect_url)
+	request.user = user
 	return None
 
 # Refactorizing form data to edit and add tasks
@@ -126,22 +406,16 @@ def get_task_form_data(request):
 
 # TASK ACTIONS
 def add_task_view(request: HttpRequest) -> HttpResponse:
-	test_url = f"{settings.API_BASE_URL}/api/tasks"
-	token_check = check_token_or_redirect(request, test_url)
+	token_check = check_token_or_redirect(request)
 	if token_check:
 		return token_check
 	if request.method == "POST":
 		data = get_task_form_data(request)
-		api_url = f"{settings.API_BASE_URL}/api/tasks/"
-		headers = {'Authorization': f'Bearer {request.session["access_token"]}'}
 		try:
-			response = requests.post(api_url, json=data, headers=headers)
-			if response.status_code == 201:
-				return redirect("tasks_html:view_task")
-			else:
-				error = response.json()
-		except Exception as e:
-			error = {"error": str(e)}
+			create_task(as_api_request(request), data)
+			return redirect("tasks_html:view_task")
+		except ValidationError as e:
+			error = api_error_data(e)
 		tags = Tag.objects.all()
 		return render(request, "add_task.html", {
 			"error": error,
@@ -154,37 +428,24 @@ def add_task_view(request: HttpRequest) -> HttpResponse:
 
 
 def view_tasks_view(request: HttpRequest) -> HttpResponse:
-	test_url = f"{settings.API_BASE_URL}/api/tasks"
-	token_check = check_token_or_redirect(request, test_url)
+	token_check = check_token_or_redirect(request)
 	if token_check:
 		return token_check
 
-	api_url = f"{settings.API_BASE_URL}/api/tasks/"
-	users_url = f"{settings.API_BASE_URL}/api/users/"
-	headers = {'Authorization': f'Bearer {request.session["access_token"]}'}
+	api_request = as_api_request(request)
 	tasks = []
 	users = []
 	error = None
 	try:
-		response = requests.get(api_url, headers=headers)
-		if response.status_code == 200:
-			tasks = response.json().get('results', [])
-		elif response.status_code == 401:
-			token_check = check_token_or_redirect(request, test_url)
-			if token_check:
-				return token_check
-		else:
-			error = "Error loading tasks"
-	except Exception as e:
-		error = f"Connection error: {str(e)}"
-	try:
-		response = requests.get(users_url, headers=headers)
-		if response.status_code == 200:
-			users = response.json().get('results', [])
-	except Exception:
-		pass
+		tasks = list_tasks(api_request).get('results', [])
+	except APIException:
+		error = "Error loading tasks"
+	# Admin only, like GET /api/users/
+	if request.user.is_staff:
+		users = list_users(api_request).get('results', [])
 	return render(request, "view_task.html", {
 		"tasks": tasks,
 		"users": users,
 		"error": error,
-	})
\ No newline at end of file
+	})
+
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 17:53
+
+import apps.users.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('users', '0003_alter_user_options_user_is_deleted'),
+	]
+
+	operations = [
+		migrations.AlterModelOptions(
+			name='user',
+			options={'default_manager_name': 'all_objects', 'verbose_name': 'user', 'verbose_name_plural': 'users'},
+		),
+		migrations.AlterModelManagers(
+			name='user',
+			managers=[
+				('objects', apps.users.models.LiveUserManager()),
+				('all_objects', apps.users.models.AllUserManager()),
+			],
+		),
+		# Users deleted before soft_delete() also deactivated them
+		migrations.RunSQL('UPDATE users_user SET is_active = false WHERE is_deleted', migrations.RunSQL.noop),
+	]
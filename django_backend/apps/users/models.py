@@ -1,10 +1,40 @@
 from django.db import models
-from django.contrib.auth.models import AbstractUser
-from apps.common.models import SoftDeleteModel
+from django.contrib.auth.models import (
+	AbstractUser,
+	UserManager,
+)
+from apps.common.models import (
+	SoftDeleteModel,
+	SoftDeleteQuerySet,
+)
+from apps.common.signals import soft_deleted
+
+class UserQuerySet(SoftDeleteQuerySet):
+	# A deleted user can't log in anymore either
+	def soft_delete(self) -> int:
+		deleted = self.update(is_deleted=True, is_active=False)
+		if deleted:
+			soft_deleted.send(sender=self.model)
+		return deleted
+
+class AllUserManager(UserManager.from_queryset(UserQuerySet)):
+	pass
+
+class LiveUserManager(AllUserManager):
+	def get_queryset(self) -> UserQuerySet:
+		return super().get_queryset().filter(is_deleted=False)
 
 # Recommended in Django doc, this allows customize user in the future easily
 class User(SoftDeleteModel, AbstractUser):
 	nickname = models.CharField(max_length=20, blank=False, null=False)
 
+	objects = LiveUserManager()
+	all_objects = AllUserManager()
+
+	# Unique checks (username) and authentication go through the default
+	# manager, they have to see deleted users too
+	class Meta(AbstractUser.Meta):
+		default_manager_name = 'all_objects'
+
 	def __str__ (self) -> str:
 		return self.username
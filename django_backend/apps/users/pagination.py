@@ -0,0 +1,6 @@
+from rest_framework.pagination import PageNumberPagination
+
+class UserListPagination(PageNumberPagination):
+	page_size = 10
+	page_size_query_param = 'page_size'
+	max_page_size = 20 # To protect max page size of API
@@ -0,0 +1,29 @@
+from typing import (
+	Any,
+	Dict,
+)
+from django.contrib.auth import get_user_model
+from django.db.models.query import QuerySet
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import IsAdminUser
+from rest_framework.request import Request
+from apps.common.metrics import timed
+from .pagination import UserListPagination
+from .serializers import UserSerializer
+
+User = get_user_model()
+
+# Shared by UserListView and the HTML views
+
+def get_user_queryset() -> QuerySet:
+	return User.objects.all()
+
+def list_users(request: Request) -> Dict[str, Any]:
+	# Same rule as UserListView.permission_classes
+	if not IsAdminUser().has_permission(request, None):
+		raise PermissionDenied()
+	paginator = UserListPagination()
+	page = paginator.paginate_queryset(get_user_queryset(), request)
+	with timed('serialize'):
+		data = UserSerializer(page, many=True, context={'request': request}).data
+	return paginator.get_paginated_response(data).data
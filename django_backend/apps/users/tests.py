@@ -1,3 +1,22 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
+from apps.users.models import User
 
-# Create your tests here.
+class CurrentUserConditionalTests(TestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='alice', password='password', nickname='alice')
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+
+	def test_not_modified_until_the_user_changes(self):
+		etag = self.client.get('/api/users/me/')['ETag']
+		response = self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response['ETag'], etag)
+
+		self.user.nickname = 'ally'
+		self.user.save()
+		response = self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['nickname'], 'ally')
+		self.assertNotEqual(response['ETag'], etag)
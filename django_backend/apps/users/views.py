@@ -3,7 +3,6 @@ from django.db.models.query import QuerySet
 from rest_framework import generics
 from rest_framework.request import Request
 from rest_framework.response import Response as DRFResponse
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import (
 	IsAuthenticated,
 	IsAdminUser,
@@ -12,25 +11,30 @@ from rest_framework.decorators import (
 	api_view,
 	permission_classes,
 )
+from apps.common.replicas import ReplicaReadMixin
+from apps.common.utils import (
+	check_conditions,
+	make_etag,
+	set_validators,
+)
 from .serializers import UserSerializer
 from .permissions import IsSelfOrReadOnly
+from .pagination import UserListPagination
+from .services import get_user_queryset
 
 User = get_user_model()
 
 # USER MANAGEMENT
 
-class UserListPagination(PageNumberPagination):
-	page_size = 10
-	page_size_query_param = 'page_size'
-	max_page_size = 20 # To protect max page size of API
-
 # GET
-class UserListView(generics.ListAPIView):
-	queryset = User.objects.all()
+class UserListView(ReplicaReadMixin, generics.ListAPIView):
 	serializer_class = UserSerializer
 	pagination_class = UserListPagination
 	permission_classes = [IsAdminUser]
 
+	def get_queryset(self) -> QuerySet:
+		return get_user_queryset()
+
 # GET & PUT
 class UserDetailUpdateView(generics.RetrieveUpdateAPIView):
 	queryset = User.objects.all()
@@ -42,4 +46,9 @@ class UserDetailUpdateView(generics.RetrieveUpdateAPIView):
 @permission_classes([IsAuthenticated])
 def current_user(request: Request) -> DRFResponse:
 	serializer = UserSerializer(request.user)
-	return DRFResponse(serializer.data)
\ No newline at end of file
+	# The user was already loaded by the authentication, so the ETag costs no query
+	etag = make_etag(sorted(serializer.data.items()))
+	not_modified = check_conditions(request, etag)
+	if not_modified:
+		return not_modified
+	return set_validators(DRFResponse(serializer.data), etag)
\ No newline at end of file
@@ -9,8 +9,26 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from apps.tasks.events import (  # noqa: E402
+	TASK_EVENTS_PATH,
+	task_events_app,
+)
+
+if settings.DEBUG:
+	# Like runserver
+	django_application = ASGIStaticFilesHandler(django_application)
+
+# The task events stream is served outside Django, see apps.tasks.events
+async def application(scope, receive, send):
+	if scope['type'] == 'http' and scope['path'] == TASK_EVENTS_PATH:
+		return await task_events_app(scope, receive, send)
+	return await django_application(scope, receive, send)
@@ -12,8 +12,6 @@ DEBUG = True
 # Default is empty, in development statements use this list. Our service is called "web by default"
 ALLOWED_HOSTS = ["localhost","127.0.0.1","web"]
 
-API_BASE_URL = os.environ.get('API_BASE_URL', 'http://web:8000')
-
 INSTALLED_APPS = [
 	'rest_framework', # DRF (Django REST Framework)
 	'rest_framework_simplejwt', # JWT (Json Web Token)
@@ -26,6 +24,7 @@ INSTALLED_APPS = [
 	'django.contrib.sessions',
 	'django.contrib.messages',
 	'django.contrib.staticfiles',
+	'django.contrib.postgres', # Full-text and trigram search
 
 	# Local apps
 	'apps.common',
@@ -37,11 +36,14 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'users.User'
 
 MIDDLEWARE = [
+	'apps.common.metrics.metrics_middleware',
 	'django.middleware.security.SecurityMiddleware',
 	'django.contrib.sessions.middleware.SessionMiddleware',
 	'django.middleware.common.CommonMiddleware',
 	'django.middleware.csrf.CsrfViewMiddleware',
 	'django.contrib.auth.middleware.AuthenticationMiddleware',
+	'apps.tasks.activity.activity_middleware',
+	'apps.common.replicas.replica_middleware',
 	'django.contrib.messages.middleware.MessageMiddleware',
 	'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -50,7 +52,8 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
 	{
-		'BACKEND': 'django.template.backends.django.DjangoTemplates',
+		# DjangoTemplates timing the render phase, see apps/common/metrics.py
+		'BACKEND': 'apps.common.metrics.TimedDjangoTemplates',
 		'DIRS': [
 			BASE_DIR / 'apps' / 'common' / 'templates',
 			BASE_DIR / 'apps' / 'auth_jwt' / 'templates',
@@ -68,6 +71,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+# Task list/detail/assign serve GET and POST from async handlers under ASGI
+# (apps/common/async_api.py), 0 serves them with the sync DRF views
+ASYNC_API_VIEWS = os.environ.get('ASYNC_API_VIEWS', '1') == '1'
 
 DATABASES = {
 	'default': {
@@ -80,6 +86,55 @@ DATABASES = {
 	}
 }
 
+# Read replicas (apps/common/replicas.py): comma separated host or host:port of
+# standbys of the primary, same credentials. POSTGRES_REPLICA_DB is their
+# database name, the primary's by default. Pointed at a copy of the database
+# on the same server it stands in for a replica locally
+for index, replica in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), start=1):
+	host, _, port = replica.strip().partition(':')
+	DATABASES[f'replica{index}'] = dict(
+		DATABASES['default'],
+		HOST=host,
+		PORT=port or DATABASES['default']['PORT'],
+		NAME=os.environ.get('POSTGRES_REPLICA_DB', DATABASES['default']['NAME']),
+		# Fail over to the primary quickly
+		OPTIONS={'connect_timeout': 2},
+		TEST={'MIRROR': 'default'},
+	)
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['apps.common.replicas.ReplicaRouter']
+# Users read from the primary this long after a write
+DATABASE_STICKY_SECONDS = int(os.environ.get('DATABASE_STICKY_SECONDS', 10))
+# Replicas further behind are skipped, checked every DATABASE_REPLICA_CHECK_SECONDS
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get('DATABASE_REPLICA_MAX_LAG', 5))
+DATABASE_REPLICA_CHECK_SECONDS = float(os.environ.get('DATABASE_REPLICA_CHECK_SECONDS', 5))
+
+CACHES = {
+	'default': {
+		'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+		'LOCATION': os.environ.get('CACHE_URL', 'redis://redis:6379/1'),
+	},
+	# Validated HTML session tokens (see apps/auth_jwt/services.py), in Redis so
+	# a logout in one worker is seen by all of them
+	'auth_tokens': {
+		'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+		'LOCATION': os.environ.get('CACHE_URL', 'redis://redis:6379/1'),
+		'KEY_PREFIX': 'auth-tokens',
+		'TIMEOUT': int(os.environ.get('AUTH_TOKEN_CACHE_TIMEOUT', 30)),
+	},
+}
+
+# Seconds a task list/detail response stays cached (apps/tasks/cache.py), 0 disables it
+TASK_CACHE_TIMEOUT = int(os.environ.get('TASK_CACHE_TIMEOUT', 60))
+# Redis for the task events pub/sub (any database number works for pub/sub)
+TASK_EVENTS_URL = os.environ.get('TASK_EVENTS_URL', os.environ.get('CACHE_URL', 'redis://redis:6379/1'))
+# Task activity log (apps/tasks/activity.py): the Redis the entries are
+# buffered in until flushed, and how long a request waits for it before
+# writing its entries to the database itself
+TASK_ACTIVITY_ENABLED = os.environ.get('TASK_ACTIVITY_ENABLED', '1') == '1'
+TASK_ACTIVITY_URL = os.environ.get('TASK_ACTIVITY_URL', TASK_EVENTS_URL)
+TASK_ACTIVITY_PUSH_TIMEOUT = float(os.environ.get('TASK_ACTIVITY_PUSH_TIMEOUT', 0.05))
+
 AUTH_PASSWORD_VALIDATORS = [
 	{
 		'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -119,9 +174,23 @@ REST_FRAMEWORK = {
 	),
 	'DEFAULT_PERMISSION_CLASSES': (
 		'rest_framework.permissions.IsAuthenticated',
-	)
+	),
+	'DEFAULT_RENDERER_CLASSES': (
+		'apps.common.metrics.TimedJSONRenderer',
+		'rest_framework.renderers.BrowsableAPIRenderer',
+	),
 }
 
+# Request instrumentation (apps/common/metrics.py): Server-Timing headers,
+# Prometheus histograms on /metrics (staff JWT, or bearer METRICS_TOKEN for
+# the scraper) and a log line for requests slower than METRICS_SLOW_REQUEST_MS,
+# listing statements run METRICS_DUPLICATE_QUERIES times or more
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', '1') == '1'
+METRICS_SLOW_REQUEST_MS = int(os.environ.get('METRICS_SLOW_REQUEST_MS', 500))
+METRICS_DUPLICATE_QUERIES = int(os.environ.get('METRICS_DUPLICATE_QUERIES', 5))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
 
@@ -129,13 +198,55 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 
+# /api/tasks/stats/ is at most this old (plus the refresh time). Every refresh
+# recomputes the whole view over tasks, assignments and tags, 5 minutes keeps
+# that off a busy primary; dashboards show as_of
+TASK_STATS_REFRESH_SECONDS = int(os.environ.get('TASK_STATS_REFRESH_SECONDS', 300))
+# How long deletions are kept for /api/tasks/changes, older sync tokens get a 410
+TASK_SYNC_TOMBSTONE_DAYS = int(os.environ.get('TASK_SYNC_TOMBSTONE_DAYS', 30))
+# Activity is in /api/tasks/<id>/activity/ at most this late. Whole months
+# older than the retention are dropped, 0 keeps them all
+TASK_ACTIVITY_FLUSH_SECONDS = int(os.environ.get('TASK_ACTIVITY_FLUSH_SECONDS', 5))
+TASK_ACTIVITY_RETENTION_MONTHS = int(os.environ.get('TASK_ACTIVITY_RETENTION_MONTHS', 24))
+# Completed and archived tasks untouched for this long move to the archive
+# tables. Archived ones are purged from there by cleanup-archived-daily after 30
+TASK_ARCHIVE_AFTER_DAYS = int(os.environ.get('TASK_ARCHIVE_AFTER_DAYS', 14))
+
 CELERY_BEAT_SCHEDULE = {
     "check-overdue-every-1-min": {
         "task": "apps.tasks.tasks.check_overdue_tasks",
         "schedule": 60,
     },
+    # Catches tasks saved with a due date already behind the high-water mark
+    "check-overdue-full-daily": {
+        "task": "apps.tasks.tasks.check_overdue_tasks",
+        "schedule": crontab(hour=3, minute=0),
+        "kwargs": {"full": True},
+    },
+    "refresh-task-stats": {
+        "task": "apps.tasks.tasks.refresh_task_stats",
+        "schedule": TASK_STATS_REFRESH_SECONDS,
+    },
+    # Before the purge, which only reads the archive
+    "archive-tasks-daily": {
+        "task": "apps.tasks.tasks.archive_tasks",
+        "schedule": crontab(hour=2, minute=30),
+    },
     "cleanup-archived-daily": {
         "task": "apps.tasks.tasks.cleanup_archived_tasks",
         "schedule": crontab(hour=8, minute=30),
     },
+    "cleanup-sync-tombstones-daily": {
+        "task": "apps.tasks.tasks.cleanup_sync_tombstones",
+        "schedule": crontab(hour=4, minute=0),
+    },
+    "flush-task-activity": {
+        "task": "apps.tasks.tasks.flush_task_activity",
+        "schedule": TASK_ACTIVITY_FLUSH_SECONDS,
+    },
+    # Also makes next month's partition
+    "cleanup-task-activity-daily": {
+        "task": "apps.tasks.tasks.cleanup_task_activity",
+        "schedule": crontab(hour=4, minute=30),
+    },
 }
\ No newline at end of file
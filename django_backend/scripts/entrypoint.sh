@@ -38,4 +38,9 @@ END
 fi
 
 echo "Starting server..."
-python manage.py runserver 0.0.0.0:8000
+# ASGI, so /api/tasks/events streams don't each hold a worker thread.
+# Reloading on code changes is for development only (UVICORN_RELOAD=1 in .env)
+if [ "$UVICORN_RELOAD" = "1" ]; then
+	exec uvicorn config.asgi:application --host 0.0.0.0 --port 8000 --reload
+fi
+exec uvicorn config.asgi:application --host 0.0.0.0 --port 8000